@@ -3,6 +3,9 @@ ASGI config for config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+SSE-потоки живых счетчиков (QUOTES_LIVE_UPDATES) работают только через это
+приложение: они держат соединение открытым и ждут событий в цикле asyncio.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
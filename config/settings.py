@@ -42,6 +42,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "quotes.middleware.QueryMetricsMiddleware",
+    "quotes.middleware.ReplicaPinMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -78,9 +80,76 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        # Постоянные подключения вместо нового на каждый запрос.
+        "CONN_MAX_AGE": config("DB_CONN_MAX_AGE", default=60, cast=int),
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {
+            # BEGIN IMMEDIATE сразу берет блокировку на запись, поэтому
+            # транзакция ждет busy_timeout, а не падает при попытке записи.
+            "transaction_mode": config("SQLITE_TRANSACTION_MODE", default="IMMEDIATE"),
+        },
     }
 }
 
+# Прагмы, которые выполняются при каждом подключении к SQLite
+# (quotes.signals.configure_sqlite). WAL позволяет читать во время записи,
+# busy_timeout (мс) - ждать блокировку вместо ошибки "database is locked".
+# SQLITE_TUNING=False оставляет настройки SQLite по умолчанию.
+SQLITE_PRAGMAS = (
+    {
+        "journal_mode": config("SQLITE_JOURNAL_MODE", default="wal"),
+        "synchronous": config("SQLITE_SYNCHRONOUS", default="normal"),
+        "busy_timeout": config("SQLITE_BUSY_TIMEOUT", default=5000, cast=int),
+        "mmap_size": config("SQLITE_MMAP_SIZE", default=256 * 1024 * 1024, cast=int),
+        "cache_size": config("SQLITE_CACHE_SIZE", default=-64000, cast=int),
+    }
+    if config("SQLITE_TUNING", default=True, cast=bool)
+    else {}
+)
+
+# Реплика для чтения: путь к копии основной SQLite-базы, которую обновляет
+# репликация (для локальной проверки достаточно скопировать db.sqlite3).
+# Чтения моделей quotes идут на нее, записи - на default; после изменяющего
+# запроса чтения клиента DB_REPLICA_PIN_SECONDS секунд идут на основную БД.
+DB_REPLICA_NAME = config("DB_REPLICA_NAME", default="")
+DB_REPLICA_PIN_SECONDS = config("DB_REPLICA_PIN_SECONDS", default=5, cast=int)
+if DB_REPLICA_NAME:
+    DATABASES["replica"] = {
+        **DATABASES["default"],
+        "NAME": DB_REPLICA_NAME,
+        "TEST": {"MIRROR": "default"},
+    }
+DATABASE_ROUTERS = ["quotes.routers.ReplicaRouter"]
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+# "locmem" - LRU-кэш в памяти процесса, "file" - общий для процессов кэш в
+# каталоге CACHE_LOCATION.
+CACHE_BACKEND = config("CACHE_BACKEND", default="locmem")
+
+if CACHE_BACKEND == "file":
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": config("CACHE_LOCATION", default=str(BASE_DIR / "cache")),
+            "OPTIONS": {
+                "MAX_ENTRIES": config("CACHE_MAX_ENTRIES", default=10000, cast=int)
+            },
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "quotes",
+            "OPTIONS": {
+                "MAX_ENTRIES": config("CACHE_MAX_ENTRIES", default=10000, cast=int)
+            },
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -128,3 +197,123 @@ STATICFILES_DIRS = [
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+
+# Настройки приложения quotes
+
+# Через сколько секунд таблица весов для случайной выдачи перечитывается из БД,
+# даже если в этом процессе не было изменений (0 - только по сигналам).
+QUOTES_SAMPLER_TTL = config("QUOTES_SAMPLER_TTL", default=300, cast=int)
+
+# Буфер просмотров: инкременты копятся в памяти и записываются в БД одним
+# UPDATE не реже чем раз в QUOTES_VIEW_FLUSH_INTERVAL секунд (на столько может
+# отставать дашборд) или при накоплении QUOTES_VIEW_FLUSH_SIZE просмотров.
+# QUOTES_VIEW_SPOOL - путь к файлу, в котором просмотры переживают перезапуск.
+QUOTES_VIEW_FLUSH_INTERVAL = config("QUOTES_VIEW_FLUSH_INTERVAL", default=5, cast=int)
+QUOTES_VIEW_FLUSH_SIZE = config("QUOTES_VIEW_FLUSH_SIZE", default=100, cast=int)
+QUOTES_VIEW_SPOOL = config("QUOTES_VIEW_SPOOL", default="")
+
+# Сколько цитат хранится в каждом топе снимка дашборда.
+QUOTES_DASHBOARD_TOP_SIZE = config("QUOTES_DASHBOARD_TOP_SIZE", default=100, cast=int)
+
+# Пагинация топов дашборда: "snapshot" - по спискам из снимка (не глубже
+# QUOTES_DASHBOARD_TOP_SIZE), "keyset" - курсором по индексам без OFFSET.
+QUOTES_DASHBOARD_PAGINATION = config("QUOTES_DASHBOARD_PAGINATION", default="snapshot")
+
+# Время жизни (в секундах) закэшированной карточки цитаты и страниц дашборда.
+# Карточка сбрасывается при голосе и редактировании, 0 отключает кэш.
+QUOTES_CARD_CACHE_TTL = config("QUOTES_CARD_CACHE_TTL", default=60, cast=int)
+QUOTES_DASHBOARD_CACHE_TTL = config("QUOTES_DASHBOARD_CACHE_TTL", default=10, cast=int)
+
+# "sync" - обычные view, "async" - нативные async-view для запуска под ASGI
+# (uvicorn, daphne) без перехода в поток на каждый запрос.
+QUOTES_VIEWS_MODE = config("QUOTES_VIEWS_MODE", default="sync")
+
+# Заголовок Server-Timing с временем в БД и числом запросов в каждом ответе.
+QUOTES_SERVER_TIMING = config("QUOTES_SERVER_TIMING", default=True, cast=bool)
+
+# Защита голосований: с одного клиента не больше QUOTES_VOTE_BURST голосов
+# подряд и QUOTES_VOTE_RATE голосов в секунду (0 - без ограничения), и один
+# голос за цитату в течение QUOTES_VOTE_DEDUP_WINDOW секунд (0 - без проверки).
+# QUOTES_VOTE_DEDUP_CAPACITY - ожидаемое число голосов за окно, по нему
+# выбирается размер фильтра Блума. "memory" - состояние в памяти воркера,
+# "cache" - общее для процессов через кэш Django.
+QUOTES_VOTE_GUARD_BACKEND = config("QUOTES_VOTE_GUARD_BACKEND", default="memory")
+QUOTES_VOTE_RATE = config("QUOTES_VOTE_RATE", default=1.0, cast=float)
+QUOTES_VOTE_BURST = config("QUOTES_VOTE_BURST", default=10, cast=int)
+QUOTES_VOTE_DEDUP_WINDOW = config("QUOTES_VOTE_DEDUP_WINDOW", default=86400, cast=int)
+QUOTES_VOTE_DEDUP_CAPACITY = config(
+    "QUOTES_VOTE_DEDUP_CAPACITY", default=100000, cast=int
+)
+# Заголовок с IP клиента от доверенного прокси (например,
+# HTTP_X_FORWARDED_FOR или HTTP_X_REAL_IP), пусто - REMOTE_ADDR. Задавайте,
+# только если приложение доступно исключительно через этот прокси.
+QUOTES_CLIENT_IP_HEADER = config("QUOTES_CLIENT_IP_HEADER", default="")
+
+# Хранение счетчиков: "row" - прямо в строке цитаты, "sharded" - приросты
+# распределяются по QUOTES_COUNTER_SHARDS строкам QuoteCounterShard, чтобы
+# популярная цитата не становилась горячей строкой. Шарды сворачиваются в
+# Quote командой compact_counters (например, раз в минуту по cron).
+QUOTES_COUNTER_MODE = config("QUOTES_COUNTER_MODE", default="row")
+QUOTES_COUNTER_SHARDS = config("QUOTES_COUNTER_SHARDS", default=8, cast=int)
+
+# История вовлеченности для раздела "В тренде": голоса копятся в памяти и
+# записываются в почасовые сводки (лайки - и в снимок дашборда) не реже чем
+# раз в QUOTES_ENGAGEMENT_FLUSH_INTERVAL секунд или при накоплении
+# QUOTES_ENGAGEMENT_FLUSH_SIZE голосов (просмотры - вместе с буфером
+# просмотров). Команда rollup_engagement сворачивает почасовые сводки старше
+# QUOTES_ENGAGEMENT_HOURLY_RETENTION часов в дневные и удаляет дневные старше
+# QUOTES_ENGAGEMENT_DAILY_RETENTION дней. Очки тренда затухают вдвое за
+# QUOTES_TRENDING_HALF_LIFE часов.
+QUOTES_ENGAGEMENT_FLUSH_INTERVAL = config(
+    "QUOTES_ENGAGEMENT_FLUSH_INTERVAL", default=5, cast=int
+)
+QUOTES_ENGAGEMENT_FLUSH_SIZE = config(
+    "QUOTES_ENGAGEMENT_FLUSH_SIZE", default=100, cast=int
+)
+QUOTES_ENGAGEMENT_HOURLY_RETENTION = config(
+    "QUOTES_ENGAGEMENT_HOURLY_RETENTION", default=48, cast=int
+)
+QUOTES_ENGAGEMENT_DAILY_RETENTION = config(
+    "QUOTES_ENGAGEMENT_DAILY_RETENTION", default=90, cast=int
+)
+QUOTES_TRENDING_HALF_LIFE = config("QUOTES_TRENDING_HALF_LIFE", default=6, cast=float)
+
+# Детерминированная выборка случайной цитаты: с параметром ?seed= одно и то
+# же зерно дает одну и ту же цитату, пока не изменятся веса, и ответ можно
+# кэшировать QUOTES_SEEDED_CACHE_TTL секунд. QUOTES_DEFAULT_SEED = "hour" или
+# "day" делает зерном запросов без seed текущий час или день ("цитата дня"),
+# пустое значение оставляет обычную случайную выборку.
+QUOTES_SEEDED_CACHE_TTL = config("QUOTES_SEEDED_CACHE_TTL", default=86400, cast=int)
+QUOTES_DEFAULT_SEED = config("QUOTES_DEFAULT_SEED", default="")
+
+# Запись голосов: "sync" - в БД прямо в запросе, "journal" - write-behind:
+# голос дописывается в журнал процесса в QUOTES_VOTE_JOURNAL_DIR (с fsync при
+# QUOTES_VOTE_JOURNAL_FSYNC), а в БД его переносит фоновый поток раз в
+# QUOTES_VOTE_FLUSH_INTERVAL секунд или команда drain_votes. При 0 поток не
+# запускается и журналы переносит только drain_votes (например, по cron).
+QUOTES_VOTE_MODE = config("QUOTES_VOTE_MODE", default="sync")
+QUOTES_VOTE_JOURNAL_DIR = config(
+    "QUOTES_VOTE_JOURNAL_DIR", default=str(BASE_DIR / "vote_journal")
+)
+QUOTES_VOTE_JOURNAL_FSYNC = config("QUOTES_VOTE_JOURNAL_FSYNC", default=True, cast=bool)
+QUOTES_VOTE_FLUSH_INTERVAL = config("QUOTES_VOTE_FLUSH_INTERVAL", default=1, cast=float)
+
+# Живые счетчики по SSE (/live/quote/<id>/, /live/stats/) - включать только
+# под ASGI: под WSGI каждый открытый поток занимал бы рабочий поток сервера.
+# Голоса заставляют перечитать тему не чаще QUOTES_LIVE_MAX_RATE раз в секунду
+# (одно чтение на все вкладки процесса), без голосов тема перечитывается раз в
+# QUOTES_LIVE_POLL_INTERVAL секунд. Поток закрывается через
+# QUOTES_LIVE_STREAM_TIMEOUT секунд, и браузер переподключается сам.
+QUOTES_LIVE_UPDATES = config("QUOTES_LIVE_UPDATES", default=False, cast=bool)
+QUOTES_LIVE_MAX_RATE = config("QUOTES_LIVE_MAX_RATE", default=2, cast=float)
+QUOTES_LIVE_POLL_INTERVAL = config("QUOTES_LIVE_POLL_INTERVAL", default=15, cast=float)
+QUOTES_LIVE_STREAM_TIMEOUT = config(
+    "QUOTES_LIVE_STREAM_TIMEOUT", default=300, cast=float
+)
+
+# Каталог статических копий страниц (команда prerender) для раздачи через
+# CDN или nginx с gzip_static.
+QUOTES_PRERENDER_DIR = config(
+    "QUOTES_PRERENDER_DIR", default=str(BASE_DIR / "prerendered")
+)
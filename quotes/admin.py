@@ -1,19 +1,55 @@
 from django.contrib import admin
-from .models import Source, Quote
+from django.db.models import Count
+
+from .models import COUNTER_FIELDS, Source, Quote
+from .search import filter_quotes
+
+# Сколько источников показывать в боковом фильтре списка цитат.
+SOURCE_FILTER_LIMIT = 20
 
 
 @admin.register(Source)
 class SourceAdmin(admin.ModelAdmin):
     """Отображение Source в админ-панели."""
 
-    list_display = ("name", "quote_count")
+    list_display = ("name", "kind", "quote_count")
+    list_filter = ("kind",)
     search_fields = ("name",)
 
+    def get_queryset(self, request):
+        # Количество цитат считается одним запросом на всю страницу.
+        return super().get_queryset(request).annotate(quote_count=Count("quotes"))
+
     def quote_count(self, obj):
         """Поле для отображения количества цитат у источника."""
-        return obj.quotes.count()
+        return obj.quote_count
 
     quote_count.short_description = "Количество цитат"
+    quote_count.admin_order_field = "quote_count"
+
+
+class SourceFilter(admin.SimpleListFilter):
+    """
+    Фильтр по источнику без загрузки всех источников: в боковой панели
+    первые SOURCE_FILTER_LIMIT по названию и выбранный. Остальные
+    находятся поиском - он ищет и по названию источника.
+    """
+
+    title = "Источник"
+    parameter_name = "source"
+
+    def lookups(self, request, model_admin):
+        sources = list(Source.objects.order_by("name")[:SOURCE_FILTER_LIMIT])
+        value = self.value()
+        if value and value.isdigit() and all(str(s.pk) != value for s in sources):
+            sources += Source.objects.filter(pk=value)
+        return [(str(source.pk), source.name) for source in sources]
+
+    def queryset(self, request, queryset):
+        value = self.value()
+        if value:
+            return queryset.filter(source_id=value if value.isdigit() else None)
+        return queryset
 
 
 @admin.register(Quote)
@@ -29,22 +65,52 @@ class QuoteAdmin(admin.ModelAdmin):
         "views",
         "created_at",
     )
-    list_filter = ("source", "created_at")
+    list_filter = (SourceFilter, "source__kind", "created_at")
+    list_select_related = ("source",)
     search_fields = ("text", "source__name")
+    autocomplete_fields = ("source",)
+    # Без полного COUNT(*) по таблице при поиске и фильтрах.
+    show_full_result_count = False
 
-    readonly_fields = ("likes", "dislikes", "views", "created_at")
+    readonly_fields = ("likes", "dislikes", "views", "created_at", "updated_at")
 
     fieldsets = (
         (None, {"fields": ("text", "source", "weight")}),
         (
             "Статистика (нередактируемо)",
             {
-                "fields": ("likes", "dislikes", "views", "created_at"),
+                "fields": ("likes", "dislikes", "views", "created_at", "updated_at"),
                 "classes": ("collapse",),
             },
         ),
     )
 
+    def get_queryset(self, request):
+        # В режиме sharded счетчики показываются вместе с шардами.
+        return super().get_queryset(request).with_counters()
+
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск по полнотекстовому индексу вместо LIKE '%...%'."""
+        if not search_term.strip():
+            return queryset, False
+        return filter_quotes(queryset, search_term), False
+
+    def save_model(self, request, obj, form, change):
+        """
+        Счетчики не сохраняются из формы: их меняют голоса и просмотры
+        параллельно с редактированием, а в режиме sharded в ``obj`` уже
+        прибавлены шарды.
+        """
+        if not change:
+            return super().save_model(request, obj, form, change)
+        obj.save(
+            update_fields=[
+                field.name
+                for field in obj._meta.concrete_fields
+                if not field.primary_key and field.name not in COUNTER_FIELDS
+            ]
+        )
+
     def short_text(self, obj):
         """Укороченный текст цитаты."""
         return f"{obj.text[:75]}..." if len(obj.text) > 75 else obj.text
@@ -0,0 +1,280 @@
+import hashlib
+
+from django.core.paginator import Paginator
+from django.db.models import F
+from django.http import Http404, JsonResponse
+from django.utils.cache import patch_cache_control
+from django.utils.http import http_date
+from django.views.decorators.http import condition, require_safe
+
+from .counters import view_counter
+from .models import COUNTER_FIELDS, Quote, Source, counter_expression
+from .pagination import KeysetPaginator
+from .sampling import quote_sampler, request_seed
+from .search import search_quotes, search_term
+from .snapshot import get_snapshot
+from .views import RANDOM_QUOTE_ATTEMPTS
+
+API_PAGE_SIZE = 20
+MAX_BATCH_SIZE = 100
+TOP_FIELDS = ("likes", "views")
+
+
+def _json(data, status=200):
+    return JsonResponse(data, status=status, json_dumps_params={"ensure_ascii": False})
+
+
+def _digest(*parts):
+    return hashlib.sha1(
+        "|".join(map(str, parts)).encode(), usedforsecurity=False
+    ).hexdigest()
+
+
+def serialize_quote(quote):
+    return {
+        "id": quote.id,
+        "text": quote.text,
+        "source": quote.source.name,
+        "likes": quote.likes,
+        "dislikes": quote.dislikes,
+        "views": quote.views,
+        "created_at": quote.created_at.isoformat(),
+    }
+
+
+def _quote_version(request, quote_id):
+    """
+    Дата изменения, счетчики и название источника цитаты - все, что нужно
+    для ETag и Last-Modified, без чтения текста. Запоминается на запросе,
+    чтобы не читать строку дважды.
+    """
+    if not hasattr(request, "_quote_version"):
+        request._quote_version = (
+            Quote.objects.filter(pk=quote_id)
+            .annotate(
+                **{
+                    f"{field}_total": counter_expression(field)
+                    for field in COUNTER_FIELDS
+                }
+            )
+            .values_list(
+                "updated_at",
+                *(f"{field}_total" for field in COUNTER_FIELDS),
+                "source__name",
+            )
+            .first()
+        )
+    return request._quote_version
+
+
+def _quote_etag(request, quote_id):
+    version = _quote_version(request, quote_id)
+    return _digest("quote", quote_id, *version) if version else None
+
+
+def _quote_validators(quote):
+    """ETag и Last-Modified, совпадающие с валидаторами ``quote_detail_api``."""
+    version = [
+        quote.updated_at,
+        *(getattr(quote, field) for field in COUNTER_FIELDS),
+        quote.source.name,
+    ]
+    return {
+        "ETag": f'"{_digest("quote", quote.id, *version)}"',
+        "Last-Modified": http_date(quote.updated_at.timestamp()),
+    }
+
+
+def _quote_last_modified(request, quote_id):
+    version = _quote_version(request, quote_id)
+    return version[0] if version else None
+
+
+def _request_snapshot(request):
+    if not hasattr(request, "_dashboard_snapshot"):
+        request._dashboard_snapshot = get_snapshot()
+    return request._dashboard_snapshot
+
+
+def _snapshot_etag(request, **kwargs):
+    snapshot = _request_snapshot(request)
+    return _digest("snapshot", snapshot.version, request.get_full_path())
+
+
+def _snapshot_last_modified(request, **kwargs):
+    return _request_snapshot(request).updated_at
+
+
+@require_safe
+def random_quote_api(request, source_id=None, kind=None):
+    """
+    Случайная цитата с учетом веса, в том числе из одного источника или
+    источников одного типа. Каждый ответ несет ETag выпавшей цитаты, но
+    кэшировать его нельзя (Cache-Control: no-cache) - кроме выборки с
+    зерном (``request_seed``), которая детерминирована.
+    """
+    if kind is not None and kind not in dict(Source.KIND_CHOICES):
+        raise Http404("Unknown source kind")
+    seed, max_age = request_seed(request)
+    quote = None
+    for _ in range(RANDOM_QUOTE_ATTEMPTS):
+        quote_id = quote_sampler.draw(source=source_id, kind=kind, seed=seed)
+        if quote_id is None:
+            break
+        quote = (
+            Quote.objects.select_related("source")
+            .with_counters()
+            .filter(pk=quote_id)
+            .first()
+        )
+        if quote is not None:
+            break
+        # Цитату удалили в другом процессе - перечитываем таблицу весов.
+        quote_sampler.invalidate()
+    if quote is None:
+        return _json({"detail": "Подходящих цитат нет."}, status=404)
+    view_counter.record(quote.id)
+    response = _json(serialize_quote(quote))
+    for header, value in _quote_validators(quote).items():
+        response[header] = value
+    if seed is None:
+        response["Cache-Control"] = "no-cache"
+    else:
+        patch_cache_control(response, public=True, max_age=max_age)
+    return response
+
+
+@require_safe
+def random_quotes_batch_api(request):
+    """
+    ``k`` случайных цитат с учетом веса за один запрос (?k=20&replace=0).
+    По умолчанию цитаты не повторяются; просмотры всех выпавших цитат
+    записываются одним групповым UPDATE.
+    """
+    try:
+        k = int(request.GET.get("k", 10))
+    except ValueError:
+        return _json({"detail": "Параметр k должен быть числом."}, status=400)
+    k = max(1, min(k, MAX_BATCH_SIZE))
+    replace = request.GET.get("replace", "0").lower() in ("1", "true", "yes")
+
+    quote_ids = quote_sampler.sample(k, replace=replace)
+    quotes = (
+        Quote.objects.select_related("source").with_counters().in_bulk(set(quote_ids))
+    )
+    if len(quotes) < len(set(quote_ids)):
+        # Часть цитат удалили в другом процессе.
+        quote_sampler.invalidate()
+    drawn = [quotes[quote_id] for quote_id in quote_ids if quote_id in quotes]
+    view_counter.record_many(quote.id for quote in drawn)
+
+    response = _json({"results": [serialize_quote(quote) for quote in drawn]})
+    response["Cache-Control"] = "no-cache"
+    return response
+
+
+@require_safe
+@condition(etag_func=_quote_etag, last_modified_func=_quote_last_modified)
+def quote_detail_api(request, quote_id):
+    """Цитата по id. При совпадении ETag отвечает 304 после одного легкого запроса."""
+    quote = (
+        Quote.objects.select_related("source")
+        .with_counters()
+        .filter(pk=quote_id)
+        .first()
+    )
+    if quote is None:
+        raise Http404("Quote not found")
+    return _json(serialize_quote(quote))
+
+
+def _top_page(request, field):
+    """Страница топа; запоминается на запросе для ETag и ответа."""
+    if field not in TOP_FIELDS:
+        raise Http404("Unknown top")
+    if not hasattr(request, "_top_page"):
+        paginator = KeysetPaginator(
+            Quote.objects.select_related("source")
+            .filter(**{f"{field}__gt": 0})
+            .annotate(cursor_value=F(field))
+            .with_counters(),
+            field,
+            API_PAGE_SIZE,
+            value_attr="cursor_value",
+        )
+        request._top_page = paginator.page(request.GET.get("cursor"))
+    return request._top_page
+
+
+def _top_etag(request, field):
+    page = _top_page(request, field)
+    rows = [
+        (
+            quote.id,
+            quote.updated_at,
+            *(getattr(quote, name) for name in COUNTER_FIELDS),
+            quote.source.name,
+        )
+        for quote in page
+    ]
+    return _digest(
+        "top", request.get_full_path(), page.has_next(), page.has_previous(), *rows
+    )
+
+
+@require_safe
+@condition(etag_func=_top_etag)
+def top_quotes_api(request, field):
+    """
+    Топ цитат по лайкам или просмотрам с keyset-пагинацией (?cursor=...).
+    ETag строится по строкам страницы (id, дата изменения и счетчики), так
+    что голос или просмотр цитаты со страницы меняет его сразу; 304
+    экономит сериализацию и передачу, но не чтение страницы.
+
+    Счетчики в ответе полные, как в ``quote_detail_api``. Порядок и курсор
+    строятся по колонкам Quote (по индексу), поэтому в режиме sharded
+    порядок отстает до ``compact_counters``, как и на дашборде.
+    """
+    page = _top_page(request, field)
+    return _json(
+        {
+            "results": [serialize_quote(quote) for quote in page],
+            "next": page.next_page_number() if page.has_next() else None,
+            "previous": page.previous_page_number() if page.has_previous() else None,
+        }
+    )
+
+
+@require_safe
+def search_api(request):
+    """Поиск цитат (?q=...&page=N), по убыванию релевантности."""
+    query = search_term(request)
+    if not query:
+        return _json({"detail": "Параметр q обязателен."}, status=400)
+    page = Paginator(search_quotes(query), API_PAGE_SIZE).get_page(
+        request.GET.get("page")
+    )
+    return _json(
+        {
+            "count": page.paginator.count,
+            "results": [serialize_quote(quote) for quote in page],
+            "next": page.next_page_number() if page.has_next() else None,
+            "previous": page.previous_page_number() if page.has_previous() else None,
+        }
+    )
+
+
+@require_safe
+@condition(etag_func=_snapshot_etag, last_modified_func=_snapshot_last_modified)
+def stats_api(request):
+    """KPI из снимка дашборда."""
+    snapshot = _request_snapshot(request)
+    return _json(
+        {
+            "total_quotes": snapshot.total_quotes,
+            "total_sources": snapshot.total_sources,
+            "total_likes": snapshot.total_likes,
+            "total_views": snapshot.total_views,
+            "updated_at": snapshot.updated_at.isoformat(),
+        }
+    )
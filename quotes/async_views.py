@@ -0,0 +1,201 @@
+"""
+Асинхронные версии view приложения quotes для запуска под ASGI.
+
+Подключаются в ``quotes/urls.py`` при QUOTES_VIEWS_MODE = "async".
+Чтения идут через асинхронный ORM; операции, которым нужны транзакции
+или сырой курсор (голос с RETURNING, обновление снимка дашборда, сброс
+буфера просмотров), выполняются через ``sync_to_async``.
+"""
+
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404, HttpResponse, JsonResponse
+from django.shortcuts import render
+from django.template.loader import render_to_string
+from django.utils.cache import patch_cache_control
+from django.utils.safestring import mark_safe
+from django.views.decorators.csrf import ensure_csrf_cookie
+from django.views.decorators.http import require_POST, require_safe
+
+from .cache import ainvalidate_quote_cards, fragment_cache, quote_card_key
+from .counters import view_counter
+from .engagement import atrending, engagement_buffer
+from .live import live_hub, load_quote_counts, load_stats, quote_topic, STATS_TOPIC
+from .models import Quote
+from .sampling import quote_sampler, request_seed
+from .snapshot import aget_snapshot
+from .throttling import vote_guard
+from .votes import votes_journaled
+from .views import (
+    RANDOM_QUOTE_ATTEMPTS,
+    SOURCE_KINDS,
+    TRENDING_SIZE,
+    _build_dashboard_context,
+    _journaled_vote,
+    _keyset_paginators,
+    _resolve_pages,
+    _snapshot_pages,
+    dashboard_cache_key,
+)
+
+
+async def _arender_quote_card(quote_id):
+    quote = (
+        await Quote.objects.select_related("source")
+        .with_counters()
+        .filter(pk=quote_id)
+        .afirst()
+    )
+    if quote is None:
+        return None
+    html = render_to_string("quotes/includes/quote_card.html", {"quote": quote})
+    return {"quote": quote, "html": html}
+
+
+@ensure_csrf_cookie
+async def random_quote_view(request, source_id=None, kind=None):
+    """
+    View для отображения случайной цитаты с учетом веса, в том числе из
+    одного источника или источников одного типа.
+    """
+    if kind is not None and kind not in SOURCE_KINDS:
+        raise Http404("Unknown source kind")
+    seed, max_age = request_seed(request)
+    card = views = None
+    for _ in range(RANDOM_QUOTE_ATTEMPTS):
+        random_quote_id = await quote_sampler.adraw(
+            source=source_id, kind=kind, seed=seed
+        )
+        if random_quote_id is None:
+            break
+        card = await fragment_cache.aget_or_set(
+            quote_card_key(random_quote_id),
+            lambda quote_id=random_quote_id: _arender_quote_card(quote_id),
+            settings.QUOTES_CARD_CACHE_TTL,
+        )
+        if card is not None:
+            views = card["quote"].views + view_counter.pending(random_quote_id) + 1
+            await sync_to_async(view_counter.record)(random_quote_id)
+            break
+        quote_sampler.invalidate()
+
+    context = {
+        "quote": card["quote"] if card else None,
+        "quote_card": mark_safe(card["html"]) if card else "",
+        "views": views,
+        "live_updates": settings.QUOTES_LIVE_UPDATES,
+        "filtered": source_id is not None or kind is not None,
+    }
+    response = render(request, "quotes/random_quote.html", context)
+    if seed is not None:
+        # Только кэш браузера: страница ставит CSRF-cookie и несет счетчики.
+        patch_cache_control(response, private=True, max_age=max_age)
+    return response
+
+
+async def _vote(request, quote_id, field):
+    rejected = await sync_to_async(vote_guard.check)(request, quote_id)
+    if rejected is not None:
+        return rejected
+    if votes_journaled():
+        return await sync_to_async(_journaled_vote)(request, quote_id, field)
+    updated_quote = await Quote.objects.filter(pk=quote_id).aincrement(**{field: 1})
+
+    if updated_quote is None:
+        raise Http404("Quote not found")
+    await sync_to_async(engagement_buffer.record)(updated_quote.id, field)
+    await sync_to_async(vote_guard.record)(request, quote_id)
+    await ainvalidate_quote_cards([updated_quote.id])
+    live_hub.notify_quotes([updated_quote.id])
+
+    return JsonResponse(
+        {"likes": updated_quote.likes, "dislikes": updated_quote.dislikes}
+    )
+
+
+@require_POST
+async def like_quote(request, quote_id):
+    """Обработка лайка."""
+    return await _vote(request, quote_id, "likes")
+
+
+@require_POST
+async def dislike_quote(request, quote_id):
+    """Обработка дизлайка."""
+    return await _vote(request, quote_id, "dislikes")
+
+
+async def _dashboard_context(page_likes_num, page_views_num):
+    """
+    Контекст дашборда. Снимок, топ тренда и (в режиме keyset) обе
+    страницы топов запрашиваются одновременно через ``asyncio.gather``.
+    """
+    queryset = Quote.objects.select_related("source").with_counters()
+    keyset = settings.QUOTES_DASHBOARD_PAGINATION == "keyset"
+    if keyset:
+        likes_paginator, views_paginator = _keyset_paginators()
+        snapshot, trending_scores, *pages = await asyncio.gather(
+            aget_snapshot(),
+            atrending(TRENDING_SIZE),
+            likes_paginator.apage(page_likes_num),
+            views_paginator.apage(page_views_num),
+        )
+        quote_ids = snapshot.most_recent
+    else:
+        snapshot, trending_scores = await asyncio.gather(
+            aget_snapshot(), atrending(TRENDING_SIZE)
+        )
+        pages, quote_ids = _snapshot_pages(snapshot, page_likes_num, page_views_num)
+    quotes = await queryset.ain_bulk(
+        [*quote_ids, *(quote_id for quote_id, _ in trending_scores)]
+    )
+    if not keyset:
+        _resolve_pages(pages, quotes)
+
+    return _build_dashboard_context(snapshot, *pages, quotes, trending_scores)
+
+
+async def dashboard_view(request):
+    """
+    Отображение дашборда со статистикой и топами цитат с пагинацией.
+    """
+
+    async def render_page():
+        context = await _dashboard_context(
+            request.GET.get("page_likes"), request.GET.get("page_views")
+        )
+        return render_to_string("quotes/dashboard.html", context, request=request)
+
+    content = await fragment_cache.aget_or_set(
+        dashboard_cache_key(request), render_page, settings.QUOTES_DASHBOARD_CACHE_TTL
+    )
+    return HttpResponse(content)
+
+
+@require_safe
+async def live_quote_view(request, quote_id):
+    """
+    SSE-поток лайков и дизлайков цитаты. Все потоки одной цитаты в
+    процессе получают значение из одного чтения БД.
+    """
+    if not settings.QUOTES_LIVE_UPDATES:
+        raise Http404("Live updates are disabled")
+    response = await live_hub.stream(
+        quote_topic(quote_id), lambda: load_quote_counts(quote_id)
+    )
+    if response is None:
+        raise Http404("Quote not found")
+    return response
+
+
+@require_safe
+async def live_stats_view(request):
+    """SSE-поток KPI дашборда."""
+    if not settings.QUOTES_LIVE_UPDATES:
+        raise Http404("Live updates are disabled")
+    response = await live_hub.stream(STATS_TOPIC, load_stats)
+    if response is None:
+        raise Http404("No dashboard snapshot")
+    return response
@@ -0,0 +1,197 @@
+"""
+Нагрузочные замеры view приложения quotes.
+
+``generate_fixtures`` наполняет БД через ``bulk_create`` в обход
+``save()``/``full_clean``, ``benchmark_endpoints`` замеряет время и число
+запросов каждого сценария на текущей БД. Команда ``benchmark_quotes``
+прогоняет их на временной тестовой БД для нескольких размеров и пишет
+JSON-отчет, который можно сравнить с отчетом прошлого релиза.
+"""
+
+import platform
+import random
+import statistics
+import sqlite3
+import time
+
+import django
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from .cache import fragment_cache
+from .counters import view_counter
+from .engagement import engagement_buffer
+from .models import Quote, Source
+from .sampling import quote_sampler
+from .snapshot import rebuild_snapshot
+from .votes import vote_journal, votes_journaled
+
+BATCH_SIZE = 5000
+WARMUP_ROUNDS = 3
+MAX_COUNTER = 10**6
+
+
+def generate_fixtures(total_quotes, seed=0, batch_size=BATCH_SIZE, stdout=None):
+    """
+    Догоняет число цитат в БД до ``total_quotes``.
+
+    На каждый источник приходится ``Quote.MAX_QUOTES_PER_SOURCE`` цитат,
+    лайки и просмотры распределены с длинным хвостом, как в реальном топе.
+    Сигналы при ``bulk_create`` не срабатывают, поэтому в конце таблица
+    весов и снимок дашборда перестраиваются явно.
+    """
+    rng = random.Random(seed)
+    per_source = Quote.MAX_QUOTES_PER_SOURCE
+    start = Quote.objects.count()
+    for batch_start in range(start, total_quotes, batch_size):
+        batch_end = min(batch_start + batch_size, total_quotes)
+        first_source = batch_start // per_source
+        last_source = (batch_end - 1) // per_source
+        source_names = [
+            f"Benchmark source {i}" for i in range(first_source, last_source + 1)
+        ]
+        Source.objects.bulk_create(
+            [Source(name=name) for name in source_names], ignore_conflicts=True
+        )
+        source_ids = dict(
+            Source.objects.filter(name__in=source_names).values_list("name", "id")
+        )
+        Quote.objects.bulk_create(
+            [
+                Quote(
+                    text=f"Benchmark quote {i}",
+                    source_id=source_ids[f"Benchmark source {i // per_source}"],
+                    weight=rng.randint(1, 1000),
+                    likes=min(int(rng.paretovariate(1.5)) - 1, MAX_COUNTER),
+                    dislikes=min(int(rng.paretovariate(2.0)) - 1, MAX_COUNTER),
+                    views=min(int(rng.paretovariate(1.2) * 10), MAX_COUNTER),
+                )
+                for i in range(batch_start, batch_end)
+            ],
+            batch_size=batch_size,
+        )
+        if stdout is not None:
+            stdout.write(f"  цитат: {batch_end}/{total_quotes}")
+    quote_sampler.invalidate()
+    rebuild_snapshot()
+
+
+def _summary(durations, queries):
+    durations_ms = sorted(d * 1000 for d in durations)
+    p95_index = max(0, round(len(durations_ms) * 0.95) - 1)
+    return {
+        "runs": len(durations_ms),
+        "min_ms": round(durations_ms[0], 3),
+        "median_ms": round(statistics.median(durations_ms), 3),
+        "p95_ms": round(durations_ms[p95_index], 3),
+        "mean_ms": round(statistics.fmean(durations_ms), 3),
+        "queries": max(queries),
+    }
+
+
+def _measure(request, repeat):
+    for _ in range(WARMUP_ROUNDS):
+        request()
+    durations, queries = [], []
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as ctx:
+            started = time.perf_counter()
+            response = request()
+            durations.append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{response.status_code} при замере {response.request}")
+        queries.append(len(ctx.captured_queries))
+    return _summary(durations, queries)
+
+
+def benchmark_endpoints(repeat=50, seed=0):
+    """
+    Замеряет сценарии на текущей БД. Кэши отключаются, чтобы мерить работу
+    view, а не попадания в кэш; отдельный сценарий мерит теплый кэш.
+    """
+    rng = random.Random(seed)
+    random.seed(seed)
+    client = Client()
+    quote_ids = quote_sampler.sample(1000, replace=True, rng=rng)
+    if not quote_ids:
+        raise RuntimeError("В БД нет цитат для замеров.")
+
+    def vote(name):
+        # Голоса с разных адресов, чтобы их не отсекала защита от накруток.
+        return lambda: Client().post(
+            reverse(f"quotes:{name}", args=[rng.choice(quote_ids)]),
+            REMOTE_ADDR=f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}",
+        )
+
+    scenarios = {
+        "random_quote": lambda: client.get(reverse("quotes:random_quote")),
+        "like_quote": vote("like_quote"),
+        "dislike_quote": vote("dislike_quote"),
+        "dashboard": lambda: client.get(reverse("quotes:dashboard")),
+        "dashboard_deep_page": lambda: client.get(
+            reverse("quotes:dashboard"), {"page_likes": 10, "page_views": 10}
+        ),
+    }
+    results = {}
+    with override_settings(QUOTES_CARD_CACHE_TTL=0, QUOTES_DASHBOARD_CACHE_TTL=0):
+        for name, request in scenarios.items():
+            results[name] = _measure(request, repeat)
+    fragment_cache.cache.clear()
+    results["random_quote_cached"] = _measure(scenarios["random_quote"], repeat)
+    results["dashboard_cached"] = _measure(scenarios["dashboard"], repeat)
+    flush_buffers()
+    return results
+
+
+def flush_buffers():
+    """
+    Записывает в текущую БД голоса и просмотры, которые сценарии оставили
+    в буферах процесса. Иначе их запишет atexit-хук уже после удаления
+    временной БД, то есть в рабочую; то, что записать не удалось, тоже
+    отбрасывается.
+    """
+    try:
+        if votes_journaled():
+            vote_journal.drain()
+        view_counter.flush()
+        engagement_buffer.flush()
+    finally:
+        vote_journal.clear()
+        view_counter.clear()
+        engagement_buffer.clear()
+
+
+def environment_info():
+    return {
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "database": connection.vendor,
+        "sqlite": sqlite3.sqlite_version if connection.vendor == "sqlite" else None,
+        "platform": platform.platform(),
+    }
+
+
+def compare_reports(baseline, current, threshold):
+    """
+    Возвращает список регрессий: сценарии, у которых медиана выросла больше
+    чем на ``threshold`` (доля) или стало больше запросов к БД.
+    """
+    regressions = []
+    for size, scenarios in current["results"].items():
+        for name, stats in scenarios.items():
+            previous = baseline.get("results", {}).get(size, {}).get(name)
+            if previous is None:
+                continue
+            if stats["median_ms"] > previous["median_ms"] * (1 + threshold):
+                regressions.append(
+                    f"{size}/{name}: медиана {previous['median_ms']} -> "
+                    f"{stats['median_ms']} мс"
+                )
+            if stats["queries"] > previous["queries"]:
+                regressions.append(
+                    f"{size}/{name}: запросов {previous['queries']} -> "
+                    f"{stats['queries']}"
+                )
+    return regressions
@@ -0,0 +1,186 @@
+import asyncio
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+from django.core.cache import caches
+
+LOCK_TIMEOUT = 10
+LOCK_WAIT = 2.0
+LOCK_POLL_INTERVAL = 0.05
+
+_MISSING = object()
+
+
+class SingleFlightCache:
+    """
+    Обертка над кэшем Django с защитой от cache stampede.
+
+    При промахе значение вычисляет только один запрос: внутри процесса
+    конкурирующие потоки (или корутины) ждут на блокировке ключа, между процессами
+    блокировкой служит ``cache.add`` служебного ключа. Остальные запросы
+    ждут результат до ``LOCK_WAIT`` секунд и только потом считают сами.
+
+    Счетчики попаданий и промахов ведутся по пространствам имен (первая
+    часть ключа до двоеточия) в памяти процесса.
+    """
+
+    def __init__(self, alias="default", prefix="quotes"):
+        self.alias = alias
+        self.prefix = prefix
+        self._stats_lock = threading.Lock()
+        self._stats = defaultdict(lambda: {"hits": 0, "misses": 0})
+        self._key_locks_guard = threading.Lock()
+        self._key_locks = {}
+        self._async_key_locks = {}
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def make_key(self, namespace, *parts):
+        return ":".join([self.prefix, namespace, *map(str, parts)])
+
+    def _count(self, key, outcome):
+        namespace = key.split(":")[1]
+        with self._stats_lock:
+            self._stats[namespace][outcome] += 1
+
+    def _key_lock(self, key):
+        with self._key_locks_guard:
+            lock = self._key_locks.get(key)
+            if lock is None:
+                lock = self._key_locks[key] = [threading.Lock(), 0]
+            lock[1] += 1
+            return lock
+
+    def _release_key_lock(self, key, lock):
+        with self._key_locks_guard:
+            lock[1] -= 1
+            if not lock[1]:
+                del self._key_locks[key]
+
+    def get_or_set(self, key, compute, timeout):
+        """Возвращает значение из кэша или вычисляет его ровно один раз."""
+        value = self.cache.get(key, _MISSING)
+        if value is not _MISSING:
+            self._count(key, "hits")
+            return value
+
+        lock = self._key_lock(key)
+        try:
+            with lock[0]:
+                value = self.cache.get(key, _MISSING)
+                if value is not _MISSING:
+                    self._count(key, "hits")
+                    return value
+                self._count(key, "misses")
+                return self._compute_once(key, compute, timeout)
+        finally:
+            self._release_key_lock(key, lock)
+
+    def _compute_once(self, key, compute, timeout):
+        lock_key = f"{key}:lock"
+        token = uuid.uuid4().hex
+        if not self.cache.add(lock_key, token, LOCK_TIMEOUT):
+            deadline = time.monotonic() + LOCK_WAIT
+            while time.monotonic() < deadline:
+                time.sleep(LOCK_POLL_INTERVAL)
+                value = self.cache.get(key, _MISSING)
+                if value is not _MISSING:
+                    return value
+            return compute()
+        try:
+            value = compute()
+            if value is not None:
+                self.cache.set(key, value, timeout)
+            return value
+        finally:
+            if self.cache.get(lock_key) == token:
+                self.cache.delete(lock_key)
+
+    async def aget_or_set(self, key, compute, timeout):
+        """Асинхронный ``get_or_set``: ``compute`` - корутинная функция."""
+        value = await self.cache.aget(key, _MISSING)
+        if value is not _MISSING:
+            self._count(key, "hits")
+            return value
+
+        lock = self._async_key_locks.setdefault(key, [asyncio.Lock(), 0])
+        lock[1] += 1
+        try:
+            async with lock[0]:
+                value = await self.cache.aget(key, _MISSING)
+                if value is not _MISSING:
+                    self._count(key, "hits")
+                    return value
+                self._count(key, "misses")
+                return await self._acompute_once(key, compute, timeout)
+        finally:
+            lock[1] -= 1
+            if not lock[1]:
+                del self._async_key_locks[key]
+
+    async def _acompute_once(self, key, compute, timeout):
+        lock_key = f"{key}:lock"
+        token = uuid.uuid4().hex
+        if not await self.cache.aadd(lock_key, token, LOCK_TIMEOUT):
+            deadline = time.monotonic() + LOCK_WAIT
+            while time.monotonic() < deadline:
+                await asyncio.sleep(LOCK_POLL_INTERVAL)
+                value = await self.cache.aget(key, _MISSING)
+                if value is not _MISSING:
+                    return value
+            return await compute()
+        try:
+            value = await compute()
+            if value is not None:
+                await self.cache.aset(key, value, timeout)
+            return value
+        finally:
+            if await self.cache.aget(lock_key) == token:
+                await self.cache.adelete(lock_key)
+
+    def delete(self, key):
+        self.cache.delete(key)
+
+    def delete_many(self, keys):
+        self.cache.delete_many(list(keys))
+
+    async def adelete_many(self, keys):
+        await self.cache.adelete_many(list(keys))
+
+    def stats(self):
+        """Счетчики попаданий и промахов по пространствам имен."""
+        with self._stats_lock:
+            result = {}
+            for namespace, counters in self._stats.items():
+                total = counters["hits"] + counters["misses"]
+                result[namespace] = {
+                    **counters,
+                    "hit_ratio": round(counters["hits"] / total, 4) if total else 0.0,
+                }
+            return result
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._stats.clear()
+
+
+fragment_cache = SingleFlightCache()
+
+
+def quote_card_key(quote_id):
+    return fragment_cache.make_key("quote_card", quote_id)
+
+
+def invalidate_quote_cards(quote_ids):
+    """Сбрасывает закэшированные карточки цитат."""
+    fragment_cache.delete_many(quote_card_key(quote_id) for quote_id in quote_ids)
+
+
+async def ainvalidate_quote_cards(quote_ids):
+    await fragment_cache.adelete_many(
+        quote_card_key(quote_id) for quote_id in quote_ids
+    )
@@ -0,0 +1,279 @@
+import atexit
+import glob
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Max, PositiveIntegerField, Value, When
+from django.db.models.functions import Now
+
+from .engagement import apply_engagement
+from .filelocks import lock_abandoned, open_locked
+from .models import COUNTER_FIELDS, Quote, QuoteCounterShard, counters_sharded
+from .snapshot import record_views
+
+logger = logging.getLogger(__name__)
+
+FLUSH_CHUNK_SIZE = 500
+
+
+def apply_view_increments(increments):
+    """
+    Записывает накопленные просмотры одним UPDATE ... CASE на пачку цитат
+    (в режиме sharded - одним executemany в шарды) и обновляет снимок
+    дашборда и сводки вовлеченности.
+
+    Каждая пачка пишется в своей транзакции и после нее удаляется из
+    ``increments``: после ошибки в нем остаются только незаписанные
+    просмотры.
+    """
+    items = [(quote_id, count) for quote_id, count in increments.items() if count]
+    for start in range(0, len(items), FLUSH_CHUNK_SIZE):
+        chunk = dict(items[start : start + FLUSH_CHUNK_SIZE])
+        with transaction.atomic():
+            if counters_sharded():
+                QuoteCounterShard.objects.add_many("views", chunk)
+            else:
+                delta = Case(
+                    *[
+                        When(pk=quote_id, then=Value(count))
+                        for quote_id, count in chunk.items()
+                    ],
+                    default=Value(0),
+                    output_field=PositiveIntegerField(),
+                )
+                Quote.objects.filter(pk__in=list(chunk)).update(
+                    views=F("views") + delta, updated_at=Now()
+                )
+            record_views(chunk)
+            apply_engagement({"views": chunk})
+        for quote_id in chunk:
+            del increments[quote_id]
+
+
+def _add_counters_sql(rows):
+    """Выражения ``поле = поле + CASE id ...`` для пачки ``{id: {поле: прирост}}``."""
+    updates = {}
+    for field in COUNTER_FIELDS:
+        whens = [
+            When(pk=quote_id, then=Value(deltas[field]))
+            for quote_id, deltas in rows.items()
+            if deltas[field]
+        ]
+        if whens:
+            updates[field] = F(field) + Case(
+                *whens, default=Value(0), output_field=PositiveIntegerField()
+            )
+    return updates
+
+
+def compact_counter_shards(batch_size=FLUSH_CHUNK_SIZE):
+    """
+    Сворачивает шарды счетчиков в строки ``Quote`` и возвращает число
+    свернутых шардов.
+
+    Шарды читаются пачками под ``select_for_update``, их суммы прибавляются
+    к цитатам одним UPDATE ... CASE, затем прочитанные шарды удаляются.
+    Приросты, пришедшие во время сжатия, ждут блокировку строки шарда или
+    попадают в новые шарды и не теряются. Обрабатываются только шарды,
+    существовавшие на момент запуска, поэтому сжатие завершается и под
+    нагрузкой.
+    """
+    last_id = QuoteCounterShard.objects.aggregate(last=Max("id"))["last"]
+    if last_id is None:
+        return 0
+    compacted = 0
+    after_id = 0
+    while True:
+        with transaction.atomic():
+            shards = list(
+                QuoteCounterShard.objects.select_for_update()
+                .filter(id__gt=after_id, id__lte=last_id)
+                .order_by("id")
+                .values_list("id", "quote_id", *COUNTER_FIELDS)[:batch_size]
+            )
+            if not shards:
+                return compacted
+            rows = {}
+            for _, quote_id, *values in shards:
+                deltas = rows.setdefault(quote_id, dict.fromkeys(COUNTER_FIELDS, 0))
+                for field, value in zip(COUNTER_FIELDS, values):
+                    deltas[field] += value
+            updates = _add_counters_sql(rows)
+            if updates:
+                Quote.objects.filter(pk__in=list(rows)).update(**updates)
+            QuoteCounterShard.objects.filter(
+                id__in=[shard_id for shard_id, *_ in shards]
+            ).delete()
+        compacted += len(shards)
+        after_id = shards[-1][0]
+
+
+class ViewCounterBuffer:
+    """
+    Буфер просмотров: копит инкременты в памяти и сбрасывает их в БД
+    одним групповым UPDATE по порогу времени или размера.
+
+    Если задан spool-файл, каждый просмотр дописывается в него строкой
+    "<quote_id> <count>", и источником истины при сбросе служит файл:
+    он атомарно переименовывается и применяется целиком. Запись и сброс
+    идут под flock файла (``quotes.filelocks``). Поэтому просмотры
+    переживают перезапуск процесса, а сбросить их может и команда
+    ``manage.py flush_views`` из другого процесса.
+    """
+
+    def __init__(self, spool_path=None, flush_interval=None, flush_size=None):
+        self._spool_path = spool_path
+        self._flush_interval = flush_interval
+        self._flush_size = flush_size
+        self._lock = threading.Lock()
+        self._pending = Counter()
+        self._last_flush = time.monotonic()
+
+    @property
+    def spool_path(self):
+        if self._spool_path is not None:
+            return self._spool_path
+        return settings.QUOTES_VIEW_SPOOL or None
+
+    @property
+    def flush_interval(self):
+        if self._flush_interval is not None:
+            return self._flush_interval
+        return settings.QUOTES_VIEW_FLUSH_INTERVAL
+
+    @property
+    def flush_size(self):
+        if self._flush_size is not None:
+            return self._flush_size
+        return settings.QUOTES_VIEW_FLUSH_SIZE
+
+    def record(self, quote_id, count=1):
+        """Учитывает просмотр и при достижении порога сбрасывает буфер."""
+        self._add(Counter({quote_id: count}))
+
+    def record_many(self, quote_ids):
+        """
+        Учитывает просмотры нескольких цитат за один вызов: при сбросе они
+        попадут в БД одним групповым UPDATE.
+        """
+        self._add(Counter(quote_ids))
+
+    def _add(self, increments):
+        with self._lock:
+            self._pending.update(increments)
+            spool_path = self.spool_path
+            if spool_path:
+                self._append_spool(spool_path, increments)
+            should_flush = (
+                sum(self._pending.values()) >= self.flush_size
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            )
+        if should_flush:
+            self.flush()
+
+    @staticmethod
+    def _append_spool(spool_path, increments):
+        """
+        Дописывает просмотры под flock: сброс не заберет файл посреди
+        записи, а писатель, ждавший блокировку забранного файла, пишет
+        уже в новый.
+        """
+        fd = open_locked(spool_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND)
+        try:
+            data = "".join(
+                f"{quote_id} {count}\n" for quote_id, count in increments.items()
+            )
+            os.write(fd, data.encode())
+        finally:
+            os.close(fd)
+
+    def pending(self, quote_id):
+        """Число еще не записанных в БД просмотров цитаты."""
+        return self._pending.get(quote_id, 0)
+
+    def clear(self):
+        """Отбрасывает накопленные просмотры без записи в БД."""
+        with self._lock:
+            self._pending.clear()
+            self._last_flush = time.monotonic()
+
+    def flush(self):
+        """Записывает накопленные просмотры в БД. Возвращает их количество."""
+        with self._lock:
+            increments, self._pending = self._pending, Counter()
+            self._last_flush = time.monotonic()
+            spool_path = self.spool_path
+            claimed = self._claim_spool(spool_path) if spool_path else []
+        try:
+            if spool_path:
+                increments = self._read_spool_files(path for path, _ in claimed)
+            total = sum(increments.values())
+            try:
+                # Spool-файлы удаляются только целиком, поэтому их просмотры
+                # записываются одной транзакцией.
+                with transaction.atomic() if spool_path else nullcontext():
+                    apply_view_increments(increments)
+            except Exception:
+                if not spool_path:
+                    # Возвращаются только незаписанные пачки.
+                    with self._lock:
+                        self._pending.update(increments)
+                raise
+            for path, _ in claimed:
+                os.remove(path)
+        finally:
+            # Файлы необработанного сброса подберет следующий.
+            for _, fd in claimed:
+                os.close(fd)
+        return total
+
+    @staticmethod
+    def _claim_spool(spool_path):
+        """
+        Забирает spool-файл на обработку: ``[(путь, дескриптор с flock)]``.
+        Блокировка держится до конца сброса, поэтому файлы, оставшиеся от
+        прерванного сброса, подбираются, только если их никто не держит, -
+        файл, который сейчас применяет другой процесс, не учитывается
+        дважды.
+        """
+        claimed = []
+        for path in sorted(glob.glob(f"{glob.escape(spool_path)}.*.flushing")):
+            fd = lock_abandoned(path)
+            if fd is not None:
+                claimed.append((path, fd))
+        fd = open_locked(spool_path)
+        if fd is not None:
+            target = f"{spool_path}.{uuid.uuid4().hex}.flushing"
+            os.replace(spool_path, target)
+            claimed.append((target, fd))
+        return claimed
+
+    @staticmethod
+    def _read_spool_files(paths):
+        increments = Counter()
+        for path in paths:
+            with open(path, encoding="utf-8") as spool:
+                for line in spool:
+                    parts = line.split()
+                    if len(parts) == 2 and all(part.isdigit() for part in parts):
+                        increments[int(parts[0])] += int(parts[1])
+        return increments
+
+
+view_counter = ViewCounterBuffer()
+
+
+@atexit.register
+def _flush_on_exit():
+    if view_counter._pending and not view_counter.spool_path:
+        try:
+            view_counter.flush()
+        except Exception:
+            logger.exception("Не удалось записать просмотры при завершении процесса")
@@ -0,0 +1,266 @@
+"""
+История вовлеченности цитат и раздел "В тренде" на дашборде.
+
+Голоса и просмотры складываются в сводки ``QuoteEngagement`` - строка на
+цитату и час. Голоса копятся в ``engagement_buffer`` и записываются
+пачкой, просмотры - вместе с буфером просмотров (``apply_view_increments``).
+Команда ``rollup_engagement`` сворачивает почасовые сводки старше
+QUOTES_ENGAGEMENT_HOURLY_RETENTION часов в дневные и удаляет дневные
+старше QUOTES_ENGAGEMENT_DAILY_RETENTION дней.
+
+Очки тренда - взвешенная сумма событий, каждое из которых затухает вдвое
+за QUOTES_TRENDING_HALF_LIFE часов. Чтобы не пересчитывать их для всех
+цитат с течением времени, хранится forward decay в логарифме:
+``log_score = log2(sum(w * 2 ** (t / h)))``. Новое событие только
+прибавляется к сумме, а порядок цитат со временем не меняется, поэтому
+топ читается по индексу за O(k), а текущие очки равны
+``2 ** (log_score - now / h)``.
+"""
+
+import atexit
+import logging
+import math
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncDay
+from django.utils import timezone
+
+from .models import COUNTER_FIELDS, QuoteEngagement, QuoteTrend, log2_add
+from .snapshot import record_likes
+
+logger = logging.getLogger(__name__)
+
+FLUSH_CHUNK_SIZE = 500
+# Вес события в очках тренда.
+TRENDING_WEIGHTS = {"likes": 5, "dislikes": 1, "views": 1}
+# Цитаты, очки которых угасли ниже этого значения, убираются из тренда.
+MIN_TRENDING_SCORE = 0.1
+
+
+def _decay_units(moment):
+    """Время в периодах полураспада от начала эпохи."""
+    return moment.timestamp() / 3600 / settings.QUOTES_TRENDING_HALF_LIFE
+
+
+def bucket_start(moment, period):
+    """Начало часа или дня (UTC), в сводку которого попадает ``moment``."""
+    moment = moment.astimezone(dt_timezone.utc).replace(
+        minute=0, second=0, microsecond=0
+    )
+    return moment.replace(hour=0) if period == QuoteEngagement.DAY else moment
+
+
+def _log_contribution(deltas, moment):
+    weight = sum(TRENDING_WEIGHTS[field] * deltas[field] for field in COUNTER_FIELDS)
+    return math.log2(weight) + _decay_units(moment) if weight > 0 else None
+
+
+def _add_rows(rows, period, bucket, moment):
+    """Пишет ``{id цитаты: {поле: прирост}}`` в сводку и в очки тренда."""
+    items = list(rows.items())
+    for start in range(0, len(items), FLUSH_CHUNK_SIZE):
+        chunk = dict(items[start : start + FLUSH_CHUNK_SIZE])
+        contributions = {
+            quote_id: contribution
+            for quote_id, deltas in chunk.items()
+            if (contribution := _log_contribution(deltas, moment)) is not None
+        }
+        with transaction.atomic():
+            QuoteEngagement.objects.add_many(period, bucket, chunk)
+            if contributions:
+                QuoteTrend.objects.add_many(contributions)
+
+
+def apply_engagement(increments, now=None):
+    """
+    Записывает приросты ``{поле: {id цитаты: прирост}}`` в почасовую
+    сводку текущего часа и в очки тренда.
+    """
+    now = now or timezone.now()
+    rows = {}
+    for field, counts in increments.items():
+        for quote_id, count in counts.items():
+            if count:
+                deltas = rows.setdefault(quote_id, dict.fromkeys(COUNTER_FIELDS, 0))
+                deltas[field] += count
+    _add_rows(rows, QuoteEngagement.HOUR, bucket_start(now, QuoteEngagement.HOUR), now)
+
+
+def trending(limit, now=None):
+    """Топ ``limit`` цитат по текущим очкам тренда: ``[(id цитаты, очки)]``."""
+    now_units = _decay_units(now or timezone.now())
+    rows = QuoteTrend.objects.order_by("-log_score").values_list(
+        "quote_id", "log_score"
+    )[:limit]
+    return [(quote_id, 2 ** (score - now_units)) for quote_id, score in rows]
+
+
+async def atrending(limit, now=None):
+    now_units = _decay_units(now or timezone.now())
+    rows = QuoteTrend.objects.order_by("-log_score").values_list(
+        "quote_id", "log_score"
+    )[:limit]
+    return [(quote_id, 2 ** (score - now_units)) async for quote_id, score in rows]
+
+
+def rollup_engagement(now=None):
+    """
+    Сворачивает старые почасовые сводки в дневные, удаляет устаревшие
+    дневные сводки и цитаты с угасшими очками тренда. Возвращает Counter
+    с ключами folded, expired и pruned.
+    """
+    now = now or timezone.now()
+    hourly_cutoff = bucket_start(
+        now - timedelta(hours=settings.QUOTES_ENGAGEMENT_HOURLY_RETENTION),
+        QuoteEngagement.HOUR,
+    )
+    daily_cutoff = bucket_start(
+        now - timedelta(days=settings.QUOTES_ENGAGEMENT_DAILY_RETENTION),
+        QuoteEngagement.DAY,
+    )
+    stats = Counter()
+    with transaction.atomic():
+        hourly = QuoteEngagement.objects.filter(
+            period=QuoteEngagement.HOUR, bucket__lt=hourly_cutoff
+        )
+        days = defaultdict(dict)
+        for row in (
+            hourly.annotate(day=TruncDay("bucket", tzinfo=dt_timezone.utc))
+            .order_by()
+            .values("quote_id", "day")
+            .annotate(**{field: Sum(field) for field in COUNTER_FIELDS})
+        ):
+            days[row["day"]][row["quote_id"]] = row
+        for day, rows in days.items():
+            QuoteEngagement.objects.add_many(QuoteEngagement.DAY, day, rows)
+        stats["folded"] = hourly.delete()[0]
+        stats["expired"] = QuoteEngagement.objects.filter(
+            period=QuoteEngagement.DAY, bucket__lt=daily_cutoff
+        ).delete()[0]
+        stats["pruned"] = QuoteTrend.objects.filter(
+            log_score__lt=_decay_units(now) + math.log2(MIN_TRENDING_SCORE)
+        ).delete()[0]
+    return stats
+
+
+def rebuild_trending():
+    """
+    Пересчитывает очки тренда по сводкам, например после смены
+    QUOTES_TRENDING_HALF_LIFE. Событие сводки считается случившимся в
+    середине ее периода. Возвращает число цитат в тренде.
+    """
+    middle = {
+        QuoteEngagement.HOUR: timedelta(minutes=30),
+        QuoteEngagement.DAY: timedelta(hours=12),
+    }
+    scores = {}
+    rows = QuoteEngagement.objects.values_list(
+        "quote_id", "period", "bucket", *COUNTER_FIELDS
+    )
+    for quote_id, period, bucket, *values in rows.iterator(chunk_size=2000):
+        contribution = _log_contribution(
+            dict(zip(COUNTER_FIELDS, values)), bucket + middle[period]
+        )
+        if contribution is not None:
+            scores[quote_id] = log2_add(scores.get(quote_id), contribution)
+    items = list(scores.items())
+    with transaction.atomic():
+        QuoteTrend.objects.all().delete()
+        for start in range(0, len(items), FLUSH_CHUNK_SIZE):
+            QuoteTrend.objects.add_many(dict(items[start : start + FLUSH_CHUNK_SIZE]))
+    return len(scores)
+
+
+class EngagementBuffer:
+    """
+    Буфер голосов для сводок вовлеченности и снимка дашборда: копит
+    приросты в памяти и записывает их одной пачкой не реже чем раз в
+    QUOTES_ENGAGEMENT_FLUSH_INTERVAL секунд или при накоплении
+    QUOTES_ENGAGEMENT_FLUSH_SIZE голосов. Сами счетчики цитат пишутся
+    сразу, поэтому голос не трогает общую строку снимка, а потеря буфера
+    при падении процесса задевает только тренд и снимок (его пересчитывает
+    ``rebuild_dashboard``).
+    """
+
+    def __init__(self, flush_interval=None, flush_size=None):
+        self._flush_interval = flush_interval
+        self._flush_size = flush_size
+        self._lock = threading.Lock()
+        self._pending = defaultdict(Counter)
+        self._size = 0
+        self._last_flush = time.monotonic()
+
+    @property
+    def flush_interval(self):
+        if self._flush_interval is not None:
+            return self._flush_interval
+        return settings.QUOTES_ENGAGEMENT_FLUSH_INTERVAL
+
+    @property
+    def flush_size(self):
+        if self._flush_size is not None:
+            return self._flush_size
+        return settings.QUOTES_ENGAGEMENT_FLUSH_SIZE
+
+    def record(self, quote_id, field, count=1):
+        """Учитывает голос и при достижении порога сбрасывает буфер."""
+        with self._lock:
+            self._pending[field][quote_id] += count
+            self._size += count
+            should_flush = (
+                self._size >= self.flush_size
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            )
+        if should_flush:
+            self.flush()
+
+    def clear(self):
+        """Отбрасывает накопленные голоса без записи в БД."""
+        with self._lock:
+            self._pending = defaultdict(Counter)
+            self._size = 0
+            self._last_flush = time.monotonic()
+
+    def flush(self):
+        """
+        Записывает накопленные голоса в сводки и лайки в снимок дашборда.
+        Возвращает количество голосов.
+        """
+        with self._lock:
+            increments, size = self._pending, self._size
+            self._pending, self._size = defaultdict(Counter), 0
+            self._last_flush = time.monotonic()
+        try:
+            # Сводки и снимок пишутся одной транзакцией: после ошибки в БД
+            # ничего не остается, и буфер можно вернуть целиком.
+            with transaction.atomic():
+                apply_engagement(increments)
+                # Дизлайки в снимке не отражаются.
+                record_likes(increments.get("likes", {}))
+        except Exception:
+            with self._lock:
+                for field, counts in increments.items():
+                    self._pending[field].update(counts)
+                self._size += size
+            raise
+        return size
+
+
+engagement_buffer = EngagementBuffer()
+
+
+@atexit.register
+def _flush_on_exit():
+    if engagement_buffer._size:
+        try:
+            engagement_buffer.flush()
+        except Exception:
+            logger.exception(
+                "Не удалось записать голоса в сводки при завершении процесса"
+            )
@@ -0,0 +1,60 @@
+"""
+Файлы, которые несколько процессов дописывают и забирают на обработку
+(журналы голосов, spool просмотров).
+
+Пока процесс дописывает или обрабатывает файл, он держит на нем flock.
+Забирающий процесс переименовывает файл под той же блокировкой, поэтому
+писатель, ждавший ее, видит подмену и открывает файл заново, а файл,
+который никто не держит, остался от прерванного процесса.
+"""
+
+import os
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировок нет, чужие файлы не подбираются.
+    fcntl = None
+
+
+def open_locked(path, flags=os.O_RDONLY):
+    """
+    Открывает файл и ждет его flock. Если файл успели переименовать или
+    удалить, пока мы ждали, открывает его заново по тому же пути.
+    Возвращает дескриптор или None, если файла нет (без ``O_CREAT``).
+    """
+    while True:
+        try:
+            fd = os.open(path, flags, 0o644)
+        except FileNotFoundError:
+            return None
+        if fcntl is None:
+            return fd
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(fd).st_ino == os.stat(path).st_ino:
+                return fd
+        except FileNotFoundError:
+            pass
+        os.close(fd)
+
+
+def lock_abandoned(path):
+    """
+    Берет flock файла, если его не держит живой процесс, и возвращает
+    дескриптор; иначе None.
+    """
+    if fcntl is None:
+        return None
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        return None
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        # Файл могли удалить и создать заново, пока мы ждали открытия.
+        if os.fstat(fd).st_ino == os.stat(path).st_ino:
+            return fd
+    except OSError:
+        pass
+    os.close(fd)
+    return None
@@ -0,0 +1,204 @@
+"""
+Потоковый импорт цитат из JSONL/CSV.
+
+``Quote.save()`` вызывает ``full_clean()``, а ``clean()`` считает цитаты
+источника отдельным запросом, поэтому импорт через ORM стоит несколько
+запросов на строку. ``QuoteImporter`` читает файл по пачкам и проверяет
+правила модели в памяти: лимит цитат на источник - по счетчикам,
+загруженным для источников пачки, уникальность текста - по множеству
+хешей уже известных текстов. Пачка записывается через ``bulk_create``.
+"""
+
+import csv
+import gzip
+import hashlib
+import itertools
+import json
+import time
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count
+
+from .models import Quote, Source
+from .sampling import quote_sampler
+from .snapshot import rebuild_snapshot
+
+CHUNK_SIZE = 2000
+FORMATS = ("jsonl", "csv")
+SOURCE_NAME_MAX_LENGTH = Source._meta.get_field("name").max_length
+WEIGHT_FIELD = Quote._meta.get_field("weight")
+
+
+def text_digest(text):
+    return hashlib.blake2b(text.encode(), digest_size=16).digest()
+
+
+def detect_format(path):
+    name = path.removesuffix(".gz")
+    for fmt in FORMATS:
+        if name.endswith(f".{fmt}"):
+            return fmt
+    return None
+
+
+def open_text(path):
+    """Открывает файл как текст; ``.gz`` распаковывается на лету."""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8-sig", newline="")
+    return open(path, encoding="utf-8-sig", newline="")
+
+
+def read_records(stream, fmt):
+    """
+    Построчно отдает записи файла словарями. Строка JSONL, которую не удалось
+    разобрать, отдается как None, чтобы импорт посчитал ее ошибочной.
+    """
+    if fmt == "csv":
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield record if isinstance(record, dict) else None
+
+
+class QuoteImporter:
+    """
+    Импорт записей вида ``{"text": ..., "source": ..., "weight": ...}``.
+
+    Пропущенные строки считаются по причинам в ``stats``: ``invalid``
+    (нет текста или источника, неверный вес), ``duplicate`` (текст уже есть
+    в БД или встречался в файле) и ``limit`` (у источника уже
+    ``Quote.MAX_QUOTES_PER_SOURCE`` цитат).
+    """
+
+    def __init__(self, chunk_size=CHUNK_SIZE, stdout=None):
+        self.chunk_size = chunk_size
+        self.stdout = stdout
+        self.stats = Counter()
+        self._digests = None
+        # Название источника -> [id или None, число цитат].
+        self._sources = {}
+
+    def _load_digests(self):
+        digests = set()
+        texts = Quote.objects.values_list("text", flat=True).order_by()
+        for text in texts.iterator(chunk_size=self.chunk_size):
+            digests.add(text_digest(text))
+        return digests
+
+    def _clean(self, record):
+        if record is None:
+            return None
+        text, source = record.get("text"), record.get("source")
+        if not isinstance(text, str) or not isinstance(source, str):
+            return None
+        text, source = text.strip(), source.strip()
+        if not text or not source or len(source) > SOURCE_NAME_MAX_LENGTH:
+            return None
+        weight = record.get("weight")
+        if weight in (None, ""):
+            weight = WEIGHT_FIELD.default
+        try:
+            weight = int(weight)
+        except (TypeError, ValueError):
+            return None
+        if not 1 <= weight <= 1000:
+            return None
+        return text, source, weight
+
+    def _prefetch_sources(self, names):
+        missing = [name for name in names if name not in self._sources]
+        for name in missing:
+            self._sources[name] = [None, 0]
+        rows = (
+            Source.objects.filter(name__in=missing)
+            .annotate(quote_count=Count("quotes"))
+            .values_list("name", "id", "quote_count")
+        )
+        for name, source_id, quote_count in rows:
+            self._sources[name] = [source_id, quote_count]
+
+    def _import_chunk(self, records):
+        cleaned = []
+        for record in records:
+            row = self._clean(record)
+            if row is None:
+                self.stats["invalid"] += 1
+            else:
+                cleaned.append(row)
+        self._prefetch_sources({source for _, source, _ in cleaned})
+
+        accepted = []
+        for text, source, weight in cleaned:
+            digest = text_digest(text)
+            if digest in self._digests:
+                self.stats["duplicate"] += 1
+                continue
+            state = self._sources[source]
+            if state[1] >= Quote.MAX_QUOTES_PER_SOURCE:
+                self.stats["limit"] += 1
+                continue
+            state[1] += 1
+            self._digests.add(digest)
+            accepted.append((text, source, weight))
+        if not accepted:
+            return
+
+        with transaction.atomic():
+            new_sources = {
+                source for _, source, _ in accepted if self._sources[source][0] is None
+            }
+            if new_sources:
+                Source.objects.bulk_create(
+                    [Source(name=name) for name in new_sources],
+                    ignore_conflicts=True,
+                )
+                for name, source_id in Source.objects.filter(
+                    name__in=new_sources
+                ).values_list("name", "id"):
+                    self._sources[name][0] = source_id
+                self.stats["sources"] += len(new_sources)
+            Quote.objects.bulk_create(
+                [
+                    Quote(text=text, source_id=self._sources[source][0], weight=weight)
+                    for text, source, weight in accepted
+                ],
+                batch_size=self.chunk_size,
+            )
+        self.stats["created"] += len(accepted)
+
+    def run(self, records):
+        """Импортирует записи пачками и возвращает ``stats``."""
+        if self._digests is None:
+            self._digests = self._load_digests()
+        started = time.monotonic()
+        records = iter(records)
+        while chunk := list(itertools.islice(records, self.chunk_size)):
+            self._import_chunk(chunk)
+            self.stats["processed"] += len(chunk)
+            if self.stdout is not None:
+                elapsed = max(time.monotonic() - started, 1e-9)
+                self.stdout.write(
+                    f"  обработано {self.stats['processed']}, "
+                    f"добавлено {self.stats['created']} "
+                    f"({self.stats['processed'] / elapsed:.0f} строк/с)"
+                )
+        if self.stats["created"]:
+            # bulk_create не отправляет сигналы post_save.
+            quote_sampler.invalidate()
+            rebuild_snapshot()
+        return self.stats
+
+
+def import_file(path, fmt=None, chunk_size=CHUNK_SIZE, stdout=None):
+    fmt = fmt or detect_format(path)
+    if fmt not in FORMATS:
+        raise ValueError(f"Неизвестный формат файла: {path}")
+    with open_text(path) as stream:
+        return QuoteImporter(chunk_size, stdout).run(read_records(stream, fmt))
@@ -0,0 +1,215 @@
+"""
+Живые счетчики по Server-Sent Events (только под ASGI).
+
+Все открытые потоки процесса подписаны на один ``live_hub``. Для каждой
+темы (счетчики цитаты или KPI дашборда) работает одна задача: она читает
+значение из БД и рассылает его подписчикам, только если оно изменилось.
+Голоса вызывают ``notify``, но тема перечитывается не чаще
+QUOTES_LIVE_MAX_RATE раз в секунду, поэтому тысячи открытых вкладок одной
+цитаты стоят одного запроса к БД на интервал. Без голосов в этом процессе
+(например, при голосах через другой процесс) тема перечитывается раз в
+QUOTES_LIVE_POLL_INTERVAL секунд.
+"""
+
+import asyncio
+import json
+import logging
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+
+from .models import Quote, counter_expression
+from .snapshot import aget_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Через сколько миллисекунд EventSource переподключается после обрыва.
+RETRY_MS = 3000
+QUOTE_FIELDS = ("likes", "dislikes")
+STATS_FIELDS = ("total_quotes", "total_sources", "total_likes", "total_views")
+
+
+def quote_topic(quote_id):
+    return ("quote", quote_id)
+
+
+STATS_TOPIC = ("stats",)
+
+
+async def load_quote_counts(quote_id):
+    """
+    Лайки и дизлайки цитаты или None, если цитаты нет. Просмотры не
+    передаются: в БД они отстают от карточки на буфер просмотров.
+    """
+    row = (
+        await Quote.objects.filter(pk=quote_id)
+        .annotate(
+            **{f"{field}_total": counter_expression(field) for field in QUOTE_FIELDS}
+        )
+        .values_list(*(f"{field}_total" for field in QUOTE_FIELDS))
+        .afirst()
+    )
+    return dict(zip(QUOTE_FIELDS, row)) if row else None
+
+
+async def load_stats():
+    snapshot = await aget_snapshot()
+    return {field: getattr(snapshot, field) for field in STATS_FIELDS}
+
+
+def format_event(payload):
+    return f"event: counts\ndata: {json.dumps(payload)}\n\n"
+
+
+def _offer(queue, payload):
+    """Кладет значение в очередь подписчика, заменяя непрочитанное."""
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(payload)
+
+
+class _Topic:
+    def __init__(self, load):
+        self.load = load
+        self.loop = asyncio.get_running_loop()
+        self.subscribers = set()
+        self.payload = None
+        self.ready = asyncio.Event()
+        self.changed = asyncio.Event()
+
+
+class LiveHub:
+    """Pub/sub счетчиков в памяти процесса: одна задача чтения на тему."""
+
+    def __init__(self, max_rate=None, poll_interval=None):
+        self._max_rate = max_rate
+        self._poll_interval = poll_interval
+        self._topics = {}
+
+    @property
+    def max_rate(self):
+        if self._max_rate is not None:
+            return self._max_rate
+        return settings.QUOTES_LIVE_MAX_RATE
+
+    @property
+    def poll_interval(self):
+        if self._poll_interval is not None:
+            return self._poll_interval
+        return settings.QUOTES_LIVE_POLL_INTERVAL
+
+    def notify(self, topic_key):
+        """
+        Сообщает, что значение темы изменилось. Вызывается из любого потока;
+        без подписчиков ничего не стоит.
+        """
+        topic = self._topics.get(topic_key)
+        if topic is None:
+            return
+        try:
+            topic.loop.call_soon_threadsafe(topic.changed.set)
+        except RuntimeError:
+            # Цикл событий уже закрыт.
+            pass
+
+    def notify_quotes(self, quote_ids):
+        """Сообщает об изменении счетчиков цитат и KPI дашборда."""
+        for quote_id in quote_ids:
+            self.notify(quote_topic(quote_id))
+        self.notify(STATS_TOPIC)
+
+    def subscribers(self, topic_key):
+        topic = self._topics.get(topic_key)
+        return len(topic.subscribers) if topic else 0
+
+    async def subscribe(self, topic_key, load):
+        """
+        Подписывает на тему. Возвращает очередь новых значений и текущее
+        значение (None - данных нет, например, цитата удалена). Первый
+        подписчик запускает задачу чтения, остальные получают уже
+        прочитанное значение без обращения к БД.
+        """
+        topic = self._topics.get(topic_key)
+        if topic is None:
+            topic = self._topics[topic_key] = _Topic(load)
+            asyncio.create_task(self._pump(topic_key, topic))
+        await topic.ready.wait()
+        queue = asyncio.Queue(maxsize=1)
+        topic.subscribers.add(queue)
+        return queue, topic.payload
+
+    def unsubscribe(self, topic_key, queue):
+        topic = self._topics.get(topic_key)
+        if topic is not None:
+            topic.subscribers.discard(queue)
+
+    async def _pump(self, topic_key, topic):
+        try:
+            while True:
+                try:
+                    payload = await topic.load()
+                except Exception:
+                    # Подписчики остаются на прошлом значении до следующего чтения.
+                    logger.exception(
+                        "Не удалось прочитать тему %s живых счетчиков", topic_key
+                    )
+                    payload = topic.payload
+                if payload != topic.payload:
+                    topic.payload = payload
+                    for queue in topic.subscribers:
+                        _offer(queue, payload)
+                topic.ready.set()
+                # Голоса за это время сливаются в одно чтение.
+                await asyncio.sleep(1 / self.max_rate)
+                try:
+                    await asyncio.wait_for(topic.changed.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                topic.changed.clear()
+                if not topic.subscribers:
+                    return
+        finally:
+            if self._topics.get(topic_key) is topic:
+                del self._topics[topic_key]
+            topic.ready.set()
+
+    async def events(self, topic_key, queue, payload):
+        """
+        События SSE для подписчика: текущее значение, затем изменения и
+        комментарии-пинги. Поток закрывается через QUOTES_LIVE_STREAM_TIMEOUT
+        секунд (EventSource переподключится сам) или когда данных не стало.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.QUOTES_LIVE_STREAM_TIMEOUT
+        try:
+            yield f"retry: {RETRY_MS}\n\n{format_event(payload)}"
+            while (timeout := deadline - loop.time()) > 0:
+                try:
+                    payload = await asyncio.wait_for(
+                        queue.get(), min(timeout, self.poll_interval)
+                    )
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if payload is None:
+                    return
+                yield format_event(payload)
+        finally:
+            self.unsubscribe(topic_key, queue)
+
+    async def stream(self, topic_key, load):
+        """Ответ SSE по теме или None, если данных нет."""
+        queue, payload = await self.subscribe(topic_key, load)
+        if payload is None:
+            self.unsubscribe(topic_key, queue)
+            return None
+        response = StreamingHttpResponse(
+            self.events(topic_key, queue, payload), content_type="text/event-stream"
+        )
+        response["Cache-Control"] = "no-cache"
+        # Иначе nginx буферизует поток.
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+
+live_hub = LiveHub()
@@ -0,0 +1,109 @@
+import json
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import (
+    override_settings,
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+from django.utils import timezone
+
+from quotes.benchmarks import (
+    benchmark_endpoints,
+    compare_reports,
+    environment_info,
+    flush_buffers,
+    generate_fixtures,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Замеряет время и число запросов view приложения quotes на временной "
+        "БД с заданным числом цитат и пишет JSON-отчет."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            nargs="+",
+            type=int,
+            default=[10_000, 100_000],
+            help="Размеры БД (число цитат), например: --sizes 10000 100000 1000000",
+        )
+        parser.add_argument("--repeat", type=int, default=50)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--output", help="Путь к JSON-отчету (по умолчанию stdout)."
+        )
+        parser.add_argument("--baseline", help="Отчет прошлого релиза для сравнения.")
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=0.2,
+            help="Допустимый рост медианы относительно --baseline (доля).",
+        )
+
+    def handle(self, *args, **options):
+        results = {}
+        # Журналы голосов и spool просмотров замеров живут во временном
+        # каталоге: рабочие файлы не переносятся во временную БД, а файлы
+        # замеров не остаются для рабочей.
+        with (
+            tempfile.TemporaryDirectory() as tmp_dir,
+            override_settings(
+                QUOTES_VOTE_JOURNAL_DIR=os.path.join(tmp_dir, "votes"),
+                QUOTES_VIEW_SPOOL=(
+                    os.path.join(tmp_dir, "views.spool")
+                    if settings.QUOTES_VIEW_SPOOL
+                    else ""
+                ),
+            ),
+        ):
+            setup_test_environment()
+            old_config = setup_databases(
+                verbosity=0, interactive=False, aliases={"default"}
+            )
+            try:
+                for size in sorted(options["sizes"]):
+                    self.stderr.write(f"Генерация {size} цитат...")
+                    generate_fixtures(size, seed=options["seed"], stdout=self.stderr)
+                    self.stderr.write(f"Замеры на {size} цитатах...")
+                    results[str(size)] = benchmark_endpoints(
+                        repeat=options["repeat"], seed=options["seed"]
+                    )
+            finally:
+                try:
+                    flush_buffers()
+                finally:
+                    teardown_databases(old_config, verbosity=0)
+                    teardown_test_environment()
+
+        report = {
+            "created_at": timezone.now().isoformat(),
+            "environment": environment_info(),
+            "config": {"repeat": options["repeat"], "seed": options["seed"]},
+            "results": results,
+        }
+        payload = json.dumps(report, indent=2, ensure_ascii=False)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as output:
+                output.write(payload)
+            self.stderr.write(
+                self.style.SUCCESS(f"Отчет записан в {options['output']}")
+            )
+        else:
+            self.stdout.write(payload)
+
+        if options["baseline"]:
+            with open(options["baseline"], encoding="utf-8") as baseline_file:
+                baseline = json.load(baseline_file)
+            regressions = compare_reports(baseline, report, options["threshold"])
+            if regressions:
+                raise CommandError("Регрессии:\n" + "\n".join(regressions))
+            self.stderr.write(self.style.SUCCESS("Регрессий нет."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from quotes.counters import compact_counter_shards
+
+
+class Command(BaseCommand):
+    help = "Сворачивает шарды счетчиков (QUOTES_COUNTER_MODE=sharded) в цитаты."
+
+    def handle(self, *args, **options):
+        compacted = compact_counter_shards()
+        self.stdout.write(self.style.SUCCESS(f"Свернуто шардов: {compacted}"))
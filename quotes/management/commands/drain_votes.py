@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from quotes.votes import vote_journal
+
+
+class Command(BaseCommand):
+    help = (
+        "Переносит голоса из журналов (режим QUOTES_VOTE_MODE=journal) в БД, "
+        "включая журналы завершившихся процессов."
+    )
+
+    def handle(self, *args, **options):
+        drained = vote_journal.drain()
+        self.stdout.write(self.style.SUCCESS(f"Записано голосов: {drained}"))
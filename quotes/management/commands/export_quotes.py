@@ -0,0 +1,74 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from quotes.exporting import (
+    CHUNK_SIZE,
+    FORMATS,
+    export_rows,
+    iter_export,
+    iter_gzip,
+    parse_since,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Потоково выгружает цитаты со счетчиками в JSONL или CSV. "
+        "С --since выгружаются только цитаты после курсора прошлой выгрузки."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output", default="-", help="Путь к файлу (по умолчанию stdout)."
+        )
+        parser.add_argument("--format", choices=FORMATS, default="jsonl")
+        parser.add_argument("--gzip", action="store_true", help="Сжимать в gzip.")
+        parser.add_argument("--since", help="created_at последней выгруженной цитаты.")
+        parser.add_argument(
+            "--since-id", type=int, help="id последней выгруженной цитаты."
+        )
+        parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        if options["since_id"] is not None and not options["since"]:
+            raise CommandError("--since-id задается вместе с --since.")
+        if options["gzip"] and options["output"] == "-":
+            raise CommandError("Для --gzip укажите файл в --output.")
+        since = None
+        if options["since"]:
+            try:
+                since = parse_since(options["since"])
+            except ValueError as e:
+                raise CommandError(e)
+
+        last = {}
+
+        def tracked(rows):
+            for row in rows:
+                last["row"] = row
+                yield row
+
+        rows = tracked(
+            export_rows(since, options["since_id"], chunk_size=options["chunk_size"])
+        )
+        chunks = iter_export(options["format"], rows)
+        if options["output"] == "-":
+            for chunk in chunks:
+                self.stdout.write(chunk, ending="")
+            self.stdout.flush()
+        else:
+            data = (
+                iter_gzip(chunks)
+                if options["gzip"]
+                else (chunk.encode() for chunk in chunks)
+            )
+            with open(options["output"], "wb") as output:
+                for block in data:
+                    output.write(block)
+
+        if "row" in last:
+            row = last["row"]
+            self.stderr.write(
+                f"Последняя цитата: --since {row[-1].isoformat()} --since-id {row[0]}"
+            )
+        else:
+            self.stderr.write("Новых цитат нет.")
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from quotes.counters import view_counter
+
+
+class Command(BaseCommand):
+    help = "Записывает накопленные просмотры цитат (буфер и spool-файл) в БД."
+
+    def handle(self, *args, **options):
+        flushed = view_counter.flush()
+        self.stdout.write(self.style.SUCCESS(f"Записано просмотров: {flushed}"))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from quotes.importing import CHUNK_SIZE, FORMATS, import_file
+
+
+class Command(BaseCommand):
+    help = (
+        "Импортирует цитаты из JSONL или CSV (можно .gz) с полями text, source "
+        "и необязательным weight, проверяя правила модели в памяти."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Путь к файлу .jsonl, .csv или .gz.")
+        parser.add_argument(
+            "--format",
+            choices=FORMATS,
+            help="Формат файла, если его нельзя понять по расширению.",
+        )
+        parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            stats = import_file(
+                options["path"],
+                fmt=options["format"],
+                chunk_size=options["chunk_size"],
+                stdout=self.stdout,
+            )
+        except (OSError, ValueError) as e:
+            raise CommandError(e)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Импорт завершен: добавлено цитат {stats['created']}, "
+                f"источников {stats['sources']}; пропущено дубликатов "
+                f"{stats['duplicate']}, сверх лимита {stats['limit']}, "
+                f"ошибочных строк {stats['invalid']}."
+            )
+        )
@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from quotes.prerender import prerender
+
+
+class Command(BaseCommand):
+    help = (
+        "Пишет статические HTML-копии дашборда и страниц цитат (с .gz) для "
+        "раздачи через CDN; перерисовываются только изменившиеся страницы."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output",
+            help="Каталог для страниц (по умолчанию QUOTES_PRERENDER_DIR).",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Перерисовать все страницы, например после смены шаблонов.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=0,
+            help="Повторять каждые N секунд, не завершаясь.",
+        )
+
+    def handle(self, *args, **options):
+        force = options["force"]
+        while True:
+            stats = prerender(options["output"], force=force)
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Перерисовано страниц: {stats['rendered']}, "
+                    f"без изменений: {stats['skipped']}, "
+                    f"удалено: {stats['removed']}"
+                )
+            )
+            if not options["interval"]:
+                return
+            force = False
+            close_old_connections()
+            time.sleep(options["interval"])
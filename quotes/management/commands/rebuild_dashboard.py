@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from quotes.snapshot import rebuild_snapshot
+
+
+class Command(BaseCommand):
+    help = "Полностью пересчитывает снимок дашборда."
+
+    def handle(self, *args, **options):
+        snapshot = rebuild_snapshot()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Снимок дашборда пересчитан: цитат {snapshot.total_quotes}, "
+                f"источников {snapshot.total_sources}."
+            )
+        )
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from quotes.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Пересоздает полнотекстовый индекс цитат по текущим данным."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--database", default="default", help="Алиас БД (по умолчанию default)."
+        )
+
+    def handle(self, *args, **options):
+        indexed = rebuild_index(options["database"])
+        if indexed is None:
+            raise CommandError("На этой СУБД полнотекстового индекса нет.")
+        self.stdout.write(self.style.SUCCESS(f"Проиндексировано цитат: {indexed}"))
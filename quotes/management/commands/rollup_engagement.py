@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from quotes.engagement import rebuild_trending, rollup_engagement
+
+
+class Command(BaseCommand):
+    help = (
+        "Сворачивает почасовые сводки вовлеченности в дневные, удаляет "
+        "устаревшие сводки и угасшие цитаты из тренда."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rebuild-trending",
+            action="store_true",
+            help="Пересчитать очки тренда по сводкам (после смены периода полураспада).",
+        )
+
+    def handle(self, *args, **options):
+        stats = rollup_engagement()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Свернуто почасовых сводок: {stats['folded']}, "
+                f"удалено дневных: {stats['expired']}, "
+                f"убрано из тренда: {stats['pruned']}"
+            )
+        )
+        if options["rebuild_trending"]:
+            trending = rebuild_trending()
+            self.stdout.write(self.style.SUCCESS(f"Цитат в тренде: {trending}"))
@@ -0,0 +1,140 @@
+"""
+Метрики запросов по именам URL: гистограмма времени ответа, число
+запросов к БД и время в БД. Заполняются ``QueryMetricsMiddleware`` и
+отдаются view ``metrics_view`` в текстовом формате Prometheus.
+
+Метрики хранятся в памяти процесса, поэтому у каждого воркера свои;
+Prometheus суммирует их при опросе каждого воркера.
+"""
+
+import bisect
+import threading
+import time
+from collections import defaultdict
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+
+class Histogram:
+    """Гистограмма с фиксированными верхними границами корзин (``le``)."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # Последняя корзина - +Inf.
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        """Пары (граница, число наблюдений не больше нее), как в Prometheus."""
+        total = 0
+        result = []
+        for bound, count in zip((*self.buckets, "+Inf"), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class ViewMetrics:
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.db_time = 0.0
+
+
+class QueryTimer:
+    """Обертка ``connection.execute_wrapper``: считает запросы и время в БД."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_bound(bound):
+    return bound if isinstance(bound, str) else repr(float(bound))
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = defaultdict(ViewMetrics)
+
+    def record(self, view_name, duration, query_count, db_time):
+        with self._lock:
+            metrics = self._views[view_name]
+            metrics.latency.observe(duration)
+            metrics.queries.observe(query_count)
+            metrics.db_time += db_time
+
+    def get(self, view_name):
+        with self._lock:
+            return self._views.get(view_name)
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+    def render_prometheus(self):
+        with self._lock:
+            views = sorted(self._views.items())
+            lines = []
+            self._render_histogram(
+                lines,
+                "quotes_request_duration_seconds",
+                "Время ответа view.",
+                [(view, m.latency) for view, m in views],
+            )
+            self._render_histogram(
+                lines,
+                "quotes_db_queries_per_request",
+                "Число запросов к БД за один запрос к view.",
+                [(view, m.queries) for view, m in views],
+            )
+            lines.append("# HELP quotes_db_queries_total Всего запросов к БД.")
+            lines.append("# TYPE quotes_db_queries_total counter")
+            for view, m in views:
+                lines.append(
+                    f'quotes_db_queries_total{{view="{_escape(view)}"}} {m.queries.sum}'
+                )
+            lines.append("# HELP quotes_db_duration_seconds_total Время в БД.")
+            lines.append("# TYPE quotes_db_duration_seconds_total counter")
+            for view, m in views:
+                lines.append(
+                    f'quotes_db_duration_seconds_total{{view="{_escape(view)}"}} '
+                    f"{m.db_time!r}"
+                )
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _render_histogram(lines, name, help_text, histograms):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        for view, histogram in histograms:
+            label = f'view="{_escape(view)}"'
+            for bound, count in histogram.cumulative():
+                lines.append(
+                    f'{name}_bucket{{{label},le="{_format_bound(bound)}"}} {count}'
+                )
+            lines.append(f"{name}_sum{{{label}}} {float(histogram.sum)!r}")
+            lines.append(f"{name}_count{{{label}}} {histogram.count}")
+
+
+request_metrics = MetricsRegistry()
@@ -0,0 +1,128 @@
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+from .metrics import QueryTimer, request_metrics
+from .routers import PIN_COOKIE, primary_pin_scope, replica_configured
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS", "TRACE")
+
+
+class QueryMetricsMiddleware:
+    """
+    Замеряет время ответа, число запросов к БД и время в БД для каждого
+    запроса и записывает их в ``request_metrics`` по имени URL
+    (``quotes:random_quote``, ``quotes:dashboard``, ...).
+
+    Запросы считаются через ``execute_wrapper`` на всех подключениях.
+    Потоковые ответы (экспорт, SSE) замеряются до закрытия ответа, то есть
+    вместе с запросами при отдаче тела. При QUOTES_SERVER_TIMING добавляет
+    заголовок ``Server-Timing``, который видно во вкладке Network браузера;
+    у потоковых ответов заголовок уходит раньше тела, поэтому его нет.
+
+    Работает и в синхронной, и в асинхронной цепочке: под ASGI async-view
+    не переводятся в поток.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        timer, started, stack = self._start()
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            stack.close()
+            raise
+        return self._finish(request, response, timer, started, stack)
+
+    async def __acall__(self, request):
+        timer, started, stack = self._start()
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            stack.close()
+            raise
+        return self._finish(request, response, timer, started, stack)
+
+    @staticmethod
+    def _start():
+        timer = QueryTimer()
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(timer))
+        return timer, time.perf_counter(), stack
+
+    def _finish(self, request, response, timer, started, stack):
+        def record():
+            stack.close()
+            duration = time.perf_counter() - started
+            match = request.resolver_match
+            view_name = match.view_name if match else "<unresolved>"
+            request_metrics.record(view_name, duration, timer.count, timer.duration)
+            return duration
+
+        if response.streaming:
+            response._resource_closers.append(record)
+            return response
+        duration = record()
+        if settings.QUOTES_SERVER_TIMING:
+            response["Server-Timing"] = (
+                f'db;dur={timer.duration * 1000:.1f};desc="{timer.count} queries", '
+                f"total;dur={duration * 1000:.1f}"
+            )
+        return response
+
+
+class ReplicaPinMiddleware:
+    """
+    Закрепляет чтения клиента за основной БД после изменяющего запроса
+    (голос, сохранение в админке), пока реплика может отставать: ставит
+    cookie на DB_REPLICA_PIN_SECONDS и, пока она есть, направляет чтения
+    в ``default``. Без реплики ничего не делает. Закрепление хранится в
+    contextvar, поэтому работает и в асинхронной цепочке.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        with primary_pin_scope(PIN_COOKIE in request.COOKIES):
+            response = self.get_response(request)
+        return self._pin(request, response)
+
+    async def __acall__(self, request):
+        with primary_pin_scope(PIN_COOKIE in request.COOKIES):
+            response = await self.get_response(request)
+        return self._pin(request, response)
+
+    @staticmethod
+    def _pin(request, response):
+        if request.method not in SAFE_METHODS and replica_configured():
+            response.set_cookie(
+                PIN_COOKIE,
+                "1",
+                max_age=settings.DB_REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
@@ -0,0 +1,38 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("quotes", "0003_alter_quote_weight"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DashboardSnapshot",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("total_quotes", models.PositiveBigIntegerField(default=0)),
+                ("total_sources", models.PositiveBigIntegerField(default=0)),
+                ("total_likes", models.PositiveBigIntegerField(default=0)),
+                ("total_views", models.PositiveBigIntegerField(default=0)),
+                ("top_by_likes", models.JSONField(default=list)),
+                ("top_by_views", models.JSONField(default=list)),
+                ("most_recent", models.JSONField(default=list)),
+                ("version", models.PositiveBigIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "Снимок дашборда",
+                "verbose_name_plural": "Снимки дашборда",
+            },
+        ),
+    ]
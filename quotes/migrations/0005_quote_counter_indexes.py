@@ -0,0 +1,23 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("quotes", "0004_dashboardsnapshot"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="quote",
+            index=models.Index(fields=["likes", "id"], name="quote_likes_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="quote",
+            index=models.Index(fields=["views", "id"], name="quote_views_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="quote",
+            index=models.Index(fields=["created_at"], name="quote_created_at_idx"),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("quotes", "0005_quote_counter_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="quote",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, verbose_name="Дата изменения"),
+        ),
+    ]
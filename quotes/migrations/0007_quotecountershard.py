@@ -0,0 +1,46 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("quotes", "0006_quote_updated_at"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="QuoteCounterShard",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("shard", models.PositiveSmallIntegerField()),
+                ("likes", models.PositiveIntegerField(default=0)),
+                ("dislikes", models.PositiveIntegerField(default=0)),
+                ("views", models.PositiveIntegerField(default=0)),
+                (
+                    "quote",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="counter_shards",
+                        to="quotes.quote",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Шард счетчиков",
+                "verbose_name_plural": "Шарды счетчиков",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("quote", "shard"), name="quote_counter_shard_unique"
+                    )
+                ],
+            },
+        ),
+    ]
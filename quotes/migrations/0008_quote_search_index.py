@@ -0,0 +1,73 @@
+from django.db import migrations
+
+# Полнотекстовый индекс цитат в SQLite (FTS5): rowid строки - id цитаты.
+# Индекс поддерживается триггерами, поэтому в него попадают и
+# bulk_create, и изменения через update().
+FORWARD_SQL = [
+    """
+    CREATE VIRTUAL TABLE quotes_quote_fts USING fts5(
+        text, source, tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    INSERT INTO quotes_quote_fts (rowid, text, source)
+    SELECT q.id, q.text, s.name
+    FROM quotes_quote q JOIN quotes_source s ON s.id = q.source_id
+    """,
+    """
+    CREATE TRIGGER quotes_quote_fts_insert AFTER INSERT ON quotes_quote BEGIN
+        INSERT INTO quotes_quote_fts (rowid, text, source)
+        SELECT new.id, new.text, name FROM quotes_source WHERE id = new.source_id;
+    END
+    """,
+    """
+    CREATE TRIGGER quotes_quote_fts_update AFTER UPDATE OF text, source_id
+    ON quotes_quote
+    WHEN old.text IS NOT new.text OR old.source_id IS NOT new.source_id BEGIN
+        DELETE FROM quotes_quote_fts WHERE rowid = old.id;
+        INSERT INTO quotes_quote_fts (rowid, text, source)
+        SELECT new.id, new.text, name FROM quotes_source WHERE id = new.source_id;
+    END
+    """,
+    """
+    CREATE TRIGGER quotes_quote_fts_delete AFTER DELETE ON quotes_quote BEGIN
+        DELETE FROM quotes_quote_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER quotes_source_fts_update AFTER UPDATE OF name ON quotes_source
+    WHEN old.name IS NOT new.name BEGIN
+        UPDATE quotes_quote_fts SET source = new.name
+        WHERE rowid IN (SELECT id FROM quotes_quote WHERE source_id = new.id);
+    END
+    """,
+]
+
+BACKWARD_SQL = [
+    "DROP TRIGGER IF EXISTS quotes_source_fts_update",
+    "DROP TRIGGER IF EXISTS quotes_quote_fts_delete",
+    "DROP TRIGGER IF EXISTS quotes_quote_fts_update",
+    "DROP TRIGGER IF EXISTS quotes_quote_fts_insert",
+    "DROP TABLE IF EXISTS quotes_quote_fts",
+]
+
+
+def _run(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != "sqlite":
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("quotes", "0007_quotecountershard"),
+    ]
+
+    operations = [
+        migrations.RunPython(_run(FORWARD_SQL), _run(BACKWARD_SQL)),
+    ]
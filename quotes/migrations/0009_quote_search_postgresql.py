@@ -0,0 +1,95 @@
+from django.db import migrations
+
+# Полнотекстовый индекс цитат в PostgreSQL: tsvector по словарям russian и
+# english под GIN-индексом. Текст цитаты весит больше (A) названия
+# источника (B). Как и FTS5 в SQLite (0008), поддерживается триггерами.
+FORWARD_SQL = [
+    """
+    CREATE TABLE quotes_quote_fts (
+        quote_id integer PRIMARY KEY,
+        document tsvector NOT NULL
+    )
+    """,
+    "CREATE INDEX quotes_quote_fts_document ON quotes_quote_fts USING GIN (document)",
+    """
+    CREATE FUNCTION quotes_quote_fts_document(quote_text text, source_name text)
+    RETURNS tsvector AS $$
+        SELECT setweight(to_tsvector('russian', quote_text), 'A')
+            || setweight(to_tsvector('english', quote_text), 'A')
+            || setweight(to_tsvector('russian', coalesce(source_name, '')), 'B')
+            || setweight(to_tsvector('english', coalesce(source_name, '')), 'B')
+    $$ LANGUAGE sql IMMUTABLE
+    """,
+    """
+    CREATE FUNCTION quotes_quote_fts_sync() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            DELETE FROM quotes_quote_fts WHERE quote_id = OLD.id;
+        ELSE
+            INSERT INTO quotes_quote_fts (quote_id, document)
+            SELECT NEW.id, quotes_quote_fts_document(NEW.text, name)
+            FROM quotes_source WHERE id = NEW.source_id
+            ON CONFLICT (quote_id) DO UPDATE SET document = excluded.document;
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER quotes_quote_fts_sync
+    AFTER INSERT OR DELETE OR UPDATE OF text, source_id ON quotes_quote
+    FOR EACH ROW EXECUTE FUNCTION quotes_quote_fts_sync()
+    """,
+    """
+    CREATE FUNCTION quotes_source_fts_sync() RETURNS trigger AS $$
+    BEGIN
+        UPDATE quotes_quote_fts f
+        SET document = quotes_quote_fts_document(q.text, NEW.name)
+        FROM quotes_quote q
+        WHERE q.source_id = NEW.id AND f.quote_id = q.id;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER quotes_source_fts_sync
+    AFTER UPDATE OF name ON quotes_source
+    FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name)
+    EXECUTE FUNCTION quotes_source_fts_sync()
+    """,
+    """
+    INSERT INTO quotes_quote_fts (quote_id, document)
+    SELECT q.id, quotes_quote_fts_document(q.text, s.name)
+    FROM quotes_quote q JOIN quotes_source s ON s.id = q.source_id
+    """,
+]
+
+BACKWARD_SQL = [
+    "DROP TRIGGER IF EXISTS quotes_source_fts_sync ON quotes_source",
+    "DROP TRIGGER IF EXISTS quotes_quote_fts_sync ON quotes_quote",
+    "DROP FUNCTION IF EXISTS quotes_source_fts_sync()",
+    "DROP FUNCTION IF EXISTS quotes_quote_fts_sync()",
+    "DROP FUNCTION IF EXISTS quotes_quote_fts_document(text, text)",
+    "DROP TABLE IF EXISTS quotes_quote_fts",
+]
+
+
+def _run(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != "postgresql":
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("quotes", "0008_quote_search_index"),
+    ]
+
+    operations = [
+        migrations.RunPython(_run(FORWARD_SQL), _run(BACKWARD_SQL)),
+    ]
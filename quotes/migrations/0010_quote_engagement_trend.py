@@ -0,0 +1,82 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("quotes", "0009_quote_search_postgresql"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="QuoteTrend",
+            fields=[
+                (
+                    "quote",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="trend",
+                        serialize=False,
+                        to="quotes.quote",
+                    ),
+                ),
+                ("log_score", models.FloatField(null=True)),
+            ],
+            options={
+                "verbose_name": "Тренд цитаты",
+                "verbose_name_plural": "Тренды цитат",
+                "indexes": [
+                    models.Index(fields=["-log_score"], name="quote_trend_score_idx")
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="QuoteEngagement",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "period",
+                    models.CharField(
+                        choices=[("hour", "Час"), ("day", "День")], max_length=4
+                    ),
+                ),
+                ("bucket", models.DateTimeField(verbose_name="Начало периода")),
+                ("likes", models.PositiveIntegerField(default=0)),
+                ("dislikes", models.PositiveIntegerField(default=0)),
+                ("views", models.PositiveIntegerField(default=0)),
+                (
+                    "quote",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="engagement",
+                        to="quotes.quote",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Сводка вовлеченности",
+                "verbose_name_plural": "Сводки вовлеченности",
+                "indexes": [
+                    models.Index(
+                        fields=["period", "bucket"], name="quote_engagement_bucket_idx"
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("quote", "period", "bucket"),
+                        name="quote_engagement_unique",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,104 @@
+from django.db import migrations, models
+
+# Типы источников начальных цитат из 0002_load_initial_quotes.
+INITIAL_KINDS = {
+    "movie": [
+        "Крёстный отец",
+        "Терминатор",
+        "Терминатор 2: Судный день",
+        "Форрест Гамп",
+        "Волшебник страны Оз",
+        "Бойцовский клуб",
+        "Сияние",
+        "Уолл-стрит",
+        "Титаник",
+        "Один дома",
+    ],
+    "book": [
+        "Мастер и Маргарита",
+        "Гарри Поттер и философский камень",
+        "Три мушкетера",
+        "Евгений Онегин",
+        "Богатый папа, бедный папа",
+    ],
+    "series": ["Друзья"],
+}
+
+
+# В SQLite AddField пересоздает таблицу quotes_source, а триггеры
+# полнотекстового индекса (0008) ссылаются на нее: на время миграции они
+# удаляются и затем создаются заново.
+FTS_TRIGGERS_SQL = [
+    """
+    CREATE TRIGGER quotes_quote_fts_insert AFTER INSERT ON quotes_quote BEGIN
+        INSERT INTO quotes_quote_fts (rowid, text, source)
+        SELECT new.id, new.text, name FROM quotes_source WHERE id = new.source_id;
+    END
+    """,
+    """
+    CREATE TRIGGER quotes_quote_fts_update AFTER UPDATE OF text, source_id
+    ON quotes_quote
+    WHEN old.text IS NOT new.text OR old.source_id IS NOT new.source_id BEGIN
+        DELETE FROM quotes_quote_fts WHERE rowid = old.id;
+        INSERT INTO quotes_quote_fts (rowid, text, source)
+        SELECT new.id, new.text, name FROM quotes_source WHERE id = new.source_id;
+    END
+    """,
+    """
+    CREATE TRIGGER quotes_source_fts_update AFTER UPDATE OF name ON quotes_source
+    WHEN old.name IS NOT new.name BEGIN
+        UPDATE quotes_quote_fts SET source = new.name
+        WHERE rowid IN (SELECT id FROM quotes_quote WHERE source_id = new.id);
+    END
+    """,
+]
+
+DROP_FTS_TRIGGERS_SQL = [
+    "DROP TRIGGER IF EXISTS quotes_source_fts_update",
+    "DROP TRIGGER IF EXISTS quotes_quote_fts_update",
+    "DROP TRIGGER IF EXISTS quotes_quote_fts_insert",
+]
+
+
+def _run(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != "sqlite":
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+
+    return run
+
+
+def set_initial_kinds(apps, schema_editor):
+    Source = apps.get_model("quotes", "Source")
+    for kind, names in INITIAL_KINDS.items():
+        Source.objects.filter(name__in=names).update(kind=kind)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("quotes", "0010_quote_engagement_trend"),
+    ]
+
+    operations = [
+        migrations.RunPython(_run(DROP_FTS_TRIGGERS_SQL), _run(FTS_TRIGGERS_SQL)),
+        migrations.AddField(
+            model_name="source",
+            name="kind",
+            field=models.CharField(
+                choices=[
+                    ("movie", "Фильм"),
+                    ("book", "Книга"),
+                    ("series", "Сериал"),
+                    ("other", "Другое"),
+                ],
+                default="other",
+                max_length=16,
+                verbose_name="Тип",
+            ),
+        ),
+        migrations.RunPython(set_initial_kinds, migrations.RunPython.noop),
+        migrations.RunPython(_run(FTS_TRIGGERS_SQL), _run(DROP_FTS_TRIGGERS_SQL)),
+    ]
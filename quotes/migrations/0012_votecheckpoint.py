@@ -0,0 +1,25 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("quotes", "0011_source_kind"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="VoteCheckpoint",
+            fields=[
+                (
+                    "writer",
+                    models.CharField(max_length=32, primary_key=True, serialize=False),
+                ),
+                ("last_seq", models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                "verbose_name": "Позиция журнала голосов",
+                "verbose_name_plural": "Позиции журналов голосов",
+            },
+        ),
+    ]
@@ -1,4 +1,13 @@
-from django.db import models
+import math
+import random
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections, models, transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, Now
+from django.db.models.query import ModelIterable
+from django.db.models.sql import UpdateQuery
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
 
@@ -6,9 +15,23 @@ from django.core.validators import MinValueValidator, MaxValueValidator
 class Source(models.Model):
     """Источник цитаты (фильм, книга и т.д.)."""
 
+    MOVIE = "movie"
+    BOOK = "book"
+    SERIES = "series"
+    OTHER = "other"
+    KIND_CHOICES = [
+        (MOVIE, "Фильм"),
+        (BOOK, "Книга"),
+        (SERIES, "Сериал"),
+        (OTHER, "Другое"),
+    ]
+
     name = models.CharField(
         max_length=255, unique=True, verbose_name="Название источника"
     )
+    kind = models.CharField(
+        max_length=16, choices=KIND_CHOICES, default=OTHER, verbose_name="Тип"
+    )
 
     def __str__(self):
         return self.name
@@ -18,12 +41,145 @@ class Source(models.Model):
         verbose_name_plural = "Источники"
 
 
+COUNTER_FIELDS = ("likes", "dislikes", "views")
+
+
+def counters_sharded():
+    """Включен ли режим QUOTES_COUNTER_MODE = "sharded"."""
+    return settings.QUOTES_COUNTER_MODE == "sharded"
+
+
+def _shards_sum(field):
+    shards = (
+        QuoteCounterShard.objects.filter(quote=OuterRef("pk"))
+        .order_by()
+        .values("quote")
+        .annotate(total=Sum(field))
+        .values("total")
+    )
+    return Coalesce(Subquery(shards), 0)
+
+
+def counter_expression(field):
+    """
+    Полное значение счетчика цитаты: колонка ``Quote``, а в режиме sharded -
+    плюс еще не свернутые в нее шарды.
+    """
+    if not counters_sharded():
+        return F(field)
+    return F(field) + _shards_sum(field)
+
+
+class ShardedCountersIterable(ModelIterable):
+    """Прибавляет к счетчикам цитат суммы шардов из аннотаций ``*_in_shards``."""
+
+    def __iter__(self):
+        for obj in super().__iter__():
+            for field in COUNTER_FIELDS:
+                setattr(
+                    obj, field, getattr(obj, field) + getattr(obj, f"{field}_in_shards")
+                )
+            yield obj
+
+
+def supports_update_returning(connection):
+    """Поддерживает ли бэкенд UPDATE ... RETURNING (SQLite >= 3.35, PostgreSQL)."""
+    if connection.vendor == "postgresql":
+        return True
+    if connection.vendor == "sqlite":
+        return connection.features.can_return_columns_from_insert
+    return False
+
+
 class QuoteQuerySet(models.QuerySet):
     def update_and_get(self, **kwargs):
-        rows_updated = self.update(**kwargs)
-        if rows_updated > 0:
-            return self.first()
-        return None
+        """
+        Обновляет строки и возвращает одну из обновленных цитат (или None).
+
+        Где возможно, обновление и чтение выполняются одним запросом
+        UPDATE ... RETURNING, иначе - UPDATE и SELECT в одной транзакции.
+        """
+        self._for_write = True
+        connection = connections[self.db]
+        query = self.query.chain(UpdateQuery)
+        query.add_update_values(kwargs)
+        query.clear_select_clause()
+        query.clear_ordering(force=True)
+
+        if (
+            not supports_update_returning(connection)
+            or query.related_updates
+            or counters_sharded()
+        ):
+            # В режиме sharded цитату нужно перечитать вместе с шардами.
+            with transaction.atomic(using=self.db):
+                if self.update(**kwargs) > 0:
+                    return self.with_counters().order_by("pk").first()
+            return None
+
+        update_sql, params = query.get_compiler(self.db).as_sql()
+        fields = self.model._meta.concrete_fields
+        returning = ", ".join(connection.ops.quote_name(f.column) for f in fields)
+        with transaction.mark_for_rollback_on_error(using=self.db):
+            with connection.cursor() as cursor:
+                cursor.execute(f"{update_sql} RETURNING {returning}", params)
+                rows = cursor.fetchall()
+        if not rows:
+            return None
+        return self._instance_from_row(connection, fields, rows[0])
+
+    def with_counters(self):
+        """
+        В режиме sharded прибавляет к счетчикам загруженных цитат суммы шардов.
+        Только для чтения: сохранение такой цитаты целиком учло бы шарды
+        дважды.
+        """
+        if not counters_sharded():
+            return self
+        queryset = self.annotate(
+            **{f"{field}_in_shards": _shards_sum(field) for field in COUNTER_FIELDS}
+        )
+        queryset._iterable_class = ShardedCountersIterable
+        return queryset
+
+    def increment(self, **counters):
+        """
+        Атомарно увеличивает счетчики, например ``increment(likes=1)``,
+        и возвращает обновленную цитату.
+
+        В режиме sharded строка цитаты не меняется: прирост уходит в
+        случайный из QUOTES_COUNTER_SHARDS шардов.
+        """
+        if counters_sharded():
+            with transaction.atomic(using=self.db):
+                if not QuoteCounterShard.objects.add(
+                    self.order_by().values("pk"), **counters
+                ):
+                    return None
+                return self.with_counters().order_by("pk").first()
+        return self.update_and_get(
+            updated_at=Now(),
+            **{field: F(field) + delta for field, delta in counters.items()},
+        )
+
+    async def aincrement(self, **counters):
+        """
+        Асинхронный ``increment``. UPDATE ... RETURNING выполняется через
+        курсор, поэтому запрос уходит в поток синхронного адаптера.
+        """
+        return await sync_to_async(self.increment)(**counters)
+
+    def _instance_from_row(self, connection, fields, row):
+        values = []
+        for field, value in zip(fields, row):
+            col = field.get_col(self.model._meta.db_table)
+            converters = connection.ops.get_db_converters(
+                col
+            ) + field.get_db_converters(connection)
+            for converter in converters:
+                value = converter(value, col, connection)
+            values.append(value)
+        return self.model.from_db(self.db, [f.attname for f in fields], values)
 
 
 class Quote(models.Model):
@@ -44,6 +200,7 @@ class Quote(models.Model):
     dislikes = models.PositiveIntegerField(default=0, verbose_name="Дизлайки")
     views = models.PositiveIntegerField(default=0, verbose_name="Просмотры")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата изменения")
 
     objects = QuoteQuerySet.as_manager()
 
@@ -70,3 +227,288 @@ class Quote(models.Model):
         verbose_name = "Цитата"
         verbose_name_plural = "Цитаты"
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["likes", "id"], name="quote_likes_id_idx"),
+            models.Index(fields=["views", "id"], name="quote_views_id_idx"),
+            models.Index(fields=["created_at"], name="quote_created_at_idx"),
+        ]
+
+
+class QuoteCounterShardQuerySet(models.QuerySet):
+    def _upsert_sql(self, quote_filter):
+        """
+        INSERT ... SELECT ... ON CONFLICT DO UPDATE, прибавляющий счетчики
+        к шарду. Строка берется из ``quotes_quote``, поэтому для удаленной
+        цитаты ничего не вставляется.
+        """
+        connection = connections[self.db]
+        qn = connection.ops.quote_name
+        table = qn(self.model._meta.db_table)
+        quote_table = qn(Quote._meta.db_table)
+        columns = ", ".join(qn(field) for field in COUNTER_FIELDS)
+        updates = ", ".join(
+            f"{qn(field)} = {table}.{qn(field)} + excluded.{qn(field)}"
+            for field in COUNTER_FIELDS
+        )
+        return (
+            f"INSERT INTO {table} ({qn('quote_id')}, {qn('shard')}, {columns}) "
+            f"SELECT {quote_table}.{qn('id')}, %s, %s, %s, %s FROM {quote_table} "
+            f"WHERE {quote_table}.{qn('id')} {quote_filter} "
+            f"ON CONFLICT ({qn('quote_id')}, {qn('shard')}) DO UPDATE SET {updates}"
+        )
+
+    def _deltas(self, counters):
+        return [counters.get(field, 0) for field in COUNTER_FIELDS]
+
+    def _random_shard(self):
+        return random.randrange(settings.QUOTES_COUNTER_SHARDS)
+
+    def add(self, quotes, **counters):
+        """
+        Прибавляет ``counters`` к случайному шарду цитат из queryset
+        ``quotes`` (``values("pk")``). Возвращает число затронутых цитат.
+        """
+        subquery, params = quotes.query.sql_with_params()
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(
+                self._upsert_sql(f"IN ({subquery})"),
+                [self._random_shard(), *self._deltas(counters), *params],
+            )
+            return cursor.rowcount
+
+    def add_many(self, field, increments):
+        """Прибавляет ``{id цитаты: прирост}`` к полю ``field`` одним executemany."""
+        with connections[self.db].cursor() as cursor:
+            cursor.executemany(
+                self._upsert_sql("= %s"),
+                [
+                    [self._random_shard(), *self._deltas({field: delta}), quote_id]
+                    for quote_id, delta in increments.items()
+                ],
+            )
+
+
+class QuoteCounterShard(models.Model):
+    """
+    Шард счетчиков цитаты для режима QUOTES_COUNTER_MODE = "sharded".
+
+    Голоса и просмотры популярной цитаты распределяются по нескольким
+    строкам, чтобы не конкурировать за блокировку одной строки ``Quote``.
+    Команда ``compact_counters`` периодически сворачивает шарды в ``Quote``.
+    """
+
+    quote = models.ForeignKey(
+        Quote, on_delete=models.CASCADE, related_name="counter_shards"
+    )
+    shard = models.PositiveSmallIntegerField()
+    likes = models.PositiveIntegerField(default=0)
+    dislikes = models.PositiveIntegerField(default=0)
+    views = models.PositiveIntegerField(default=0)
+
+    objects = QuoteCounterShardQuerySet.as_manager()
+
+    def __str__(self):
+        return f"Шард {self.shard} цитаты {self.quote_id}"
+
+    class Meta:
+        verbose_name = "Шард счетчиков"
+        verbose_name_plural = "Шарды счетчиков"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["quote", "shard"], name="quote_counter_shard_unique"
+            )
+        ]
+
+
+class QuoteEngagementQuerySet(models.QuerySet):
+    def add_many(self, period, bucket, rows):
+        """
+        Прибавляет ``{id цитаты: {поле: прирост}}`` к сводкам ``period`` за
+        ``bucket`` одним executemany INSERT ... ON CONFLICT DO UPDATE.
+        Для удаленных цитат ничего не вставляется.
+        """
+        connection = connections[self.db]
+        qn = connection.ops.quote_name
+        table = qn(self.model._meta.db_table)
+        quote_table = qn(Quote._meta.db_table)
+        columns = ", ".join(qn(field) for field in COUNTER_FIELDS)
+        updates = ", ".join(
+            f"{qn(field)} = {table}.{qn(field)} + excluded.{qn(field)}"
+            for field in COUNTER_FIELDS
+        )
+        sql = (
+            f"INSERT INTO {table} ({qn('quote_id')}, {qn('period')}, "
+            f"{qn('bucket')}, {columns}) "
+            f"SELECT {qn('id')}, %s, %s, %s, %s, %s FROM {quote_table} "
+            f"WHERE {qn('id')} = %s "
+            f"ON CONFLICT ({qn('quote_id')}, {qn('period')}, {qn('bucket')}) "
+            f"DO UPDATE SET {updates}"
+        )
+        bucket = connection.ops.adapt_datetimefield_value(bucket)
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                sql,
+                [
+                    [period, bucket, *(deltas.get(f, 0) for f in COUNTER_FIELDS), pk]
+                    for pk, deltas in rows.items()
+                ],
+            )
+
+
+class QuoteEngagement(models.Model):
+    """
+    Сводка голосов и просмотров цитаты за час или день (см.
+    ``quotes.engagement``).
+    """
+
+    HOUR = "hour"
+    DAY = "day"
+    PERIOD_CHOICES = [(HOUR, "Час"), (DAY, "День")]
+
+    quote = models.ForeignKey(
+        Quote, on_delete=models.CASCADE, related_name="engagement"
+    )
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    bucket = models.DateTimeField(verbose_name="Начало периода")
+    likes = models.PositiveIntegerField(default=0)
+    dislikes = models.PositiveIntegerField(default=0)
+    views = models.PositiveIntegerField(default=0)
+
+    objects = QuoteEngagementQuerySet.as_manager()
+
+    def __str__(self):
+        return f"Вовлеченность цитаты {self.quote_id} за {self.bucket}"
+
+    class Meta:
+        verbose_name = "Сводка вовлеченности"
+        verbose_name_plural = "Сводки вовлеченности"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["quote", "period", "bucket"],
+                name="quote_engagement_unique",
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["period", "bucket"], name="quote_engagement_bucket_idx"
+            ),
+        ]
+
+
+def log2_add(a, b):
+    """``log2(2 ** a + 2 ** b)`` без переполнения; ``a`` может быть None."""
+    if a is None:
+        return b
+    high, low = max(a, b), min(a, b)
+    return high + math.log2(1 + 2 ** (low - high))
+
+
+class QuoteTrendQuerySet(models.QuerySet):
+    def add_many(self, contributions):
+        """
+        Прибавляет к очкам цитат вклады ``{id цитаты: log2 вклада}``.
+
+        Пустые строки для новых цитат вставляются заранее (ON CONFLICT DO
+        NOTHING), чтобы все строки пачки можно было прочитать под
+        ``select_for_update`` и параллельные записи не теряли вклады.
+        """
+        connection = connections[self.db]
+        qn = connection.ops.quote_name
+        table = qn(self.model._meta.db_table)
+        quote_table = qn(Quote._meta.db_table)
+        with transaction.atomic(using=self.db):
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    f"INSERT INTO {table} ({qn('quote_id')}, {qn('log_score')}) "
+                    f"SELECT {qn('id')}, NULL FROM {quote_table} "
+                    f"WHERE {qn('id')} = %s ON CONFLICT ({qn('quote_id')}) DO NOTHING",
+                    [[quote_id] for quote_id in contributions],
+                )
+            current = (
+                self.select_for_update()
+                .filter(quote_id__in=list(contributions))
+                .values_list("quote_id", "log_score")
+            )
+            self.bulk_update(
+                [
+                    self.model(
+                        quote_id=quote_id,
+                        log_score=log2_add(score, contributions[quote_id]),
+                    )
+                    for quote_id, score in current
+                ],
+                ["log_score"],
+            )
+
+
+class QuoteTrend(models.Model):
+    """
+    Очки тренда цитаты в виде forward decay: ``log_score`` - log2 суммы
+    взвешенных событий, умноженных на ``2 ** (часы / период полураспада)``
+    (см. ``quotes.engagement``). Пустое значение бывает только внутри
+    транзакции записи.
+    """
+
+    quote = models.OneToOneField(
+        Quote, on_delete=models.CASCADE, primary_key=True, related_name="trend"
+    )
+    log_score = models.FloatField(null=True)
+
+    objects = QuoteTrendQuerySet.as_manager()
+
+    def __str__(self):
+        return f"Тренд цитаты {self.quote_id}"
+
+    class Meta:
+        verbose_name = "Тренд цитаты"
+        verbose_name_plural = "Тренды цитат"
+        indexes = [
+            models.Index(fields=["-log_score"], name="quote_trend_score_idx"),
+        ]
+
+
+class DashboardSnapshot(models.Model):
+    """
+    Предрассчитанные данные дашборда: KPI и id цитат для топов.
+
+    Хранится единственная строка, которая обновляется инкрементально при
+    голосах, просмотрах и изменениях в админке (см. ``quotes.snapshot``).
+    Топы хранятся парами [id цитаты, значение счетчика].
+    """
+
+    SINGLETON_PK = 1
+
+    total_quotes = models.PositiveBigIntegerField(default=0)
+    total_sources = models.PositiveBigIntegerField(default=0)
+    total_likes = models.PositiveBigIntegerField(default=0)
+    total_views = models.PositiveBigIntegerField(default=0)
+    top_by_likes = models.JSONField(default=list)
+    top_by_views = models.JSONField(default=list)
+    most_recent = models.JSONField(default=list)
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Снимок дашборда v{self.version}"
+
+    class Meta:
+        verbose_name = "Снимок дашборда"
+        verbose_name_plural = "Снимки дашборда"
+
+
+class VoteCheckpoint(models.Model):
+    """
+    Последний записанный в БД номер голоса из журнала процесса в режиме
+    QUOTES_VOTE_MODE = "journal" (см. ``quotes.votes``): голоса с номером не
+    больше ``last_seq`` при повторной обработке журнала пропускаются.
+    """
+
+    writer = models.CharField(max_length=32, primary_key=True)
+    last_seq = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"Журнал голосов {self.writer}: {self.last_seq}"
+
+    class Meta:
+        verbose_name = "Позиция журнала голосов"
+        verbose_name_plural = "Позиции журналов голосов"
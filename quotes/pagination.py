@@ -0,0 +1,128 @@
+from django.db.models import Q
+
+NEXT = "a"
+PREVIOUS = "b"
+
+
+class KeysetPage:
+    """
+    Страница keyset-пагинации.
+
+    Повторяет интерфейс ``django.core.paginator.Page``, который использует
+    шаблон ``includes/pagination.html``: вместо номеров страниц
+    ``previous_page_number``/``next_page_number`` возвращают курсоры.
+    """
+
+    def __init__(self, object_list, paginator, has_previous, has_next):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_previous = has_previous
+        self._has_next = has_next
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_next(self):
+        return self._has_next
+
+    def has_other_pages(self):
+        return self._has_previous or self._has_next
+
+    def previous_page_number(self):
+        return self.paginator.make_cursor(PREVIOUS, self.object_list[0])
+
+    def next_page_number(self):
+        return self.paginator.make_cursor(NEXT, self.object_list[-1])
+
+
+class KeysetPaginator:
+    """
+    Пагинация по убыванию ``(field, id)`` без OFFSET и COUNT(*).
+
+    Страница выбирается условием ``(field, id) < (значение, id)`` по
+    курсору. Оно записано как ``field <= v AND (field < v OR id < pk)``:
+    первая часть задает диапазон индекса на ``(field, id)``, поэтому любая
+    страница стоит столько же, сколько первая. Курсор имеет вид
+    ``a<значение>.<id>`` (следующая страница) или ``b<значение>.<id>``
+    (предыдущая).
+    """
+
+    page_range = ()
+
+    def __init__(self, queryset, field, per_page, value_attr=None):
+        self.queryset = queryset
+        self.field = field
+        self.per_page = per_page
+        # Атрибут со значением колонки ``field``, если сам атрибут объекта
+        # его не содержит (например, счетчики с шардами из with_counters).
+        self.value_attr = value_attr or field
+
+    def make_cursor(self, direction, obj):
+        return f"{direction}{getattr(obj, self.value_attr)}.{obj.pk}"
+
+    def parse_cursor(self, cursor):
+        """Возвращает (направление, значение, id) или None для первой страницы."""
+        if not cursor or cursor[0] not in (NEXT, PREVIOUS):
+            return None
+        value, _, pk = cursor[1:].partition(".")
+        if not (value.isdigit() and pk.isdigit()):
+            return None
+        return cursor[0], int(value), int(pk)
+
+    def _page_query(self, cursor):
+        """Возвращает (направление, queryset страницы с одной лишней строкой)."""
+        parsed = self.parse_cursor(cursor)
+        field = self.field
+        if parsed is None:
+            queryset = self.queryset.order_by(f"-{field}", "-id")
+            return None, queryset[: self.per_page + 1]
+
+        direction, value, pk = parsed
+        # Внешнее условие по одному полю дает диапазон по индексу; форма
+        # ``field < v OR (field = v AND id < pk)`` план SQLite превращает в
+        # MULTI-INDEX OR с сортировкой всех оставшихся строк.
+        if direction == NEXT:
+            condition = Q(**{f"{field}__lte": value}) & (
+                Q(**{f"{field}__lt": value}) | Q(id__lt=pk)
+            )
+            ordering = (f"-{field}", "-id")
+        else:
+            condition = Q(**{f"{field}__gte": value}) & (
+                Q(**{f"{field}__gt": value}) | Q(id__gt=pk)
+            )
+            ordering = (field, "id")
+        queryset = self.queryset.filter(condition).order_by(*ordering)
+        return direction, queryset[: self.per_page + 1]
+
+    def page(self, cursor=None):
+        direction, queryset = self._page_query(cursor)
+        rows = list(queryset)
+        if direction is not None and not rows:
+            # Устаревший курсор: за ним больше нет цитат.
+            return self.page()
+        return self._make_page(direction, rows)
+
+    async def apage(self, cursor=None):
+        direction, queryset = self._page_query(cursor)
+        rows = [obj async for obj in queryset]
+        if direction is not None and not rows:
+            return await self.apage()
+        return self._make_page(direction, rows)
+
+    def _make_page(self, direction, rows):
+        if direction is None:
+            return KeysetPage(
+                rows[: self.per_page], self, False, len(rows) > self.per_page
+            )
+        has_more = len(rows) > self.per_page
+        rows = rows[: self.per_page]
+        if direction == NEXT:
+            return KeysetPage(rows, self, True, has_more)
+        rows.reverse()
+        return KeysetPage(rows, self, has_more, True)
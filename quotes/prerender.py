@@ -0,0 +1,245 @@
+"""
+Статические копии дашборда и страниц цитат для раздачи через CDN или
+nginx без Django.
+
+Команда ``prerender`` пишет в QUOTES_PRERENDER_DIR:
+
+* ``dashboard/index.html`` - первые страницы обоих топов;
+* ``dashboard/page_likes-<n>.html`` и ``dashboard/page_views-<n>.html`` -
+  страницы топов, на которые ведет пагинация (в режиме snapshot);
+* ``quote/<id>/index.html`` - страница каждой цитаты.
+
+Ссылки пагинации (``?page_likes=2``) переписываются на эти файлы
+(``page_likes-2.html``), курсоры keyset-пагинации - на динамический
+дашборд. Рядом с каждой страницей лежит сжатая копия ``.gz`` (для
+gzip_static).
+Файлы заменяются атомарно через ``os.replace``. В ``manifest.json``
+хранится отпечаток данных каждой страницы: счетчики, даты изменения и
+источники показанных цитат, KPI. Страница перерисовывается, только если
+отпечаток изменился; страницы удаленных цитат удаляются.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import re
+import tempfile
+from collections import Counter
+
+from django.conf import settings
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.safestring import mark_safe
+
+from .engagement import trending
+from .models import COUNTER_FIELDS, Quote
+from .snapshot import get_snapshot
+from .views import (
+    DASHBOARD_PAGE_SIZE,
+    TRENDING_SIZE,
+    _build_dashboard_context,
+    _dashboard_context,
+    _resolve_pages,
+    _snapshot_pages,
+)
+
+MANIFEST_NAME = "manifest.json"
+CHUNK_SIZE = 2000
+_PAGE_LINK_RE = re.compile(r'href="\?(page_likes|page_views)=([^"&]+)"')
+
+
+def _quote_state(quote):
+    """Все, что страница показывает о цитате."""
+    return [
+        quote.id,
+        quote.updated_at.isoformat(),
+        quote.source.name,
+        *(getattr(quote, field) for field in COUNTER_FIELDS),
+        round(getattr(quote, "trend_score", 0), 1),
+    ]
+
+
+def _digest(data):
+    encoded = json.dumps(data, sort_keys=True, default=str).encode()
+    return hashlib.sha1(encoded, usedforsecurity=False).hexdigest()
+
+
+def _dashboard_digest(context):
+    pages = [context["top_by_likes_page"], context["top_by_views_page"]]
+    lists = [*(page.object_list for page in pages), context["most_recent"]]
+    return _digest(
+        [
+            [context[key] for key in ("total_quotes", "total_sources")],
+            [context[key] for key in ("total_likes", "total_views")],
+            # Число страниц меняет ссылки пагинации.
+            [list(page.paginator.page_range) for page in pages],
+            [page.has_next() for page in pages],
+            [[_quote_state(quote) for quote in quotes] for quotes in lists],
+            [_quote_state(quote) for quote in context["trending"]],
+            context["live_updates"],
+        ]
+    )
+
+
+def dashboard_pages():
+    """
+    Пары (путь, контекст) страниц дашборда. Снимок, тренд и цитаты всех
+    страниц читаются один раз.
+    """
+    if settings.QUOTES_DASHBOARD_PAGINATION == "keyset":
+        # Курсоры keyset-пагинации в имя файла не переводятся.
+        yield "dashboard/index.html", _dashboard_context(None, None)
+        return
+    snapshot = get_snapshot()
+    trending_scores = trending(TRENDING_SIZE)
+    quotes = (
+        Quote.objects.select_related("source")
+        .with_counters()
+        .in_bulk(
+            [
+                *(quote_id for quote_id, _ in snapshot.top_by_likes),
+                *(quote_id for quote_id, _ in snapshot.top_by_views),
+                *snapshot.most_recent,
+                *(quote_id for quote_id, _ in trending_scores),
+            ]
+        )
+    )
+
+    def page(page_likes, page_views):
+        pages, _ = _snapshot_pages(snapshot, page_likes, page_views)
+        _resolve_pages(pages, quotes)
+        return _build_dashboard_context(snapshot, *pages, quotes, trending_scores)
+
+    yield "dashboard/index.html", page(1, 1)
+    # Ссылки пагинации меняют номер только одного топа.
+    for field in ("likes", "views"):
+        entries = getattr(snapshot, f"top_by_{field}")
+        num_pages = -(-len(entries) // DASHBOARD_PAGE_SIZE)
+        for number in range(2, num_pages + 1):
+            numbers = (number, 1) if field == "likes" else (1, number)
+            yield f"dashboard/page_{field}-{number}.html", page(*numbers)
+
+
+def _static_links(html):
+    """Переписывает ссылки пагинации дашборда на статические файлы."""
+    dashboard_url = reverse("quotes:dashboard")
+
+    def replace(match):
+        param, value = match.groups()
+        if value == "1":
+            return 'href="index.html"'
+        if value.isdigit():
+            return f'href="{param}-{value}.html"'
+        return f'href="{dashboard_url}?{param}={value}"'
+
+    return _PAGE_LINK_RE.sub(replace, html)
+
+
+def _render_dashboard_page(context):
+    return _static_links(render_to_string("quotes/dashboard.html", context))
+
+
+def _render_quote_page(quote):
+    card = render_to_string("quotes/includes/quote_card.html", {"quote": quote})
+    return render_to_string(
+        "quotes/random_quote.html",
+        {
+            "quote": quote,
+            "quote_card": mark_safe(card),
+            "views": quote.views,
+            "live_updates": settings.QUOTES_LIVE_UPDATES,
+        },
+    )
+
+
+def _write_atomic(path, data):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            tmp.write(data)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _remove(path):
+    for name in (path, f"{path}.gz"):
+        if os.path.exists(name):
+            os.remove(name)
+
+
+class Prerenderer:
+    """Один проход пререндера в каталог ``output_dir``."""
+
+    def __init__(self, output_dir=None, force=False):
+        self.output_dir = str(output_dir or settings.QUOTES_PRERENDER_DIR)
+        self.force = force
+        self.stats = Counter()
+        self._previous = {}
+        self._manifest = {}
+
+    def _load_manifest(self):
+        try:
+            with open(
+                os.path.join(self.output_dir, MANIFEST_NAME), encoding="utf-8"
+            ) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _page(self, relative_path, digest, render):
+        """Перерисовывает страницу, если ее данные изменились."""
+        self._manifest[relative_path] = digest
+        path = os.path.join(self.output_dir, relative_path)
+        if (
+            not self.force
+            and self._previous.get(relative_path) == digest
+            and os.path.exists(path)
+        ):
+            self.stats["skipped"] += 1
+            return
+        html = render().encode()
+        _write_atomic(f"{path}.gz", gzip.compress(html, mtime=0))
+        _write_atomic(path, html)
+        self.stats["rendered"] += 1
+
+    def run(self):
+        """Возвращает Counter с ключами rendered, skipped и removed."""
+        self._previous = self._load_manifest()
+        for relative_path, context in dashboard_pages():
+            self._page(
+                relative_path,
+                _dashboard_digest(context),
+                lambda context=context: _render_dashboard_page(context),
+            )
+        quotes = (
+            Quote.objects.select_related("source")
+            .with_counters()
+            .order_by("pk")
+            .iterator(chunk_size=CHUNK_SIZE)
+        )
+        for quote in quotes:
+            self._page(
+                f"quote/{quote.id}/index.html",
+                _digest([_quote_state(quote), settings.QUOTES_LIVE_UPDATES]),
+                lambda quote=quote: _render_quote_page(quote),
+            )
+        for relative_path in self._previous.keys() - self._manifest.keys():
+            _remove(os.path.join(self.output_dir, relative_path))
+            self.stats["removed"] += 1
+        _write_atomic(
+            os.path.join(self.output_dir, MANIFEST_NAME),
+            json.dumps(self._manifest, sort_keys=True).encode(),
+        )
+        return self.stats
+
+
+def prerender(output_dir=None, force=False):
+    """Пререндер страниц; ``force`` перерисовывает все (например, после смены шаблонов)."""
+    return Prerenderer(output_dir, force).run()
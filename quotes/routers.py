@@ -0,0 +1,76 @@
+"""
+Маршрутизация запросов между основной БД и репликой для чтения.
+
+Реплика подключается настройкой DB_REPLICA_NAME (алиас ``replica``).
+Чтения моделей приложения quotes (таблица весов, снимок дашборда, топы)
+идут на реплику, записи и все остальные приложения (сессии, auth, админка)
+- на ``default``. Чтобы клиент видел свои изменения, чтения
+"приклеиваются" к основной БД:
+
+* внутри транзакции на ``default``;
+* до конца запроса после любой записи;
+* на DB_REPLICA_PIN_SECONDS после POST-запроса клиента
+  (cookie, см. ``ReplicaPinMiddleware``).
+"""
+
+import contextvars
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_DB_ALIAS = "replica"
+PIN_COOKIE = "quotes_primary"
+
+_pinned = contextvars.ContextVar("quotes_primary_pinned", default=False)
+
+
+def pin_primary():
+    """Направляет чтения текущего запроса (или потока) в основную БД."""
+    _pinned.set(True)
+
+
+def is_pinned():
+    return _pinned.get()
+
+
+@contextmanager
+def primary_pin_scope(pinned=False):
+    """Ограничивает закрепление за основной БД одним запросом."""
+    token = _pinned.set(pinned)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+def replica_configured():
+    return REPLICA_DB_ALIAS in settings.DATABASES
+
+
+class ReplicaRouter:
+    app_label = "quotes"
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != self.app_label or not replica_configured():
+            return None
+        if _pinned.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return REPLICA_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        if replica_configured():
+            pin_primary()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, REPLICA_DB_ALIAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема реплики приходит с репликацией основной БД.
+        if db == REPLICA_DB_ALIAS:
+            return False
+        return None
@@ -0,0 +1,241 @@
+import bisect
+import hashlib
+import heapq
+import itertools
+import math
+import random
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Quote
+
+REJECTION_ATTEMPTS_FACTOR = 4
+_EMPTY = ((), ())
+# Длинные зерна обрезаются: в кэше HTTP это часть ключа.
+MAX_SEED_LENGTH = 100
+# Зерно по умолчанию (QUOTES_DEFAULT_SEED): формат текущего периода и его длина.
+SEED_PERIODS = {
+    "hour": ("%Y-%m-%dT%H", timedelta(hours=1)),
+    "day": ("%Y-%m-%d", timedelta(days=1)),
+}
+
+
+class WeightedSampler:
+    """
+    Взвешенная выборка id цитат в памяти процесса.
+
+    Таблица весов загружается один раз и хранится в виде массива
+    кумулятивных сумм, поэтому каждая выборка стоит O(log n) и не обращается
+    к БД. При изменении цитат (сигналы post_save/post_delete) счетчик версии
+    увеличивается, и при следующей выборке таблица перестраивается.
+
+    Вместе с общей таблицей строятся таблицы цитат каждого источника и
+    таблицы источников каждого типа с весом, равным сумме весов их цитат.
+    Выборка по источнику - бинарный поиск в его таблице, по типу - сначала
+    источник, затем цитата в нем; распределение то же, что у выборки по
+    всем цитатам этого типа.
+
+    Выборка с зерном (``seed``) детерминирована: генератор инициализируется
+    хэшем зерна и отпечатка таблицы весов. Отпечаток считается по
+    содержимому таблицы, поэтому все процессы с одинаковыми данными
+    выдают для зерна одну и ту же цитату, пока веса не изменятся.
+    """
+
+    def __init__(self, queryset=None):
+        self._queryset = queryset
+        self._lock = threading.Lock()
+        self._version = 0
+        self._loaded_version = None
+        self._loaded_at = 0.0
+        self._ids = ()
+        self._cumulative = ()
+        self._fingerprint = ""
+        self._by_source = {}
+        self._by_kind = {}
+
+    def get_queryset(self):
+        if self._queryset is not None:
+            return self._queryset.all()
+        return Quote.objects.all()
+
+    def invalidate(self):
+        """Помечает таблицу весов устаревшей."""
+        with self._lock:
+            self._version += 1
+
+    def _is_stale(self):
+        if self._loaded_version != self._version:
+            return True
+        ttl = settings.QUOTES_SAMPLER_TTL
+        return bool(ttl) and time.monotonic() - self._loaded_at > ttl
+
+    def _load(self):
+        """Перестраивает таблицу кумулятивных весов (O(n), только при изменениях)."""
+        with self._lock:
+            if not self._is_stale():
+                return self._ids, self._cumulative
+            version = self._version
+            rows = (
+                self.get_queryset()
+                .order_by("pk")
+                .values_list("id", "weight", "source_id", "source__kind")
+                .iterator(chunk_size=5000)
+            )
+            ids, weights = [], []
+            by_source = defaultdict(lambda: ([], []))
+            source_kinds = {}
+            fingerprint = hashlib.sha1(usedforsecurity=False)
+            for quote_id, weight, source_id, kind in rows:
+                fingerprint.update(f"{quote_id}:{weight}:{source_id}:{kind};".encode())
+                ids.append(quote_id)
+                weights.append(weight)
+                source_ids, source_weights = by_source[source_id]
+                source_ids.append(quote_id)
+                source_weights.append(weight)
+                source_kinds[source_id] = kind
+            by_kind = defaultdict(lambda: ([], []))
+            for source_id, (_, source_weights) in by_source.items():
+                kind_sources, kind_weights = by_kind[source_kinds[source_id]]
+                kind_sources.append(source_id)
+                kind_weights.append(sum(source_weights))
+            self._ids = tuple(ids)
+            self._cumulative = tuple(itertools.accumulate(weights))
+            self._by_source = _tables(by_source)
+            self._by_kind = _tables(by_kind)
+            self._fingerprint = fingerprint.hexdigest()
+            self._loaded_version = version
+            self._loaded_at = time.monotonic()
+            return self._ids, self._cumulative
+
+    def table(self):
+        """Возвращает актуальную пару (ids, кумулятивные веса)."""
+        if self._is_stale():
+            return self._load()
+        return self._ids, self._cumulative
+
+    def fingerprint(self):
+        """Отпечаток актуальной таблицы весов."""
+        self.table()
+        return self._fingerprint
+
+    def seeded_rng(self, seed):
+        """Генератор, однозначно заданный зерном и отпечатком таблицы."""
+        digest = hashlib.sha256(f"{self._fingerprint}|{seed}".encode()).digest()
+        return random.Random(int.from_bytes(digest, "big"))
+
+    def draw(self, rng=random, source=None, kind=None, seed=None):
+        """
+        Возвращает id случайной цитаты с учетом веса или None, если цитат
+        нет. ``source`` (id источника) или ``kind`` (тип источника)
+        ограничивают выборку; с ``seed`` выборка детерминирована.
+        """
+        table = self.table()
+        if seed is not None:
+            rng = self.seeded_rng(seed)
+        return self._draw_filtered(table, rng, source, kind)
+
+    async def adraw(self, rng=random, source=None, kind=None, seed=None):
+        """Асинхронный ``draw``: в БД обращается только перестроение таблицы."""
+        if self._is_stale():
+            table = await sync_to_async(self._load)()
+        else:
+            table = self._ids, self._cumulative
+        if seed is not None:
+            rng = self.seeded_rng(seed)
+        return self._draw_filtered(table, rng, source, kind)
+
+    def _draw_filtered(self, table, rng, source, kind):
+        if kind is not None:
+            source = self._draw_from(self._by_kind.get(kind, _EMPTY), rng)
+            if source is None:
+                return None
+        if source is not None:
+            table = self._by_source.get(source, _EMPTY)
+        return self._draw_from(table, rng)
+
+    @staticmethod
+    def _draw_from(table, rng):
+        ids, cumulative = table
+        if not ids:
+            return None
+        point = rng.randrange(cumulative[-1])
+        return ids[bisect.bisect_right(cumulative, point)]
+
+    def sample(self, k, replace=False, rng=random):
+        """
+        Возвращает список из ``k`` id цитат с учетом веса.
+
+        С возвращением это ``k`` независимых выборок за O(k log n). Без
+        возвращения id повторяются не будут: сначала пробуем отбрасывать
+        повторы, а если выборка занимает слишком большую долю таблицы или
+        повторы идут подряд (несколько цитат с огромным весом), переходим
+        на алгоритм Эфраимидиса-Спиракиса за O(n log k).
+        """
+        table = self.table()
+        ids, cumulative = table
+        if not ids or k <= 0:
+            return []
+        if replace:
+            return [self._draw_from(table, rng) for _ in range(k)]
+
+        k = min(k, len(ids))
+        if k * 2 <= len(ids):
+            chosen = {}
+            for _ in range(k * REJECTION_ATTEMPTS_FACTOR):
+                chosen.setdefault(self._draw_from(table, rng), None)
+                if len(chosen) == k:
+                    return list(chosen)
+        return self._sample_without_replacement(ids, cumulative, k, rng)
+
+    @staticmethod
+    def _sample_without_replacement(ids, cumulative, k, rng):
+        # Ключ u ** (1 / w): k наибольших ключей дают взвешенную выборку
+        # без возвращения. Сравниваем логарифмы, чтобы не терять точность.
+        previous = 0
+        keyed = []
+        for quote_id, total in zip(ids, cumulative):
+            weight = total - previous
+            previous = total
+            keyed.append((math.log(1.0 - rng.random()) / weight, quote_id))
+        return [quote_id for _, quote_id in heapq.nlargest(k, keyed)]
+
+
+def _tables(groups):
+    """``{ключ: (ids, веса)}`` -> ``{ключ: (ids, кумулятивные веса)}``."""
+    return {
+        key: (tuple(ids), tuple(itertools.accumulate(weights)))
+        for key, (ids, weights) in groups.items()
+    }
+
+
+def request_seed(request):
+    """
+    Зерно выборки для запроса и время в секундах, на которое ответ можно
+    кэшировать: параметр ``seed`` или, если задан QUOTES_DEFAULT_SEED,
+    текущий час или день до его окончания. ``(None, 0)`` - обычная
+    случайная выборка.
+    """
+    seed = request.GET.get("seed", "").strip()[:MAX_SEED_LENGTH]
+    if seed:
+        return seed, settings.QUOTES_SEEDED_CACHE_TTL
+    period = SEED_PERIODS.get(settings.QUOTES_DEFAULT_SEED)
+    if period is None:
+        return None, 0
+    seed_format, length = period
+    now = timezone.localtime()
+    start = now.replace(minute=0, second=0, microsecond=0)
+    if length >= timedelta(days=1):
+        start = start.replace(hour=0)
+    remaining = int((start + length - now).total_seconds())
+    return start.strftime(seed_format), max(
+        1, min(remaining, settings.QUOTES_SEEDED_CACHE_TTL)
+    )
+
+
+quote_sampler = WeightedSampler()
@@ -0,0 +1,183 @@
+"""
+Полнотекстовый поиск цитат по тексту и названию источника.
+
+Индекс ``quotes_quote_fts`` поддерживается триггерами БД, поэтому в него
+попадают и ``bulk_create``, и изменения через ``update()``:
+
+* SQLite - таблица FTS5 (миграция 0008). Русского стеммера в FTS5 нет,
+  поэтому слова запроса обрезаются до основы (``stemming.stem``) и ищутся
+  как префиксы; ранжирование - ``bm25``, текст цитаты весит больше
+  названия источника.
+* PostgreSQL - таблица с ``tsvector`` под GIN-индексом (миграция 0009),
+  со словарями ``russian`` и ``english``; ранжирование - ``ts_rank``.
+
+На других СУБД используется обычный ``icontains`` без ранжирования.
+"""
+
+import re
+
+from django.db import connections, router, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Quote
+from .stemming import stem
+
+FTS_TABLE = "quotes_quote_fts"
+# Длинные запросы обрезаются: каждое слово - отдельное условие в индексе.
+MAX_TERM_LENGTH = 200
+_WORD_RE = re.compile(r"\w+")
+
+_PG_QUERY = "(plainto_tsquery('russian', %s) || plainto_tsquery('english', %s))"
+_SQL = {
+    "sqlite": {
+        "filter": f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s",
+        "count": f"SELECT COUNT(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s",
+        "page": (
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+            f"ORDER BY bm25({FTS_TABLE}, 2.0, 1.0), rowid LIMIT %s OFFSET %s"
+        ),
+        "rebuild": [
+            f"DELETE FROM {FTS_TABLE}",
+            f"INSERT INTO {FTS_TABLE} (rowid, text, source) "
+            "SELECT q.id, q.text, s.name "
+            "FROM quotes_quote q JOIN quotes_source s ON s.id = q.source_id",
+            f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')",
+        ],
+    },
+    "postgresql": {
+        "filter": f"SELECT quote_id FROM {FTS_TABLE} WHERE document @@ {_PG_QUERY}",
+        "count": f"SELECT COUNT(*) FROM {FTS_TABLE} WHERE document @@ {_PG_QUERY}",
+        "page": (
+            f"SELECT quote_id FROM {FTS_TABLE} WHERE document @@ {_PG_QUERY} "
+            f"ORDER BY ts_rank(document, {_PG_QUERY}) DESC, quote_id "
+            "LIMIT %s OFFSET %s"
+        ),
+        "rebuild": [
+            f"TRUNCATE {FTS_TABLE}",
+            f"INSERT INTO {FTS_TABLE} (quote_id, document) "
+            "SELECT q.id, quotes_quote_fts_document(q.text, s.name) "
+            "FROM quotes_quote q JOIN quotes_source s ON s.id = q.source_id",
+        ],
+    },
+}
+
+
+def fts_available(using="default"):
+    return connections[using].vendor in _SQL
+
+
+def search_term(request):
+    """Поисковый запрос из параметра ``q``."""
+    return request.GET.get("q", "").strip()[:MAX_TERM_LENGTH]
+
+
+def match_expression(term):
+    """
+    Запрос FTS5: основы всех слов ``term`` как префиксы, ``"основа"*``.
+    Слова берутся через ``\\w+``, поэтому синтаксис FTS5 из запроса не
+    проходит.
+    """
+    return " ".join(f'"{stem(word)}"*' for word in _WORD_RE.findall(term.lower()))
+
+
+def _query_params(vendor, term):
+    """Параметры поискового условия; None, если искать нечего."""
+    if vendor == "sqlite":
+        expression = match_expression(term)
+        return [expression] if expression else None
+    return [term, term] if _WORD_RE.search(term) else None
+
+
+def filter_quotes(queryset, term):
+    """Цитаты из ``queryset``, подходящие под поисковый запрос."""
+    vendor = connections[queryset.db].vendor
+    if vendor not in _SQL:
+        condition = Q()
+        for word in term.split():
+            condition &= Q(text__icontains=word) | Q(source__name__icontains=word)
+        return queryset.filter(condition)
+    params = _query_params(vendor, term)
+    if params is None:
+        return queryset.none()
+    return queryset.filter(id__in=RawSQL(_SQL[vendor]["filter"], params))
+
+
+class SearchResults:
+    """
+    Результаты поиска по убыванию релевантности для ``Paginator``:
+    ``count()`` и страница ранжированных id берутся из индекса, а цитаты
+    загружаются только для запрошенной страницы.
+    """
+
+    def __init__(self, term, using=None):
+        self.using = using or router.db_for_read(Quote)
+        self.vendor = connections[self.using].vendor
+        self.params = _query_params(self.vendor, term)
+        self._count = None
+
+    def _fetch(self, sql, params):
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def count(self):
+        if self._count is None:
+            self._count = 0
+            if self.params is not None:
+                sql = _SQL[self.vendor]["count"]
+                self._count = self._fetch(sql, self.params)[0][0]
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key : key + 1][0]
+        start = key.start or 0
+        if self.params is None or key.stop is not None and key.stop <= start:
+            return []
+        limit = -1 if key.stop is None else key.stop - start
+        if self.vendor == "postgresql":
+            # В запросе PostgreSQL tsquery встречается дважды: в WHERE и ts_rank.
+            params = self.params * 2
+            limit = None if limit < 0 else limit
+        else:
+            params = self.params
+        rows = self._fetch(_SQL[self.vendor]["page"], [*params, limit, start])
+        ids = [row[0] for row in rows]
+        quotes = (
+            Quote.objects.using(self.using)
+            .select_related("source")
+            .with_counters()
+            .in_bulk(ids)
+        )
+        return [quotes[quote_id] for quote_id in ids if quote_id in quotes]
+
+
+def search_quotes(term, using=None):
+    """
+    Поиск для пагинации: ``SearchResults`` на SQLite и PostgreSQL, иначе
+    queryset с ``icontains`` от новых цитат к старым.
+    """
+    using = using or router.db_for_read(Quote)
+    if fts_available(using):
+        return SearchResults(term, using)
+    queryset = Quote.objects.using(using).select_related("source").with_counters()
+    return filter_quotes(queryset, term).order_by("-created_at", "-id")
+
+
+def rebuild_index(using="default"):
+    """
+    Пересоздает индекс по всем цитатам (например, после загрузки дампа в
+    обход триггеров). Возвращает число проиндексированных цитат или None,
+    если на этой СУБД индекса нет.
+    """
+    connection = connections[using]
+    if connection.vendor not in _SQL:
+        return None
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        for sql in _SQL[connection.vendor]["rebuild"]:
+            cursor.execute(sql)
+        return Quote.objects.using(using).count()
@@ -0,0 +1,103 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models import Sum
+from django.db.models.functions import Now
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import snapshot
+from .cache import invalidate_quote_cards
+from .engagement import engagement_buffer
+from .models import COUNTER_FIELDS, Quote, QuoteCounterShard, Source, counters_sharded
+from .sampling import quote_sampler
+
+
+@receiver(post_save, sender=Quote)
+@receiver(post_delete, sender=Quote)
+@receiver(post_save, sender=Source)
+def invalidate_quote_sampler(sender, **kwargs):
+    """
+    Сбрасывает таблицу весов при создании, изменении или удалении цитаты и
+    при изменении источника (его тип входит в таблицы выборки по типу).
+    """
+    quote_sampler.invalidate()
+
+
+@receiver(post_save, sender=Quote)
+def update_snapshot_on_quote_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        snapshot.record_quote_created(instance)
+    else:
+        snapshot.record_quote_changed()
+
+
+@receiver(pre_delete, sender=Quote)
+def flush_votes_on_delete(sender, instance, **kwargs):
+    """
+    Лайки цитаты уже в БД, а в снимок попадают со сбросом буфера голосов:
+    сбрасываем его до удаления, чтобы KPI снимка не ушли в минус.
+    """
+    engagement_buffer.flush()
+
+
+@receiver(pre_delete, sender=Quote)
+def fold_counter_shards_on_delete(sender, instance, **kwargs):
+    """
+    Шарды удаляются каскадом раньше post_delete, поэтому их суммы
+    переносятся в удаляемую цитату заранее - для пересчета KPI снимка.
+    """
+    if not counters_sharded():
+        return
+    totals = QuoteCounterShard.objects.filter(quote=instance).aggregate(
+        **{field: Sum(field) for field in COUNTER_FIELDS}
+    )
+    for field, total in totals.items():
+        setattr(instance, field, getattr(instance, field) + (total or 0))
+
+
+@receiver(post_delete, sender=Quote)
+def update_snapshot_on_quote_delete(sender, instance, **kwargs):
+    snapshot.record_quote_deleted(instance)
+
+
+@receiver(post_save, sender=Source)
+def update_snapshot_on_source_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        snapshot.record_source_created()
+    else:
+        snapshot.record_source_changed()
+        # Название источника входит в ответы API: ETag и Last-Modified его
+        # цитат должны смениться.
+        instance.quotes.update(updated_at=Now())
+
+
+@receiver(post_delete, sender=Source)
+def update_snapshot_on_source_delete(sender, **kwargs):
+    snapshot.record_source_deleted()
+
+
+@receiver(post_save, sender=Quote)
+@receiver(post_delete, sender=Quote)
+def invalidate_quote_card(sender, instance, **kwargs):
+    invalidate_quote_cards([instance.id])
+
+
+@receiver(post_save, sender=Source)
+def invalidate_source_quote_cards(sender, instance, created, **kwargs):
+    """Название источника выводится в карточках его цитат."""
+    if not created:
+        invalidate_quote_cards(instance.quotes.values_list("id", flat=True))
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    """Применяет SQLITE_PRAGMAS к каждому новому подключению к SQLite."""
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {pragma} = {value}")
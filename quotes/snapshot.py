@@ -0,0 +1,294 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from .models import (
+    DashboardSnapshot,
+    Quote,
+    QuoteCounterShard,
+    Source,
+    counter_expression,
+    counters_sharded,
+)
+
+RECENT_SIZE = 5
+
+
+def _top_queryset(field, size):
+    return (
+        Quote.objects.annotate(value=counter_expression(field))
+        .filter(value__gt=0)
+        .order_by("-value", "-id")
+        .values_list("id", "value")[:size]
+    )
+
+
+def _recent_queryset():
+    return Quote.objects.order_by("-created_at", "-id").values_list("id", flat=True)[
+        :RECENT_SIZE
+    ]
+
+
+def _top_entries(field, size):
+    return [[quote_id, value] for quote_id, value in _top_queryset(field, size)]
+
+
+def _recent_ids():
+    return list(_recent_queryset())
+
+
+def _kpi_aggregates():
+    return {
+        "total_quotes": Count("id"),
+        "total_likes": Sum("likes"),
+        "total_views": Sum("views"),
+    }
+
+
+def _shard_aggregates():
+    return {"total_likes": Sum("likes"), "total_views": Sum("views")}
+
+
+def _save_snapshot(
+    kpi_stats, shard_stats, total_sources, top_by_likes, top_by_views, recent
+):
+    with transaction.atomic():
+        previous = DashboardSnapshot.objects.filter(
+            pk=DashboardSnapshot.SINGLETON_PK
+        ).first()
+        snapshot, _ = DashboardSnapshot.objects.update_or_create(
+            pk=DashboardSnapshot.SINGLETON_PK,
+            defaults={
+                "total_quotes": kpi_stats["total_quotes"],
+                "total_sources": total_sources,
+                "total_likes": (kpi_stats["total_likes"] or 0)
+                + (shard_stats.get("total_likes") or 0),
+                "total_views": (kpi_stats["total_views"] or 0)
+                + (shard_stats.get("total_views") or 0),
+                "top_by_likes": top_by_likes,
+                "top_by_views": top_by_views,
+                "most_recent": recent,
+                "version": previous.version + 1 if previous else 1,
+            },
+        )
+    return snapshot
+
+
+def rebuild_snapshot():
+    """Полностью пересчитывает снимок дашборда по текущим данным."""
+    top_size = settings.QUOTES_DASHBOARD_TOP_SIZE
+    shard_stats = {}
+    if counters_sharded():
+        shard_stats = QuoteCounterShard.objects.aggregate(**_shard_aggregates())
+    return _save_snapshot(
+        Quote.objects.aggregate(**_kpi_aggregates()),
+        shard_stats,
+        Source.objects.count(),
+        _top_entries("likes", top_size),
+        _top_entries("views", top_size),
+        _recent_ids(),
+    )
+
+
+async def _atop_entries(field, size):
+    return [[quote_id, value] async for quote_id, value in _top_queryset(field, size)]
+
+
+async def _arecent_ids():
+    return [quote_id async for quote_id in _recent_queryset()]
+
+
+async def _ashard_stats():
+    if not counters_sharded():
+        return {}
+    return await QuoteCounterShard.objects.aaggregate(**_shard_aggregates())
+
+
+async def arebuild_snapshot():
+    """Асинхронный ``rebuild_snapshot``: независимые запросы идут через gather."""
+    top_size = settings.QUOTES_DASHBOARD_TOP_SIZE
+    data = await asyncio.gather(
+        Quote.objects.aaggregate(**_kpi_aggregates()),
+        _ashard_stats(),
+        Source.objects.acount(),
+        _atop_entries("likes", top_size),
+        _atop_entries("views", top_size),
+        _arecent_ids(),
+    )
+    return await sync_to_async(_save_snapshot)(*data)
+
+
+def get_snapshot():
+    """Возвращает снимок дашборда, при отсутствии строит его."""
+    snapshot = DashboardSnapshot.objects.filter(
+        pk=DashboardSnapshot.SINGLETON_PK
+    ).first()
+    if snapshot is None:
+        snapshot = rebuild_snapshot()
+    return snapshot
+
+
+async def aget_snapshot():
+    snapshot = await DashboardSnapshot.objects.filter(
+        pk=DashboardSnapshot.SINGLETON_PK
+    ).afirst()
+    if snapshot is None:
+        snapshot = await arebuild_snapshot()
+    return snapshot
+
+
+def _apply(totals, mutate=None):
+    """
+    Применяет изменение к снимку: счетчики KPI увеличиваются одним UPDATE
+    (он же берет блокировку строки), затем при необходимости правятся топы.
+
+    Если снимка еще нет, ничего не делает - он будет построен при чтении.
+    """
+    with transaction.atomic():
+        updated = DashboardSnapshot.objects.filter(
+            pk=DashboardSnapshot.SINGLETON_PK
+        ).update(
+            version=F("version") + 1,
+            updated_at=timezone.now(),
+            **{field: F(field) + delta for field, delta in totals.items() if delta},
+        )
+        if not updated or mutate is None:
+            return
+        snapshot = DashboardSnapshot.objects.select_for_update().get(
+            pk=DashboardSnapshot.SINGLETON_PK
+        )
+        changed_fields = mutate(snapshot)
+        if changed_fields:
+            snapshot.save(update_fields=changed_fields)
+
+
+def _upsert_top(entries, quote_id, value, size):
+    """Обновляет значение цитаты в топе, сохраняя сортировку и размер."""
+    result = [entry for entry in entries if entry[0] != quote_id]
+    if value > 0:
+        result.append([quote_id, value])
+        result.sort(key=lambda entry: (-entry[1], -entry[0]))
+        del result[size:]
+    return result
+
+
+def _update_tops(snapshot, values):
+    """
+    Обновляет топы по словарю {поле: {id цитаты: новое значение}}.
+    Возвращает список измененных полей снимка.
+    """
+    size = settings.QUOTES_DASHBOARD_TOP_SIZE
+    changed_fields = []
+    for field, quote_values in values.items():
+        attname = f"top_by_{field}"
+        entries = getattr(snapshot, attname)
+        for quote_id, value in quote_values.items():
+            entries = _upsert_top(entries, quote_id, value, size)
+        if entries != getattr(snapshot, attname):
+            setattr(snapshot, attname, entries)
+            changed_fields.append(attname)
+    return changed_fields
+
+
+def _record_increments(field, increments):
+    if not any(increments.values()):
+        return
+    current_values = dict(
+        Quote.objects.filter(pk__in=list(increments))
+        .annotate(value=counter_expression(field))
+        .order_by()
+        .values_list("id", "value")
+    )
+    # Счетчики удаленных цитат уже вычтены record_quote_deleted, а их
+    # приросты групповой UPDATE пропустил.
+    total = sum(increments[quote_id] for quote_id in current_values)
+    if not total:
+        return
+    _apply(
+        {f"total_{field}": total},
+        lambda snapshot: _update_tops(snapshot, {field: current_values}),
+    )
+
+
+def record_views(increments):
+    """Учитывает записанные в БД просмотры ``{id цитаты: прирост}``."""
+    _record_increments("views", increments)
+
+
+def record_likes(increments):
+    """
+    Учитывает записанные в БД лайки ``{id цитаты: прирост}``. Голоса
+    приходят пачками из буфера вовлеченности или журнала голосов.
+    """
+    _record_increments("likes", increments)
+
+
+def record_quote_created(quote):
+    def mutate(snapshot):
+        changed_fields = _update_tops(
+            snapshot,
+            {"likes": {quote.id: quote.likes}, "views": {quote.id: quote.views}},
+        )
+        snapshot.most_recent = [quote.id, *snapshot.most_recent][:RECENT_SIZE]
+        return [*changed_fields, "most_recent"]
+
+    _apply(
+        {
+            "total_quotes": 1,
+            "total_likes": quote.likes,
+            "total_views": quote.views,
+        },
+        mutate,
+    )
+
+
+def record_quote_changed():
+    """Цитату отредактировали: счетчики не меняются, но версия снимка растет."""
+    _apply({})
+
+
+def record_quote_deleted(quote):
+    def mutate(snapshot):
+        size = settings.QUOTES_DASHBOARD_TOP_SIZE
+        changed_fields = []
+        for field in ("likes", "views"):
+            attname = f"top_by_{field}"
+            entries = getattr(snapshot, attname)
+            remaining = [entry for entry in entries if entry[0] != quote.id]
+            if len(remaining) == len(entries):
+                continue
+            # За пределами полного топа могли остаться цитаты - добираем из БД.
+            if len(entries) >= size:
+                remaining = _top_entries(field, size)
+            setattr(snapshot, attname, remaining)
+            changed_fields.append(attname)
+        if quote.id in snapshot.most_recent:
+            snapshot.most_recent = _recent_ids()
+            changed_fields.append("most_recent")
+        return changed_fields
+
+    _apply(
+        {
+            "total_quotes": -1,
+            "total_likes": -quote.likes,
+            "total_views": -quote.views,
+        },
+        mutate,
+    )
+
+
+def record_source_created():
+    _apply({"total_sources": 1})
+
+
+def record_source_changed():
+    """Источник переименовали: его название выводится в топах API."""
+    _apply({})
+
+
+def record_source_deleted():
+    _apply({"total_sources": -1})
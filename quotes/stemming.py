@@ -0,0 +1,130 @@
+"""
+Стемминг слов поискового запроса для FTS5.
+
+В SQLite нет русского стеммера, поэтому индекс хранит слова как есть, а
+стемминг делается над запросом: слово обрезается до основы и ищется как
+префикс. Для русского используется алгоритм Snowball, для английского -
+упрощенное отсечение окончаний (-s, -ies, -ed, -ing, -ly). Основа всегда
+остается префиксом исходного слова.
+"""
+
+import re
+
+_RU_VOWELS = "аеиоуыэюя"
+
+# Группы окончаний Snowball: (после "а"/"я", без условия).
+_RU_PERFECTIVE_GERUND = ("в вши вшись", "ив ивши ившись ыв ывши ывшись")
+_RU_REFLEXIVE = ("", "ся сь")
+_RU_ADJECTIVE = (
+    "",
+    "ее ие ые ое ими ыми ей ий ый ой ем им ым ом его ого ему ому их ых ую юю "
+    "ая яя ою ею",
+)
+_RU_PARTICIPLE = ("ем нн вш ющ щ", "ивш ывш ующ")
+_RU_VERB = (
+    "ла на ете йте ли й л ем н ло но ет ют ны ть ешь нно",
+    "ила ыла ена ейте уйте ите или ыли ей уй ил ыл им ым ен ило ыло ено ят ует "
+    "уют ит ыт ены ить ыть ишь ую ю",
+)
+_RU_NOUN = (
+    "",
+    "а ев ов ие ье е иями ями ами еи ии и ией ей ой ий й иям ям ием ем ам ом о "
+    "у ах иях ях ы ь ию ью ю ия ья я",
+)
+_RU_SUPERLATIVE = ("", "ейше ейш")
+_RU_DERIVATIONAL = ("", "ость ост")
+
+_CYRILLIC_RE = re.compile("[а-яё]")
+_LATIN_RE = re.compile("^[a-z]+$")
+
+
+def _region(word, start):
+    """Начало области после первой согласной, идущей за гласной."""
+    for i in range(start + 1, len(word)):
+        if word[i] not in _RU_VOWELS and word[i - 1] in _RU_VOWELS:
+            return i + 1
+    return len(word)
+
+
+def _strip(word, start, groups):
+    """
+    Отрезает самое длинное окончание из ``groups``, целиком лежащее в
+    области с ``start``. Окончания первой группы отрезаются, только если
+    перед ними стоит "а" или "я" из той же области.
+    """
+    preceded, plain = (group.split() for group in groups)
+    best = None
+    for ending in preceded + plain:
+        cut = len(word) - len(ending)
+        if cut < start or not word.endswith(ending):
+            continue
+        if ending in preceded and ending not in plain:
+            if cut - 1 < start or word[cut - 1] not in "ая":
+                continue
+        if best is None or len(ending) > len(best):
+            best = ending
+    return word[: len(word) - len(best)] if best else None
+
+
+def stem_russian(word):
+    original, word = word, word.replace("ё", "е")
+    rv = next((i + 1 for i, ch in enumerate(word) if ch in _RU_VOWELS), len(word))
+    r2 = _region(word, _region(word, 0) - 1)
+
+    stripped = _strip(word, rv, _RU_PERFECTIVE_GERUND)
+    if stripped is None:
+        word = _strip(word, rv, _RU_REFLEXIVE) or word
+        stripped = _strip(word, rv, _RU_ADJECTIVE)
+        if stripped is not None:
+            stripped = _strip(stripped, rv, _RU_PARTICIPLE) or stripped
+        else:
+            stripped = _strip(word, rv, _RU_VERB) or _strip(word, rv, _RU_NOUN)
+    word = stripped or word
+
+    if word.endswith("и") and len(word) - 1 >= rv:
+        word = word[:-1]
+    word = _strip(word, r2, _RU_DERIVATIONAL) or word
+
+    superlative = _strip(word, rv, _RU_SUPERLATIVE)
+    if word.endswith("нн") and len(word) - 2 >= rv:
+        word = word[:-1]
+    elif superlative is not None:
+        word = superlative[:-1] if superlative.endswith("нн") else superlative
+    elif word.endswith("ь") and len(word) - 1 >= rv:
+        word = word[:-1]
+    # Основа - префикс исходного слова: "ё" в индексе не заменяется на "е".
+    return original[: len(word)]
+
+
+def stem_english(word):
+    if len(word) <= 3:
+        return word
+    if word.endswith("'s"):
+        word = word[:-2]
+    if word.endswith("sses"):
+        word = word[:-2]
+    elif word.endswith("ies"):
+        # "flies" -> "fl": основа ищется как префикс и должна подходить к "fly".
+        word = word[:-3]
+    elif word.endswith("s") and not word.endswith(("ss", "us")):
+        word = word[:-1]
+    for suffix in ("ing", "ed", "ly"):
+        base = word[: -len(suffix)]
+        if word.endswith(suffix) and len(base) >= 3 and re.search("[aeiouy]", base):
+            word = base
+            if word[-1] == word[-2] and word[-1] not in "aeiouylsz":
+                word = word[:-1]
+            break
+    return word
+
+
+def stem(word):
+    """Основа слова в нижнем регистре; слишком короткая основа не режется."""
+    word = word.lower()
+    if _CYRILLIC_RE.search(word):
+        base = stem_russian(word)
+    elif _LATIN_RE.match(word):
+        base = stem_english(word)
+    else:
+        base = word
+    return base if len(base) >= 2 else word
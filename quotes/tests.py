@@ -1,8 +1,79 @@
-from django.test import TestCase, Client
+import asyncio
+import csv
+import gzip
+import json
+import multiprocessing
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection, connections
+from django.db.backends.sqlite3.base import DatabaseWrapper as SQLiteWrapper
+from django.db.models import Count
+from django.http import Http404, HttpResponse
+from django.test import (
+    AsyncRequestFactory,
+    Client,
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from django.core.exceptions import ValidationError
 from django.contrib.auth import get_user_model
-from .models import Source, Quote
+from .models import (
+    DashboardSnapshot,
+    Quote,
+    QuoteCounterShard,
+    QuoteEngagement,
+    QuoteTrend,
+    Source,
+    VoteCheckpoint,
+    supports_update_returning,
+)
+from . import async_views
+from .benchmarks import benchmark_endpoints, compare_reports, generate_fixtures
+from .cache import SingleFlightCache, fragment_cache
+from .counters import (
+    ViewCounterBuffer,
+    apply_view_increments,
+    compact_counter_shards,
+    view_counter,
+)
+from .engagement import (
+    apply_engagement,
+    bucket_start,
+    engagement_buffer,
+    rebuild_trending,
+    rollup_engagement,
+    trending,
+)
+from .importing import QuoteImporter, read_records
+from .live import LiveHub, live_hub, quote_topic
+from .metrics import Histogram, request_metrics
+from .middleware import QueryMetricsMiddleware, ReplicaPinMiddleware
+from .routers import PIN_COOKIE, ReplicaRouter, primary_pin_scope
+from .search import SearchResults, filter_quotes, match_expression
+from .stemming import stem
+from .views import SEARCH_PAGE_SIZE
+from .pagination import KeysetPaginator
+from .snapshot import arebuild_snapshot, get_snapshot, rebuild_snapshot
+from .throttling import RotatingBloomFilter, TokenBucketLimiter, vote_guard
+from .votes import VoteJournal, apply_votes, read_journal, vote_journal
+from .sampling import WeightedSampler, quote_sampler
 
 User = get_user_model()
 
@@ -39,14 +110,19 @@ class QuoteModelTest(TestCase):
             Quote.objects.create(text="Уникальный текст", source=self.source)
 
 
+@override_settings(QUOTES_VOTE_RATE=0, QUOTES_VOTE_DEDUP_WINDOW=0)
 class QuoteViewTest(TestCase):
     def setUp(self):
+        cache.clear()
         self.client = Client()
         self.source = Source.objects.create(name="Тестовый источник для API")
         self.quote = Quote.objects.create(
             text="Тестовый текст для API", source=self.source, likes=5, views=10
         )
 
+    def tearDown(self):
+        view_counter.clear()
+
     def test_random_quote_view(self):
         Quote.objects.all().delete()
         test_quote = Quote.objects.create(
@@ -134,6 +210,159 @@ class AdminPanelTest(TestCase):
         response = self.client.get(url)
         self.assertContains(response, "Цитата для админки")
 
+    def _changelist_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        source_url = reverse("admin:quotes_source_changelist")
+        quote_url = reverse("admin:quotes_quote_changelist")
+        before = (
+            self._changelist_queries(source_url),
+            self._changelist_queries(quote_url),
+        )
+        for i in range(10):
+            source = Source.objects.create(name=f"Еще источник {i}")
+            Quote.objects.create(text=f"Еще цитата {i}", source=source)
+        after = (
+            self._changelist_queries(source_url),
+            self._changelist_queries(quote_url),
+        )
+        self.assertEqual(before, after)
+
+    def test_source_filter_is_limited(self):
+        for i in range(25):
+            Source.objects.create(name=f"Фильтр {i:02d}")
+        hidden = Source.objects.create(name="Яблоко")
+        url = reverse("admin:quotes_quote_changelist")
+        response = self.client.get(url)
+        self.assertNotContains(response, "Яблоко")
+        response = self.client.get(url, {"source": hidden.id})
+        self.assertContains(response, "Яблоко")
+        self.assertNotContains(response, "Цитата для админки")
+
+    def test_admin_search_uses_fulltext_index(self):
+        other = Source.objects.create(name="Черновики Воланда")
+        Quote.objects.create(text="Рукописи не горят", source=other)
+        url = reverse("admin:quotes_quote_changelist")
+        for term in ("рукопис", "воланда", "горят"):
+            with self.subTest(term=term):
+                response = self.client.get(url, {"q": term})
+                self.assertContains(response, "Рукописи не горят")
+                self.assertNotContains(response, "Цитата для админки")
+
+
+class SearchIndexTest(TestCase):
+    def setUp(self):
+        self.source = Source.objects.create(name="Индекс")
+        self.quote = Quote.objects.create(text="Первый снег", source=self.source)
+
+    def search(self, term):
+        return list(filter_quotes(Quote.objects.all(), term))
+
+    def test_match_expression_escapes_syntax(self):
+        self.assertEqual(
+            match_expression('Снег OR "NEAR(x'), '"снег"* "or"* "near"* "x"*'
+        )
+        self.assertEqual(match_expression("*:-"), "")
+        self.assertEqual(self.search("*:-"), [])
+
+    def test_index_follows_changes(self):
+        self.assertEqual(self.search("сне"), [self.quote])
+        self.quote.text = "Последний дождь"
+        self.quote.save()
+        self.assertEqual(self.search("снег"), [])
+        self.assertEqual(self.search("дождь"), [self.quote])
+
+        self.source.name = "Переименованный"
+        self.source.save()
+        self.assertEqual(self.search("переименованный дождь"), [self.quote])
+        self.assertEqual(self.search("индекс"), [])
+
+        self.quote.delete()
+        self.assertEqual(self.search("дождь"), [])
+
+    def test_bulk_create_is_indexed(self):
+        Quote.objects.bulk_create(
+            [Quote(text=f"Пакетная цитата {i}", source=self.source) for i in range(2)]
+        )
+        self.assertEqual(len(self.search("пакетная")), 2)
+
+    def test_stemming(self):
+        for word, expected in (
+            ("котами", "кот"),
+            ("рукописи", "рукопис"),
+            ("горят", "гор"),
+            ("красивейшая", "красив"),
+            ("ёлками", "ёлк"),
+            ("Running", "run"),
+            ("flies", "fl"),
+            ("quotes", "quote"),
+            ("я", "я"),
+        ):
+            with self.subTest(word=word):
+                self.assertEqual(stem(word), expected)
+
+    def test_russian_and_english_word_forms(self):
+        mouse = Quote.objects.create(text="Мышь бежит по крыше", source=self.source)
+        dog = Quote.objects.create(text="Every dog has its day", source=self.source)
+        self.assertEqual(self.search("мышами"), [mouse])
+        self.assertEqual(self.search("по крышам"), [mouse])
+        self.assertEqual(self.search("dogs"), [dog])
+
+    def test_results_ranked_and_paginated(self):
+        by_source = Source.objects.create(name="Звезды и люди")
+        in_source = Quote.objects.create(text="Огни города", source=by_source)
+        in_text = Quote.objects.create(text="Звезды светят всем", source=self.source)
+        for i in range(3):
+            source = Source.objects.create(name=f"Небо {i}")
+            Quote.objects.create(text=f"Звезды номер {i}", source=source)
+
+        results = SearchResults("звезды")
+        self.assertEqual(results.count(), 5)
+        ranked = results[0:5]
+        self.assertEqual(ranked[-1], in_source)
+        self.assertIn(in_text, ranked)
+        # Страница - запрос к индексу и загрузка ее цитат.
+        with self.assertNumQueries(2):
+            self.assertEqual(results[1:3], ranked[1:3])
+        self.assertEqual(SearchResults("!!!").count(), 0)
+        self.assertEqual(SearchResults("!!!")[0:10], [])
+
+    def test_search_page(self):
+        for i in range(SEARCH_PAGE_SIZE + 1):
+            source = Source.objects.create(name=f"Зима {i}")
+            Quote.objects.create(text=f"Снег идет {i}", source=source)
+        url = reverse("quotes:search")
+        response = self.client.get(url, {"q": "снег"})
+        self.assertContains(response, "Найдено цитат: 22")
+        self.assertContains(response, "?q=%D1%81%D0%BD%D0%B5%D0%B3&amp;page=2")
+        response = self.client.get(url, {"q": "снег", "page": 2})
+        self.assertEqual(len(response.context["page"].object_list), 2)
+        response = self.client.get(url)
+        self.assertIsNone(response.context["page"])
+
+    def test_search_api(self):
+        url = reverse("quotes:api_search")
+        self.assertEqual(self.client.get(url).status_code, 400)
+        data = self.client.get(url, {"q": "снегом"}).json()
+        self.assertEqual(data["count"], 1)
+        self.assertEqual(data["results"][0]["id"], self.quote.id)
+        self.assertIsNone(data["next"])
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM quotes_quote_fts")
+        self.assertEqual(self.search("снег"), [])
+        out = StringIO()
+        call_command("rebuild_search_index", stdout=out)
+        self.assertIn(
+            f"Проиндексировано цитат: {Quote.objects.count()}", out.getvalue()
+        )
+        self.assertEqual(self.search("снег"), [self.quote])
+
 
 class PaginationTest(TestCase):
     @classmethod
@@ -146,6 +375,7 @@ class PaginationTest(TestCase):
         cls.url = reverse("quotes:dashboard")
 
     def setUp(self):
+        cache.clear()
         self.client = Client()
 
     def test_pagination_appears_on_dashboard(self):
@@ -183,3 +413,2137 @@ class PaginationTest(TestCase):
         self.assertEqual(response.context["top_by_views_page"].number, 1)
         response = self.client.get(self.url + "?page_views=999")
         self.assertEqual(response.context["top_by_views_page"].number, 2)
+
+
+class WeightedSamplerTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.source = Source.objects.create(name="Источник для выборки")
+        Quote.objects.all().exclude(source=self.source).delete()
+        self.light = Quote.objects.create(text="Легкая", source=self.source, weight=1)
+        self.heavy = Quote.objects.create(
+            text="Тяжелая", source=self.source, weight=1000
+        )
+        self.sampler = WeightedSampler()
+
+    def tearDown(self):
+        view_counter.clear()
+
+    def test_draw_respects_weights(self):
+        rng = random.Random(42)
+        draws = [self.sampler.draw(rng) for _ in range(2000)]
+        self.assertGreater(draws.count(self.heavy.id), draws.count(self.light.id) * 50)
+
+    def test_draw_does_not_query_db_after_load(self):
+        self.sampler.draw()
+        with self.assertNumQueries(0):
+            for _ in range(100):
+                self.sampler.draw()
+
+    def test_draw_empty_table(self):
+        Quote.objects.all().delete()
+        self.assertIsNone(self.sampler.draw())
+
+    def test_signals_invalidate_global_sampler(self):
+        quote_sampler.draw()
+        self.light.delete()
+        ids, _ = quote_sampler.table()
+        self.assertNotIn(self.light.id, ids)
+
+        self.heavy.weight = 5
+        self.heavy.save()
+        ids, cumulative = quote_sampler.table()
+        self.assertEqual(ids, (self.heavy.id,))
+        self.assertEqual(cumulative, (5,))
+
+    def test_random_quote_view_recovers_from_stale_table(self):
+        stale_id = self.light.id
+        self.light.delete()
+        # Таблица, устаревшая из-за удаления в другом процессе.
+        quote_sampler._ids = (stale_id,)
+        quote_sampler._cumulative = (1,)
+        quote_sampler._loaded_version = quote_sampler._version
+        response = self.client.get(reverse("quotes:random_quote"))
+        self.assertEqual(response.context["quote"], self.heavy)
+
+
+class PerSourceSamplingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        Quote.objects.all().delete()
+        self.book = Source.objects.create(name="Книга для выборки", kind=Source.BOOK)
+        self.movie = Source.objects.create(name="Фильм для выборки", kind=Source.MOVIE)
+        self.other_movie = Source.objects.create(
+            name="Второй фильм для выборки", kind=Source.MOVIE
+        )
+        self.book_quotes = [
+            Quote.objects.create(text=f"Книжная {i}", source=self.book, weight=10)
+            for i in range(3)
+        ]
+        self.light = Quote.objects.create(
+            text="Легкая из фильма", source=self.movie, weight=1
+        )
+        self.heavy = Quote.objects.create(
+            text="Тяжелая из фильма", source=self.other_movie, weight=99
+        )
+        self.sampler = WeightedSampler()
+
+    def tearDown(self):
+        view_counter.clear()
+
+    def test_draw_by_source(self):
+        rng = random.Random(5)
+        ids = {q.id for q in self.book_quotes}
+        draws = {self.sampler.draw(rng, source=self.book.id) for _ in range(200)}
+        self.assertEqual(draws, ids)
+        self.assertIsNone(self.sampler.draw(source=0))
+
+    def test_draw_by_kind_respects_weights(self):
+        rng = random.Random(6)
+        draws = Counter(self.sampler.draw(rng, kind=Source.MOVIE) for _ in range(2000))
+        self.assertEqual(set(draws), {self.light.id, self.heavy.id})
+        self.assertGreater(draws[self.heavy.id], draws[self.light.id] * 20)
+        self.assertIsNone(self.sampler.draw(kind=Source.SERIES))
+
+    def test_filtered_draw_does_not_query_db_after_load(self):
+        self.sampler.draw()
+        with self.assertNumQueries(0):
+            self.sampler.draw(source=self.book.id)
+            self.sampler.draw(kind=Source.MOVIE)
+
+    def test_source_kind_change_invalidates_global_sampler(self):
+        quote_sampler.draw()
+        self.book.kind = Source.SERIES
+        self.book.save()
+        ids = {q.id for q in self.book_quotes}
+        self.assertIn(quote_sampler.draw(kind=Source.SERIES), ids)
+        self.assertIsNone(quote_sampler.draw(kind=Source.BOOK))
+
+    def test_source_and_kind_pages(self):
+        url = reverse("quotes:random_source_quote", args=[self.movie.id])
+        self.assertEqual(self.client.get(url).context["quote"], self.light)
+
+        url = reverse("quotes:random_kind_quote", args=[Source.BOOK])
+        self.assertIn(self.client.get(url).context["quote"], self.book_quotes)
+
+        url = reverse("quotes:random_kind_quote", args=[Source.SERIES])
+        self.assertContains(self.client.get(url), "Здесь цитат пока нет.")
+        url = reverse("quotes:random_kind_quote", args=["poem"])
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_source_and_kind_api(self):
+        url = reverse("quotes:api_random_source_quote", args=[self.movie.id])
+        self.assertEqual(self.client.get(url).json()["id"], self.light.id)
+
+        url = reverse("quotes:api_random_kind_quote", args=[Source.BOOK])
+        ids = {q.id for q in self.book_quotes}
+        self.assertIn(self.client.get(url).json()["id"], ids)
+
+        url = reverse("quotes:api_random_source_quote", args=[0])
+        self.assertEqual(self.client.get(url).status_code, 404)
+        url = reverse("quotes:api_random_kind_quote", args=["poem"])
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    async def test_async_source_page(self):
+        request = AsyncRequestFactory().get("/")
+        response = await async_views.random_quote_view(request, source_id=self.movie.id)
+        self.assertContains(response, "Легкая из фильма")
+        with self.assertRaises(Http404):
+            await async_views.random_quote_view(request, kind="poem")
+
+
+class SeededSamplingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        Quote.objects.all().delete()
+        sources = [Source.objects.create(name=f"Зерно {i}") for i in range(10)]
+        self.quotes = [
+            Quote.objects.create(
+                text=f"Цитата с зерном {i}", source=sources[i % 10], weight=i + 1
+            )
+            for i in range(20)
+        ]
+
+    def tearDown(self):
+        view_counter.clear()
+
+    def test_same_seed_same_quote_across_samplers(self):
+        first, second = WeightedSampler(), WeightedSampler()
+        for seed in ("2026-10-18", "user-7", "x"):
+            self.assertEqual(first.draw(seed=seed), second.draw(seed=seed))
+        draws = {first.draw(seed=str(i)) for i in range(200)}
+        self.assertGreater(len(draws), 5)
+
+    def test_seed_mapping_follows_weight_table(self):
+        sampler = WeightedSampler()
+        fingerprint = sampler.fingerprint()
+        sampler.invalidate()
+        self.assertEqual(sampler.fingerprint(), fingerprint)
+
+        Quote.objects.filter(pk=self.quotes[0].pk).update(weight=1000)
+        sampler.invalidate()
+        self.assertNotEqual(sampler.fingerprint(), fingerprint)
+
+    def test_seeded_api_is_cacheable(self):
+        url = reverse("quotes:api_random_quote")
+        first = self.client.get(url, {"seed": "2026-10-18"})
+        second = self.client.get(url, {"seed": "2026-10-18"})
+        self.assertEqual(first.json()["id"], second.json()["id"])
+        self.assertIn("public", first["Cache-Control"])
+        self.assertIn("max-age=86400", first["Cache-Control"])
+        self.assertEqual(self.client.get(url)["Cache-Control"], "no-cache")
+
+    def test_seeded_page_is_cacheable(self):
+        url = reverse("quotes:random_quote")
+        first = self.client.get(url, {"seed": "user-3"})
+        second = self.client.get(url, {"seed": "user-3"})
+        self.assertEqual(first.context["quote"], second.context["quote"])
+        self.assertIn("private", first["Cache-Control"])
+        self.assertNotIn("public", first["Cache-Control"])
+        self.assertIn("max-age=86400", first["Cache-Control"])
+        self.assertFalse(self.client.get(url).has_header("Cache-Control"))
+
+    @override_settings(QUOTES_DEFAULT_SEED="day", TIME_ZONE="UTC")
+    def test_default_seed_caches_until_end_of_day(self):
+        moment = timezone.now().replace(hour=23, minute=0, second=0, microsecond=0)
+        url = reverse("quotes:api_random_quote")
+        with mock.patch("django.utils.timezone.now", return_value=moment):
+            response = self.client.get(url)
+            expected = quote_sampler.draw(seed=moment.strftime("%Y-%m-%d"))
+        self.assertEqual(response.json()["id"], expected)
+        self.assertIn("max-age=3600", response["Cache-Control"])
+
+    async def test_async_seeded_page(self):
+        request = AsyncRequestFactory().get("/", {"seed": "async"})
+        response = await async_views.random_quote_view(request)
+        expected = await quote_sampler.adraw(seed="async")
+        self.assertContains(response, reverse("quotes:like_quote", args=[expected]))
+        self.assertIn("private", response["Cache-Control"])
+        self.assertIn("max-age=86400", response["Cache-Control"])
+
+
+def _spool_writer(spool_path, quote_id, count):
+    buffer = ViewCounterBuffer(
+        spool_path=spool_path, flush_interval=3600, flush_size=10**9
+    )
+    for _ in range(count):
+        buffer.record(quote_id)
+
+
+def _spool_claimer(spool_path, claimed, release):
+    # Сброс другого процесса: файл забран, но еще не применен.
+    ViewCounterBuffer._claim_spool(spool_path)
+    claimed.set()
+    release.wait(10)
+
+
+class ViewCounterBufferTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.source = Source.objects.create(name="Источник для просмотров")
+        self.first = Quote.objects.create(text="Первая", source=self.source)
+        self.second = Quote.objects.create(text="Вторая", source=self.source, views=7)
+        self.spool_dir = tempfile.TemporaryDirectory()
+        self.spool_path = os.path.join(self.spool_dir.name, "views.spool")
+
+    def tearDown(self):
+        view_counter.clear()
+        self.spool_dir.cleanup()
+
+    def test_record_is_buffered_until_flush(self):
+        buffer = ViewCounterBuffer(spool_path="", flush_interval=60, flush_size=100)
+        with self.assertNumQueries(0):
+            for _ in range(3):
+                buffer.record(self.first.id)
+            buffer.record(self.second.id)
+        self.assertEqual(buffer.pending(self.first.id), 3)
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(buffer.flush(), 4)
+        quote_updates = [
+            q
+            for q in ctx.captured_queries
+            if q["sql"].startswith('UPDATE "quotes_quote"')
+        ]
+        self.assertEqual(len(quote_updates), 1)
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        self.assertEqual((self.first.views, self.second.views), (3, 8))
+        self.assertEqual(buffer.pending(self.first.id), 0)
+
+    def test_failed_flush_requeues_only_unwritten_chunks(self):
+        buffer = ViewCounterBuffer(spool_path="", flush_interval=60, flush_size=100)
+        buffer.record_many([self.first.id, self.first.id, self.second.id])
+        with (
+            mock.patch("quotes.counters.FLUSH_CHUNK_SIZE", 1),
+            mock.patch(
+                "quotes.counters.apply_engagement",
+                side_effect=[None, DatabaseError("сбой")],
+            ),
+            self.assertRaises(DatabaseError),
+        ):
+            buffer.flush()
+        self.assertEqual(
+            (buffer.pending(self.first.id), buffer.pending(self.second.id)), (0, 1)
+        )
+        self.assertEqual(buffer.flush(), 1)
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        self.assertEqual((self.first.views, self.second.views), (2, 8))
+
+    def test_failed_spool_flush_writes_nothing(self):
+        buffer = ViewCounterBuffer(
+            spool_path=self.spool_path, flush_interval=60, flush_size=100
+        )
+        buffer.record_many([self.first.id, self.first.id, self.second.id])
+        with (
+            mock.patch("quotes.counters.FLUSH_CHUNK_SIZE", 1),
+            mock.patch(
+                "quotes.counters.apply_engagement",
+                side_effect=[None, DatabaseError("сбой")],
+            ),
+            self.assertRaises(DatabaseError),
+        ):
+            buffer.flush()
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.views, 0)
+        self.assertEqual(buffer.flush(), 3)
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        self.assertEqual((self.first.views, self.second.views), (2, 8))
+
+    def test_size_threshold_triggers_flush(self):
+        buffer = ViewCounterBuffer(spool_path="", flush_interval=60, flush_size=2)
+        buffer.record_many([self.first.id, self.first.id])
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.views, 2)
+
+    def test_spool_survives_restart(self):
+        buffer = ViewCounterBuffer(
+            spool_path=self.spool_path, flush_interval=60, flush_size=100
+        )
+        buffer.record(self.first.id)
+        buffer.record(self.second.id)
+        buffer.record(self.second.id)
+
+        restarted = ViewCounterBuffer(
+            spool_path=self.spool_path, flush_interval=60, flush_size=100
+        )
+        self.assertEqual(restarted.flush(), 3)
+        self.assertFalse(os.listdir(self.spool_dir.name))
+        self.second.refresh_from_db()
+        self.assertEqual(self.second.views, 9)
+        # Повторный сброс уже примененного spool ничего не записывает.
+        self.assertEqual(buffer.flush(), 0)
+
+    @skipUnless(hasattr(os, "fork"), "нужен fork")
+    def test_spool_writer_in_other_process_loses_nothing(self):
+        buffer = ViewCounterBuffer(
+            spool_path=self.spool_path, flush_interval=3600, flush_size=10**9
+        )
+        applied = Counter()
+        writer = multiprocessing.get_context("fork").Process(
+            target=_spool_writer, args=(self.spool_path, self.first.id, 2000)
+        )
+        with mock.patch(
+            "quotes.counters.apply_view_increments", side_effect=applied.update
+        ):
+            writer.start()
+            while writer.is_alive():
+                buffer.flush()
+            writer.join()
+            buffer.flush()
+        self.assertEqual(writer.exitcode, 0)
+        self.assertEqual(applied, Counter({self.first.id: 2000}))
+        self.assertFalse(os.listdir(self.spool_dir.name))
+
+    @skipUnless(hasattr(os, "fork"), "нужен fork")
+    def test_spool_claimed_by_other_process_is_not_applied_twice(self):
+        buffer = ViewCounterBuffer(
+            spool_path=self.spool_path, flush_interval=3600, flush_size=10**9
+        )
+        buffer.record_many([self.first.id] * 3)
+        context = multiprocessing.get_context("fork")
+        claimed, release = context.Event(), context.Event()
+        flusher = context.Process(
+            target=_spool_claimer, args=(self.spool_path, claimed, release)
+        )
+        flusher.start()
+        try:
+            self.assertTrue(claimed.wait(10))
+            with mock.patch("quotes.counters.apply_view_increments"):
+                self.assertEqual(buffer.flush(), 0)
+        finally:
+            release.set()
+            flusher.join()
+        # Процесс завершился, не применив файл: его подбирает следующий сброс.
+        self.assertEqual(buffer.flush(), 3)
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.views, 3)
+        self.assertFalse(os.listdir(self.spool_dir.name))
+
+    def test_flush_views_command(self):
+        with self.settings(QUOTES_VIEW_SPOOL=self.spool_path):
+            view_counter.record(self.first.id)
+            out = StringIO()
+            call_command("flush_views", stdout=out)
+        self.assertIn("Записано просмотров: 1", out.getvalue())
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.views, 1)
+
+    def test_random_quote_view_shows_pending_views(self):
+        Quote.objects.exclude(pk=self.second.id).delete()
+        with self.settings(QUOTES_VIEW_FLUSH_INTERVAL=60, QUOTES_CARD_CACHE_TTL=0):
+            self.client.get(reverse("quotes:random_quote"))
+            response = self.client.get(reverse("quotes:random_quote"))
+        self.assertEqual(response.context["views"], 9)
+        self.second.refresh_from_db()
+        self.assertEqual(self.second.views, 7)
+
+    def test_cached_card_shows_pending_views(self):
+        Quote.objects.exclude(pk=self.second.id).delete()
+        cache.clear()
+        with self.settings(QUOTES_VIEW_FLUSH_INTERVAL=60):
+            self.client.get(reverse("quotes:random_quote"))
+            with self.assertNumQueries(0):
+                response = self.client.get(reverse("quotes:random_quote"))
+        self.assertContains(response, "Просмотры: 9")
+
+
+class QuoteIncrementTest(TestCase):
+    def setUp(self):
+        self.source = Source.objects.create(name="Источник для голосов")
+        self.quote = Quote.objects.create(
+            text="Цитата для голосов", source=self.source, likes=2, dislikes=1
+        )
+
+    def test_increment_single_query_with_returning(self):
+        if not supports_update_returning(connection):
+            self.skipTest("Бэкенд не поддерживает UPDATE ... RETURNING")
+        with self.assertNumQueries(1):
+            updated = Quote.objects.filter(pk=self.quote.pk).increment(likes=1)
+        self.assertEqual(updated.likes, 3)
+        self.assertEqual(updated.text, self.quote.text)
+        self.assertEqual(updated.created_at, self.quote.created_at)
+
+    def test_increment_several_counters(self):
+        updated = Quote.objects.filter(pk=self.quote.pk).increment(
+            likes=1, dislikes=2, views=5
+        )
+        self.assertEqual((updated.likes, updated.dislikes, updated.views), (3, 3, 5))
+        self.quote.refresh_from_db()
+        self.assertEqual((self.quote.likes, self.quote.dislikes), (3, 3))
+
+    def test_increment_fallback_without_returning(self):
+        with mock.patch("quotes.models.supports_update_returning", return_value=False):
+            updated = Quote.objects.filter(pk=self.quote.pk).increment(dislikes=1)
+        self.assertEqual(updated.dislikes, 2)
+
+    def test_increment_missing_quote(self):
+        self.assertIsNone(Quote.objects.filter(pk=9999).increment(likes=1))
+        with mock.patch("quotes.models.supports_update_returning", return_value=False):
+            self.assertIsNone(Quote.objects.filter(pk=9999).increment(likes=1))
+
+
+@override_settings(QUOTES_DASHBOARD_TOP_SIZE=3)
+@override_settings(QUOTES_VOTE_RATE=0, QUOTES_VOTE_DEDUP_WINDOW=0)
+@override_settings(
+    QUOTES_ENGAGEMENT_FLUSH_INTERVAL=3600, QUOTES_ENGAGEMENT_FLUSH_SIZE=1000
+)
+class DashboardSnapshotTest(TestCase):
+    SNAPSHOT_FIELDS = (
+        "total_quotes",
+        "total_sources",
+        "total_likes",
+        "total_views",
+        "top_by_likes",
+        "top_by_views",
+        "most_recent",
+    )
+
+    def setUp(self):
+        cache.clear()
+        engagement_buffer.clear()
+        self.sources = [Source.objects.create(name=f"Снимок {i}") for i in range(3)]
+        self.quotes = [
+            Quote.objects.create(
+                text=f"Цитата снимка {i}",
+                source=self.sources[i % 3],
+                likes=i,
+                views=10 - i,
+            )
+            for i in range(1, 6)
+        ]
+        rebuild_snapshot()
+
+    def tearDown(self):
+        view_counter.clear()
+
+    def assertSnapshotConsistent(self):
+        incremental = get_snapshot()
+        rebuilt = rebuild_snapshot()
+        for field in self.SNAPSHOT_FIELDS:
+            self.assertEqual(
+                getattr(incremental, field), getattr(rebuilt, field), field
+            )
+
+    def test_dashboard_renders_in_constant_queries(self):
+        # Снимок, топ тренда по индексу и цитаты страниц.
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse("quotes:dashboard"))
+        self.assertEqual(response.context["total_quotes"], Quote.objects.count())
+        top_likes = [q.likes for q in response.context["top_by_likes_page"]]
+        self.assertEqual(top_likes, [5, 4, 3])
+
+    def test_increments_of_deleted_quotes_are_skipped(self):
+        deleted = self.quotes[0]
+        deleted.delete()
+        apply_view_increments({deleted.id: 5, self.quotes[1].id: 2})
+        self.assertSnapshotConsistent()
+
+    def test_votes_update_snapshot_in_batches(self):
+        quote = self.quotes[0]
+        version = get_snapshot().version
+        # Голос - один UPDATE ... RETURNING по строке цитаты.
+        with self.assertNumQueries(1):
+            self.client.post(reverse("quotes:like_quote", args=[quote.id]))
+        for _ in range(9):
+            self.client.post(reverse("quotes:like_quote", args=[quote.id]))
+        self.client.post(reverse("quotes:dislike_quote", args=[quote.id]))
+        # Голос не трогает строку снимка: она обновляется сбросом буфера.
+        self.assertEqual(get_snapshot().version, version)
+        engagement_buffer.flush()
+        snapshot = get_snapshot()
+        self.assertEqual(snapshot.version, version + 1)
+        self.assertEqual(snapshot.top_by_likes[0], [quote.id, 11])
+        self.assertSnapshotConsistent()
+
+    def test_delete_flushes_buffered_likes(self):
+        quote = self.quotes[-1]
+        self.client.post(reverse("quotes:like_quote", args=[quote.id]))
+        Quote.objects.get(pk=quote.id).delete()
+        self.assertSnapshotConsistent()
+
+    def test_view_flush_updates_snapshot(self):
+        buffer = ViewCounterBuffer(spool_path="", flush_interval=60, flush_size=100)
+        buffer.record_many([self.quotes[-1].id] * 20)
+        buffer.flush()
+        self.assertEqual(get_snapshot().top_by_views[0], [self.quotes[-1].id, 25])
+        self.assertSnapshotConsistent()
+
+    def test_admin_changes_update_snapshot(self):
+        source = Source.objects.create(name="Новый источник снимка")
+        Quote.objects.create(text="Свежая", source=source, likes=100)
+        self.assertSnapshotConsistent()
+
+        # Удаление из полного топа добирает следующую цитату из БД.
+        self.quotes[-1].delete()
+        self.assertSnapshotConsistent()
+
+        self.sources[0].delete()
+        self.assertSnapshotConsistent()
+
+    def test_missing_snapshot_is_built_on_read(self):
+        DashboardSnapshot.objects.all().delete()
+        Quote.objects.create(text="Без снимка", source=self.sources[0])
+        self.assertFalse(DashboardSnapshot.objects.exists())
+        self.assertEqual(get_snapshot().total_quotes, Quote.objects.count())
+
+    def test_rebuild_dashboard_command(self):
+        DashboardSnapshot.objects.all().delete()
+        out = StringIO()
+        call_command("rebuild_dashboard", stdout=out)
+        self.assertIn("Снимок дашборда пересчитан", out.getvalue())
+        self.assertEqual(get_snapshot().total_sources, Source.objects.count())
+
+
+class KeysetPaginationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Quote.objects.all().delete()
+        sources = [Source.objects.create(name=f"Курсор {i}") for i in range(9)]
+        for i in range(25):
+            Quote.objects.create(
+                text=f"Курсорная цитата {i}", source=sources[i % 9], likes=i // 3 + 1
+            )
+        cls.expected = list(
+            Quote.objects.order_by("-likes", "-id").values_list("id", flat=True)
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.paginator = KeysetPaginator(Quote.objects.all(), "likes", 10)
+
+    def test_walk_forward_and_back(self):
+        pages = [self.paginator.page()]
+        while pages[-1].has_next():
+            pages.append(self.paginator.page(pages[-1].next_page_number()))
+        collected = [q.id for page in pages for q in page]
+        self.assertEqual(collected, self.expected)
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        self.assertFalse(pages[0].has_previous())
+
+        previous = self.paginator.page(pages[-1].previous_page_number())
+        self.assertEqual([q.id for q in previous], [q.id for q in pages[1]])
+        self.assertTrue(previous.has_previous())
+        first = self.paginator.page(previous.previous_page_number())
+        self.assertEqual([q.id for q in first], self.expected[:10])
+        self.assertFalse(first.has_previous())
+
+    def test_deep_page_is_single_query_without_offset(self):
+        cursor = self.paginator.page().next_page_number()
+        with CaptureQueriesContext(connection) as ctx:
+            page = self.paginator.page(cursor)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertNotIn("OFFSET", ctx.captured_queries[0]["sql"])
+        self.assertEqual([q.id for q in page], self.expected[10:20])
+
+    def test_cursor_query_uses_index_range(self):
+        page = self.paginator.page(self.paginator.page().next_page_number())
+        for cursor in (page.next_page_number(), page.previous_page_number()):
+            _, queryset = self.paginator._page_query(cursor)
+            with connection.cursor() as db_cursor:
+                sql, params = queryset.query.sql_with_params()
+                db_cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+                plan = " ".join(row[-1] for row in db_cursor.fetchall())
+            self.assertIn("USING INDEX quote_likes_id_idx (likes", plan)
+            self.assertNotIn("MULTI-INDEX OR", plan)
+            self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_invalid_cursor_returns_first_page(self):
+        for cursor in ("abc", "a1", "x5.5", "a0.0"):
+            page = self.paginator.page(cursor)
+            self.assertEqual([q.id for q in page], self.expected[:10])
+
+    @override_settings(QUOTES_DASHBOARD_PAGINATION="keyset")
+    def test_dashboard_keyset_mode(self):
+        response = self.client.get(reverse("quotes:dashboard"))
+        page = response.context["top_by_likes_page"]
+        self.assertEqual([q.id for q in page], self.expected[:10])
+        self.assertTrue(page.next_page_number().startswith("a"))
+        self.assertContains(response, f"?page_likes={page.next_page_number()}")
+
+        response = self.client.get(
+            reverse("quotes:dashboard"), {"page_likes": page.next_page_number()}
+        )
+        page = response.context["top_by_likes_page"]
+        self.assertEqual([q.id for q in page], self.expected[10:20])
+
+
+@override_settings(QUOTES_VIEW_FLUSH_INTERVAL=60)
+@override_settings(QUOTES_VOTE_RATE=0, QUOTES_VOTE_DEDUP_WINDOW=0)
+class FragmentCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        fragment_cache.reset_stats()
+        Quote.objects.all().delete()
+        self.source = Source.objects.create(name="Источник для кэша")
+        self.quote = Quote.objects.create(text="Кэшируемая цитата", source=self.source)
+
+    def tearDown(self):
+        view_counter.clear()
+
+    def test_quote_card_cached_per_quote(self):
+        url = reverse("quotes:random_quote")
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.context["quote"], self.quote)
+        self.assertContains(response, "Кэшируемая цитата")
+        self.assertEqual(
+            fragment_cache.stats()["quote_card"]["hits"],
+            1,
+        )
+
+    def test_vote_and_edit_invalidate_card(self):
+        url = reverse("quotes:random_quote")
+        self.client.get(url)
+        self.client.post(reverse("quotes:like_quote", args=[self.quote.id]))
+        response = self.client.get(url)
+        self.assertContains(response, '<span id="likes-count">1</span>', html=True)
+
+        self.quote.text = "Исправленная цитата"
+        self.quote.save()
+        self.assertContains(self.client.get(url), "Исправленная цитата")
+
+        self.source.name = "Переименованный источник"
+        self.source.save()
+        self.assertContains(self.client.get(url), "Переименованный источник")
+
+    def test_dashboard_cached_per_page_pair(self):
+        url = reverse("quotes:dashboard")
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            self.client.get(url)
+        with self.assertNumQueries(3):
+            self.client.get(url, {"page_likes": 2})
+
+    @override_settings(QUOTES_DASHBOARD_CACHE_TTL=0)
+    def test_zero_ttl_disables_cache(self):
+        url = reverse("quotes:dashboard")
+        self.client.get(url)
+        with self.assertNumQueries(3):
+            self.client.get(url)
+
+    def test_single_flight(self):
+        single_flight = SingleFlightCache()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.1)
+            return "value"
+
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(
+                    single_flight.get_or_set("quotes:test:key", compute, 60)
+                )
+            )
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ["value"] * 8)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(single_flight.stats()["test"]["misses"], 1)
+
+    def test_cache_stats_view_requires_staff(self):
+        url = reverse("quotes:cache_stats")
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        User.objects.create_superuser("staff", "staff@test.com", "password")
+        self.client.login(username="staff", password="password")
+        self.client.get(reverse("quotes:random_quote"))
+        response = self.client.get(url)
+        self.assertEqual(response.json()["quote_card"]["misses"], 1)
+
+
+@override_settings(QUOTES_VIEW_FLUSH_INTERVAL=60)
+@override_settings(QUOTES_VOTE_RATE=0, QUOTES_VOTE_DEDUP_WINDOW=0)
+class AsyncViewsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        Quote.objects.all().delete()
+        self.factory = AsyncRequestFactory()
+        self.source = Source.objects.create(name="Асинхронный источник")
+        self.quotes = [
+            Quote.objects.create(
+                text=f"Асинхронная цитата {i}", source=self.source, likes=i, views=i
+            )
+            for i in range(1, 4)
+        ]
+
+    def tearDown(self):
+        view_counter.clear()
+
+    async def test_random_quote_view(self):
+        response = await async_views.random_quote_view(self.factory.get("/"))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Асинхронная цитата")
+        self.assertEqual(sum(view_counter._pending.values()), 1)
+
+    async def test_votes(self):
+        quote = self.quotes[0]
+        response = await async_views.like_quote(self.factory.post("/"), quote.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)["likes"], 2)
+
+        response = await async_views.dislike_quote(self.factory.post("/"), quote.id)
+        self.assertEqual(json.loads(response.content)["dislikes"], 1)
+
+        with self.assertRaises(Http404):
+            await async_views.like_quote(self.factory.post("/"), 9999)
+        response = await async_views.like_quote(self.factory.get("/"), quote.id)
+        self.assertEqual(response.status_code, 405)
+
+    async def test_dashboard_view(self):
+        response = await async_views.dashboard_view(self.factory.get("/dashboard/"))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Асинхронная цитата 3")
+        self.assertContains(response, "Топ по просмотрам")
+
+    @override_settings(QUOTES_DASHBOARD_PAGINATION="keyset")
+    async def test_dashboard_view_keyset_mode(self):
+        response = await async_views.dashboard_view(self.factory.get("/dashboard/"))
+        self.assertContains(response, "Асинхронная цитата 3")
+
+    async def test_arebuild_snapshot_matches_sync(self):
+        rebuilt = await arebuild_snapshot()
+        expected = await sync_to_async(rebuild_snapshot)()
+        for field in DashboardSnapshotTest.SNAPSHOT_FIELDS:
+            self.assertEqual(getattr(rebuilt, field), getattr(expected, field))
+
+
+@override_settings(QUOTES_VOTE_RATE=0, QUOTES_VOTE_DEDUP_WINDOW=0)
+class JsonApiTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        engagement_buffer.clear()
+        Quote.objects.all().delete()
+        self.source = Source.objects.create(name="Источник API")
+        self.quotes = [
+            Quote.objects.create(
+                text=f"Цитата API {i}", source=self.source, likes=i, views=10 - i
+            )
+            for i in range(1, 4)
+        ]
+        self.quote = self.quotes[0]
+
+    def tearDown(self):
+        view_counter.clear()
+
+    def test_quote_detail_conditional_get(self):
+        url = reverse("quotes:api_quote", args=[self.quote.id])
+        response = self.client.get(url)
+        self.assertEqual(response.json()["text"], "Цитата API 1")
+        etag = response["ETag"]
+        self.assertFalse(etag.startswith("W/"))
+        self.assertIn("Last-Modified", response)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.client.post(reverse("quotes:like_quote", args=[self.quote.id]))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["likes"], 2)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_quote_detail_if_modified_since(self):
+        url = reverse("quotes:api_quote", args=[self.quote.id])
+        last_modified = self.client.get(url)["Last-Modified"]
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_quote_detail_missing(self):
+        response = self.client.get(reverse("quotes:api_quote", args=[9999]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_source_rename_changes_validators(self):
+        url = reverse("quotes:api_quote", args=[self.quote.id])
+        etag = self.client.get(url)["ETag"]
+        top_url = reverse("quotes:api_top", args=["likes"])
+        top_etag = self.client.get(top_url)["ETag"]
+        updated_at = Quote.objects.get(pk=self.quote.id).updated_at
+
+        self.source.name = "Переименованный источник"
+        self.source.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["source"], "Переименованный источник")
+        self.assertGreater(Quote.objects.get(pk=self.quote.id).updated_at, updated_at)
+        response = self.client.get(top_url, HTTP_IF_NONE_MATCH=top_etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_random_redraws_deleted_quote(self):
+        with (
+            mock.patch.object(quote_sampler, "draw", side_effect=[9999, self.quote.id]),
+            mock.patch.object(quote_sampler, "invalidate") as invalidate,
+        ):
+            response = self.client.get(reverse("quotes:api_random_quote"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["id"], self.quote.id)
+        invalidate.assert_called_once_with()
+
+    def test_stats_conditional_get(self):
+        url = reverse("quotes:api_stats")
+        response = self.client.get(url)
+        self.assertEqual(response.json()["total_quotes"], 3)
+        self.assertEqual(response.json()["total_likes"], 6)
+        etag = response["ETag"]
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.client.post(reverse("quotes:like_quote", args=[self.quote.id]))
+        engagement_buffer.flush()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.json()["total_likes"], 7)
+
+    def test_top_pagination(self):
+        with mock.patch("quotes.api.API_PAGE_SIZE", 2):
+            response = self.client.get(reverse("quotes:api_top", args=["likes"]))
+            data = response.json()
+            self.assertEqual([q["likes"] for q in data["results"]], [3, 2])
+            self.assertIsNone(data["previous"])
+
+            response = self.client.get(
+                reverse("quotes:api_top", args=["likes"]), {"cursor": data["next"]}
+            )
+            data = response.json()
+        self.assertEqual([q["likes"] for q in data["results"]], [1])
+        self.assertIsNone(data["next"])
+
+        response = self.client.get(reverse("quotes:api_top", args=["views"]))
+        etag = response["ETag"]
+        response = self.client.get(
+            reverse("quotes:api_top", args=["views"]), HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(reverse("quotes:api_top", args=["weight"]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_top_etag_follows_page_counters(self):
+        url = reverse("quotes:api_top", args=["likes"])
+        etag = self.client.get(url)["ETag"]
+        self.client.post(reverse("quotes:dislike_quote", args=[self.quote.id]))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        results = {q["id"]: q for q in response.json()["results"]}
+        self.assertEqual(results[self.quote.id]["dislikes"], 1)
+
+    def test_random_quote_carries_detail_etag(self):
+        response = self.client.get(reverse("quotes:api_random_quote"))
+        data = response.json()
+        self.assertEqual(response["Cache-Control"], "no-cache")
+        detail = self.client.get(reverse("quotes:api_quote", args=[data["id"]]))
+        self.assertEqual(response["ETag"], detail["ETag"])
+
+        Quote.objects.all().delete()
+        response = self.client.get(reverse("quotes:api_random_quote"))
+        self.assertEqual(response.status_code, 404)
+
+
+class BatchSamplingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        Quote.objects.all().delete()
+        sources = [Source.objects.create(name=f"Пакет {i}") for i in range(10)]
+        self.quotes = [
+            Quote.objects.create(
+                text=f"Пакетная цитата {i}", source=sources[i % 10], weight=i + 1
+            )
+            for i in range(30)
+        ]
+        self.sampler = WeightedSampler()
+
+    def tearDown(self):
+        view_counter.clear()
+
+    def test_sample_without_replacement_is_distinct(self):
+        rng = random.Random(1)
+        for k in (1, 5, 15, 29, 30, 50):
+            ids = self.sampler.sample(k, rng=rng)
+            self.assertEqual(len(ids), min(k, 30))
+            self.assertEqual(len(set(ids)), len(ids))
+
+    def test_sample_with_replacement(self):
+        ids = self.sampler.sample(200, replace=True, rng=random.Random(2))
+        self.assertEqual(len(ids), 200)
+        self.assertLess(len(set(ids)), 200)
+
+    def test_sample_prefers_heavy_quotes(self):
+        rng = random.Random(3)
+        heavy, light = self.quotes[-1].id, self.quotes[0].id
+        counts = Counter()
+        for _ in range(300):
+            counts.update(self.sampler.sample(5, rng=rng))
+        self.assertGreater(counts[heavy], counts[light] * 5)
+
+    def test_concentrated_weights_fall_back(self):
+        Quote.objects.filter(pk=self.quotes[0].pk).update(weight=1000)
+        self.sampler.invalidate()
+        ids = self.sampler.sample(10, rng=random.Random(4))
+        self.assertEqual(len(set(ids)), 10)
+
+    @override_settings(QUOTES_VIEW_FLUSH_INTERVAL=60, QUOTES_VIEW_FLUSH_SIZE=20)
+    def test_batch_endpoint_records_views_in_one_update(self):
+        url = reverse("quotes:api_random_quotes_batch")
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, {"k": 20})
+        results = response.json()["results"]
+        self.assertEqual(len({q["id"] for q in results}), 20)
+        quote_updates = [
+            q
+            for q in ctx.captured_queries
+            if q["sql"].startswith('UPDATE "quotes_quote"')
+        ]
+        self.assertEqual(len(quote_updates), 1)
+        self.assertEqual(sum(Quote.objects.values_list("views", flat=True)), 20)
+
+        response = self.client.get(url, {"k": 5, "replace": "1"})
+        self.assertEqual(len(response.json()["results"]), 5)
+        self.assertEqual(self.client.get(url, {"k": "x"}).status_code, 400)
+
+
+class BenchmarkTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def tearDown(self):
+        view_counter.clear()
+        quote_sampler.invalidate()
+
+    def test_generate_fixtures_tops_up_to_size(self):
+        initial = Quote.objects.count()
+        generate_fixtures(initial + 25, batch_size=10)
+        self.assertEqual(Quote.objects.count(), initial + 25)
+        self.assertTrue(
+            all(
+                count <= Quote.MAX_QUOTES_PER_SOURCE
+                for count in Source.objects.annotate(n=Count("quotes")).values_list(
+                    "n", flat=True
+                )
+            )
+        )
+        self.assertEqual(get_snapshot().total_quotes, initial + 25)
+        # Повторный вызов догоняет, а не дублирует.
+        generate_fixtures(initial + 30, batch_size=10)
+        self.assertEqual(Quote.objects.count(), initial + 30)
+
+    def test_benchmark_report_structure(self):
+        generate_fixtures(Quote.objects.count() + 30)
+        results = benchmark_endpoints(repeat=2)
+        self.assertEqual(
+            set(results),
+            {
+                "random_quote",
+                "like_quote",
+                "dislike_quote",
+                "dashboard",
+                "dashboard_deep_page",
+                "random_quote_cached",
+                "dashboard_cached",
+            },
+        )
+        for stats in results.values():
+            self.assertEqual(stats["runs"], 2)
+            self.assertLessEqual(stats["min_ms"], stats["p95_ms"])
+        self.assertEqual(results["dashboard_cached"]["queries"], 0)
+
+    @override_settings(QUOTES_VOTE_RATE=0, QUOTES_VOTE_DEDUP_WINDOW=0)
+    @override_settings(
+        QUOTES_VIEW_FLUSH_INTERVAL=60, QUOTES_ENGAGEMENT_FLUSH_INTERVAL=60
+    )
+    def test_command_leaves_nothing_for_exit_hooks(self):
+        from quotes import counters, engagement, votes
+
+        snapshots = []
+        command = "quotes.management.commands.benchmark_quotes"
+        # Замеры идут на текущей тестовой БД; "удаление" временной БД
+        # запоминает снимок, который после него трогать нельзя.
+        with (
+            mock.patch(f"{command}.setup_databases"),
+            mock.patch(
+                f"{command}.teardown_databases",
+                side_effect=lambda *args, **kwargs: snapshots.append(
+                    DashboardSnapshot.objects.get().version
+                ),
+            ),
+            mock.patch(f"{command}.setup_test_environment"),
+            mock.patch(f"{command}.teardown_test_environment"),
+        ):
+            call_command(
+                "benchmark_quotes",
+                sizes=[Quote.objects.count() + 30],
+                repeat=2,
+                stdout=StringIO(),
+                stderr=StringIO(),
+            )
+        counters._flush_on_exit()
+        engagement._flush_on_exit()
+        votes._drain_on_exit()
+        self.assertEqual(DashboardSnapshot.objects.get().version, snapshots[0])
+
+    def test_compare_reports(self):
+        baseline = {"results": {"100": {"dashboard": {"median_ms": 10, "queries": 2}}}}
+        current = {
+            "results": {
+                "100": {
+                    "dashboard": {"median_ms": 11, "queries": 2},
+                    "new_scenario": {"median_ms": 50, "queries": 9},
+                }
+            }
+        }
+        self.assertEqual(compare_reports(baseline, current, 0.2), [])
+        current["results"]["100"]["dashboard"] = {"median_ms": 13, "queries": 3}
+        self.assertEqual(len(compare_reports(baseline, current, 0.2)), 2)
+
+
+class ImportQuotesTest(TestCase):
+    def setUp(self):
+        self.source = Source.objects.create(name="Импортный источник")
+        Quote.objects.create(text="Уже есть", source=self.source)
+        Quote.objects.create(text="Тоже есть", source=self.source)
+
+    def tearDown(self):
+        quote_sampler.invalidate()
+
+    def _write(self, suffix, content):
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_jsonl_import_enforces_model_rules(self):
+        rows = [
+            {"text": "Новая 1", "source": "Импортный источник", "weight": 500},
+            {"text": "Новая 2", "source": "Импортный источник"},
+            {"text": "Уже есть", "source": "Другой источник"},
+            {"text": "Новая 3", "source": "Другой источник"},
+            {"text": "Новая 3", "source": "Третий источник"},
+            {"text": "Без веса", "source": "Третий источник", "weight": 5000},
+            {"text": "", "source": "Третий источник"},
+        ]
+        content = "\n".join(json.dumps(row, ensure_ascii=False) for row in rows)
+        path = self._write(".jsonl", content + "\n{broken\n")
+        out = StringIO()
+        call_command("import_quotes", path, "--chunk-size", "3", stdout=out)
+
+        self.assertIn("добавлено цитат 2", out.getvalue())
+        self.assertEqual(self.source.quotes.count(), 3)
+        self.assertEqual(Quote.objects.get(text="Новая 1").weight, 500)
+        self.assertEqual(
+            Quote.objects.get(text="Новая 3").source.name, "Другой источник"
+        )
+        self.assertFalse(Source.objects.filter(name="Третий источник").exists())
+        self.assertEqual(get_snapshot().total_quotes, Quote.objects.count())
+
+    def test_csv_import_with_constant_queries_per_chunk(self):
+        lines = ["text,source,weight"] + [
+            f"Цитата {i},Источник {i // 3},{i % 1000 + 1}" for i in range(60)
+        ]
+        path = self._write(".csv", "\n".join(lines))
+        importer = QuoteImporter(chunk_size=30)
+        with (
+            open(path, encoding="utf-8") as f,
+            CaptureQueriesContext(connection) as ctx,
+        ):
+            importer.run(read_records(f, "csv"))
+        self.assertEqual(importer.stats["created"], 60)
+        self.assertEqual(importer.stats["sources"], 20)
+        # Хеши текстов, по 4 запроса на пачку, пересчет снимка.
+        self.assertLess(len(ctx.captured_queries), 30)
+
+
+class ExportQuotesTest(TestCase):
+    def setUp(self):
+        source = Source.objects.create(name="Источник выгрузки")
+        self.quotes = [
+            Quote.objects.create(text=f"Выгрузка {i}", source=source, likes=i)
+            for i in range(3)
+        ]
+
+    def _export(self, *args):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        err = StringIO()
+        call_command("export_quotes", "--output", path, *args, stderr=err)
+        return path, err.getvalue()
+
+    def test_jsonl_export_and_incremental_cursor(self):
+        path, err = self._export("--chunk-size", "2")
+        with open(path, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual(len(records), Quote.objects.count())
+        exported = {r["id"]: r for r in records}
+        self.assertEqual(exported[self.quotes[2].id]["likes"], 2)
+        self.assertEqual(exported[self.quotes[2].id]["source"], "Источник выгрузки")
+
+        cursor = err.split(": ", 1)[1].split()
+        newer = Quote.objects.create(
+            text="Новая после выгрузки",
+            source=Source.objects.create(name="Другой источник"),
+        )
+        path, _ = self._export(*cursor)
+        with open(path, encoding="utf-8") as f:
+            self.assertEqual([json.loads(line)["id"] for line in f], [newer.id])
+
+    def test_stdout_export_goes_through_command_output(self):
+        out = StringIO()
+        call_command("export_quotes", stdout=out, stderr=StringIO())
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(len(records), Quote.objects.count())
+
+    def test_invalid_option_combinations(self):
+        with self.assertRaisesMessage(CommandError, "--since-id"):
+            call_command("export_quotes", "--since-id", "5")
+        with self.assertRaisesMessage(CommandError, "--output"):
+            call_command("export_quotes", "--gzip")
+
+    def test_gzip_csv_export(self):
+        path, _ = self._export("--format", "csv", "--gzip")
+        with gzip.open(path, "rt", encoding="utf-8", newline="") as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(len(rows), Quote.objects.count())
+        self.assertEqual(rows[-1]["text"], "Выгрузка 2")
+
+    def test_export_view_requires_staff_and_streams(self):
+        url = reverse("quotes:export_quotes")
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        User.objects.create_superuser("staff", "staff@test.com", "password")
+        self.client.login(username="staff", password="password")
+        response = self.client.get(url, {"format": "csv", "gzip": "1"})
+        self.assertTrue(response.streaming)
+        content = gzip.decompress(b"".join(response.streaming_content)).decode()
+        self.assertEqual(len(content.strip().splitlines()), Quote.objects.count() + 1)
+
+        last = self.quotes[1]
+        response = self.client.get(
+            url, {"since": last.created_at.isoformat(), "since_id": last.id}
+        )
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(
+            [json.loads(line)["id"] for line in lines], [self.quotes[2].id]
+        )
+        self.assertEqual(self.client.get(url, {"since": "вчера"}).status_code, 400)
+        self.assertEqual(self.client.get(url, {"since_id": "5"}).status_code, 400)
+
+
+@override_settings(QUOTES_VOTE_RATE=0, QUOTES_VOTE_DEDUP_WINDOW=0)
+class MetricsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        request_metrics.reset()
+        source = Source.objects.create(name="Источник метрик")
+        self.quote = Quote.objects.create(text="Метрика", source=source)
+
+    def tearDown(self):
+        view_counter.clear()
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram((1, 5))
+        for value in (0, 1, 3, 10):
+            histogram.observe(value)
+        self.assertEqual(histogram.cumulative(), [(1, 2), (5, 3), ("+Inf", 4)])
+        self.assertEqual(histogram.sum, 14)
+
+    def test_middleware_records_queries_per_view(self):
+        url = reverse("quotes:like_quote", args=[self.quote.id])
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(url)
+        self.assertRegex(
+            response["Server-Timing"],
+            rf'db;dur=[\d.]+;desc="{len(ctx.captured_queries)} queries", total;dur=',
+        )
+        metrics = request_metrics.get("quotes:like_quote")
+        self.assertEqual(metrics.latency.count, 1)
+        self.assertEqual(metrics.queries.sum, len(ctx.captured_queries))
+
+    def test_streaming_response_recorded_on_close(self):
+        User.objects.create_superuser("staff", "staff@test.com", "password")
+        self.client.login(username="staff", password="password")
+        request_metrics.reset()
+        response = self.client.get(reverse("quotes:export_quotes"))
+        self.assertNotIn("Server-Timing", response)
+        self.assertIsNone(request_metrics.get("quotes:export_quotes"))
+        with CaptureQueriesContext(connection) as ctx:
+            b"".join(response.streaming_content)
+        metrics = request_metrics.get("quotes:export_quotes")
+        self.assertEqual(metrics.latency.count, 1)
+        self.assertGreaterEqual(metrics.queries.sum, len(ctx.captured_queries))
+        self.assertGreater(len(ctx.captured_queries), 0)
+
+    def test_middleware_chain_stays_async(self):
+        # Синхронная middleware заставила бы Django перевести цепочку (и
+        # async-view) в поток; при DEBUG он пишет об этом в лог.
+        with override_settings(DEBUG=True):
+            with self.assertNoLogs("django.request", "DEBUG"):
+                ASGIHandler().load_middleware(is_async=True)
+        for middleware_class in (QueryMetricsMiddleware, ReplicaPinMiddleware):
+            middleware = middleware_class(async_views.dashboard_view)
+            self.assertTrue(iscoroutinefunction(middleware))
+
+    @override_settings(QUOTES_SERVER_TIMING=False)
+    def test_server_timing_can_be_disabled(self):
+        response = self.client.get(reverse("quotes:random_quote"))
+        self.assertNotIn("Server-Timing", response)
+        self.assertIsNotNone(request_metrics.get("quotes:random_quote"))
+
+    def test_metrics_view_requires_staff(self):
+        url = reverse("quotes:metrics")
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        User.objects.create_superuser("staff", "staff@test.com", "password")
+        self.client.login(username="staff", password="password")
+        self.client.get(reverse("quotes:dashboard"))
+        content = self.client.get(url).content.decode()
+        self.assertIn("# TYPE quotes_request_duration_seconds histogram", content)
+        self.assertIn(
+            'quotes_request_duration_seconds_bucket{view="quotes:dashboard",le="+Inf"} 1',
+            content,
+        )
+        self.assertIn('quotes_db_queries_total{view="quotes:dashboard"}', content)
+
+
+class SQLiteTuningTest(TestCase):
+    def _file_connection(self, path):
+        settings_dict = {**connection.settings_dict, "NAME": path}
+        return SQLiteWrapper(settings_dict, alias="sqlite_tuning")
+
+    def test_pragmas_applied_on_connect(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            db = self._file_connection(os.path.join(tmp, "tuning.sqlite3"))
+            try:
+                with db.cursor() as cursor:
+                    cursor.execute("PRAGMA journal_mode")
+                    self.assertEqual(cursor.fetchone()[0], "wal")
+                    cursor.execute("PRAGMA busy_timeout")
+                    self.assertEqual(cursor.fetchone()[0], 5000)
+                    cursor.execute("PRAGMA synchronous")
+                    self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            finally:
+                db.close()
+
+    def test_parallel_votes_do_not_fail(self):
+        threads_count, votes_per_thread = 8, 25
+        # Тот же UPDATE ... RETURNING, что выполняет like_quote.
+        source = Source.objects.create(name="Параллельный источник")
+        quote = Quote.objects.create(text="Параллельная цитата", source=source)
+        with CaptureQueriesContext(connection) as ctx:
+            Quote.objects.filter(pk=quote.pk).increment(likes=1)
+        vote_sql = ctx.captured_queries[-1]["sql"]
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "votes.sqlite3")
+            setup = self._file_connection(path)
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT sql FROM sqlite_master WHERE sql IS NOT NULL "
+                    "AND tbl_name IN ('quotes_source', 'quotes_quote', 'quotes_quote_fts')"
+                )
+                schema = [row[0] for row in cursor.fetchall()]
+            with setup.cursor() as cursor:
+                for statement in schema:
+                    cursor.execute(statement)
+                cursor.execute(
+                    "INSERT INTO quotes_source (id, name, kind) VALUES (%s, %s, %s)",
+                    [source.pk, source.name, source.kind],
+                )
+                cursor.execute(
+                    "INSERT INTO quotes_quote (id, text, source_id, weight, likes, "
+                    "dislikes, views, created_at, updated_at) "
+                    "VALUES (%s, %s, %s, 100, 0, 0, 0, %s, %s)",
+                    [
+                        quote.pk,
+                        quote.text,
+                        source.pk,
+                        quote.created_at,
+                        quote.updated_at,
+                    ],
+                )
+            setup.close()
+
+            errors = []
+
+            def voter():
+                db = self._file_connection(path)
+                try:
+                    for _ in range(votes_per_thread):
+                        with db.cursor() as cursor:
+                            cursor.execute(vote_sql)
+                            cursor.fetchall()
+                except Exception as e:
+                    errors.append(e)
+                finally:
+                    db.close()
+
+            threads = [threading.Thread(target=voter) for _ in range(threads_count)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            check = self._file_connection(path)
+            with check.cursor() as cursor:
+                cursor.execute(
+                    "SELECT likes FROM quotes_quote WHERE id = %s", [quote.pk]
+                )
+                likes = cursor.fetchone()[0]
+            check.close()
+        self.assertEqual(errors, [])
+        self.assertEqual(likes, threads_count * votes_per_thread)
+
+
+class ReplicaRouterTest(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        for target in ("quotes.routers", "quotes.middleware"):
+            patcher = mock.patch(f"{target}.replica_configured", return_value=True)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_reads_go_to_replica_until_pinned(self):
+        with primary_pin_scope():
+            self.assertEqual(self.router.db_for_read(Quote), "replica")
+            self.assertIsNone(self.router.db_for_read(User))
+            self.assertEqual(self.router.db_for_write(Quote), "default")
+            # После записи чтения до конца запроса идут в основную БД.
+            self.assertEqual(self.router.db_for_read(Quote), "default")
+
+    def test_transaction_reads_from_primary(self):
+        with (
+            primary_pin_scope(),
+            mock.patch.object(connections["default"], "in_atomic_block", True),
+        ):
+            self.assertEqual(self.router.db_for_read(Quote), "default")
+
+    def test_no_routing_without_replica(self):
+        with (
+            primary_pin_scope(),
+            mock.patch("quotes.routers.replica_configured", return_value=False),
+        ):
+            self.assertIsNone(self.router.db_for_read(Quote))
+
+    @override_settings(DB_REPLICA_PIN_SECONDS=7)
+    def test_middleware_pins_client_after_post(self):
+        read_from = []
+
+        def get_response(request):
+            read_from.append(self.router.db_for_read(Quote))
+            return HttpResponse()
+
+        middleware = ReplicaPinMiddleware(get_response)
+        factory = RequestFactory()
+        response = middleware(factory.post("/quote/1/like/"))
+        self.assertEqual(response.cookies[PIN_COOKIE]["max-age"], 7)
+
+        pinned = factory.get("/")
+        pinned.COOKIES[PIN_COOKIE] = "1"
+        response = middleware(pinned)
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        middleware(factory.get("/"))
+        self.assertEqual(read_from, ["replica", "default", "replica"])
+
+    async def test_async_middleware_pins_client(self):
+        read_from = []
+
+        async def get_response(request):
+            read_from.append(self.router.db_for_read(Quote))
+            return HttpResponse()
+
+        middleware = ReplicaPinMiddleware(get_response)
+        self.assertTrue(iscoroutinefunction(middleware))
+        factory = RequestFactory()
+        response = await middleware(factory.post("/quote/1/like/"))
+        self.assertIn(PIN_COOKIE, response.cookies)
+        pinned = factory.get("/")
+        pinned.COOKIES[PIN_COOKIE] = "1"
+        await middleware(pinned)
+        self.assertEqual(read_from, ["replica", "default"])
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class VoteGuardTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        vote_guard.reset()
+        source = Source.objects.create(name="Источник голосов")
+        self.quotes = [
+            Quote.objects.create(text=f"Голос {i}", source=source) for i in range(3)
+        ]
+
+    def test_bloom_filter_remembers_keys_for_window(self):
+        clock = FakeClock()
+        seen = RotatingBloomFilter(capacity=100, window=60, clock=clock)
+        self.assertTrue(seen.add("a:1"))
+        self.assertFalse(seen.add("a:1"))
+        clock.now += 90  # ключ переехал в предыдущий фильтр
+        self.assertFalse(seen.add("a:1"))
+        clock.now += 60
+        self.assertTrue(seen.add("a:1"))
+
+    def test_bloom_filter_false_positive_rate(self):
+        # Проверка тоже добавляет ключи, поэтому емкость - на все 2000.
+        seen = RotatingBloomFilter(capacity=2000, window=60)
+        for i in range(1000):
+            seen.add(f"client:{i}")
+        false_positives = sum(not seen.add(f"other:{i}") for i in range(1000))
+        self.assertLess(false_positives, 10)
+
+    def test_token_bucket_refills_and_is_bounded(self):
+        clock = FakeClock()
+        limiter = TokenBucketLimiter(rate=1, burst=2, max_clients=2, clock=clock)
+        self.assertEqual(limiter.consume("a"), 0)
+        self.assertEqual(limiter.consume("a"), 0)
+        self.assertAlmostEqual(limiter.consume("a"), 1)
+        clock.now += 1
+        self.assertEqual(limiter.consume("a"), 0)
+        limiter.consume("b")
+        limiter.consume("c")
+        self.assertEqual(len(limiter._buckets), 2)
+
+    def _assert_votes_guarded(self):
+        like = lambda quote: reverse("quotes:like_quote", args=[quote.id])  # noqa: E731
+        self.assertEqual(self.client.post(like(self.quotes[0])).status_code, 200)
+        response = self.client.post(
+            reverse("quotes:dislike_quote", args=[self.quotes[0].id])
+        )
+        self.assertEqual(response.status_code, 409)
+        response = self.client.post(like(self.quotes[1]))
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "1")
+        # Другой клиент голосует независимо.
+        response = self.client.post(like(self.quotes[0]), REMOTE_ADDR="10.0.0.2")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Quote.objects.get(pk=self.quotes[0].pk).likes, 2)
+
+    @override_settings(QUOTES_VOTE_RATE=1, QUOTES_VOTE_BURST=2)
+    def test_memory_backend(self):
+        self._assert_votes_guarded()
+
+    @override_settings(QUOTES_VOTE_RATE=0)
+    def test_fresh_csrf_cookie_does_not_bypass_dedup(self):
+        url = reverse("quotes:like_quote", args=[self.quotes[0].id])
+        for i in range(2):
+            self.client.cookies["csrftoken"] = f"{i:032d}"
+            response = self.client.post(url)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Quote.objects.get(pk=self.quotes[0].pk).likes, 1)
+
+    @override_settings(QUOTES_VOTE_RATE=0)
+    def test_users_behind_one_address_vote_independently(self):
+        url = reverse("quotes:like_quote", args=[self.quotes[0].id])
+        for name in ("first", "second"):
+            user = User.objects.create_user(name, password="password")
+            self.client.force_login(user)
+            self.assertEqual(self.client.post(url).status_code, 200)
+        self.assertEqual(self.client.post(url).status_code, 409)
+        self.assertEqual(Quote.objects.get(pk=self.quotes[0].pk).likes, 2)
+
+    @override_settings(
+        QUOTES_VOTE_RATE=1,
+        QUOTES_VOTE_BURST=1,
+        QUOTES_VOTE_DEDUP_WINDOW=0,
+        QUOTES_CLIENT_IP_HEADER="HTTP_X_FORWARDED_FOR",
+    )
+    def test_rate_limit_uses_trusted_forwarded_header(self):
+        url = reverse("quotes:like_quote", args=[self.quotes[0].id])
+        for address in ("203.0.113.1", "203.0.113.2"):
+            response = self.client.post(
+                url, HTTP_X_FORWARDED_FOR=f"10.9.9.9, {address}"
+            )
+            self.assertEqual(response.status_code, 200)
+        response = self.client.post(url, HTTP_X_FORWARDED_FOR="203.0.113.1")
+        self.assertEqual(response.status_code, 429)
+
+    @override_settings(QUOTES_VOTE_RATE=0)
+    def test_failed_vote_is_not_deduplicated(self):
+        url = reverse("quotes:like_quote", args=[self.quotes[0].id])
+        with mock.patch(
+            "quotes.models.QuoteQuerySet.increment", side_effect=DatabaseError
+        ):
+            with self.assertRaises(DatabaseError):
+                self.client.post(url)
+        self.assertEqual(self.client.post(url).status_code, 200)
+        self.assertEqual(self.client.post(url).status_code, 409)
+
+    @override_settings(
+        QUOTES_VOTE_GUARD_BACKEND="cache", QUOTES_VOTE_RATE=1, QUOTES_VOTE_BURST=2
+    )
+    def test_cache_backend(self):
+        self._assert_votes_guarded()
+        vote_guard.reset()
+        # Состояние общее для процессов и переживает пересоздание ограничителей.
+        response = self.client.post(
+            reverse("quotes:like_quote", args=[self.quotes[0].id]),
+            REMOTE_ADDR="10.0.0.2",
+        )
+        self.assertEqual(response.status_code, 409)
+
+
+@override_settings(
+    QUOTES_COUNTER_MODE="sharded",
+    QUOTES_COUNTER_SHARDS=4,
+    QUOTES_VOTE_RATE=0,
+    QUOTES_VOTE_DEDUP_WINDOW=0,
+)
+class ShardedCountersTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        engagement_buffer.clear()
+        self.source = Source.objects.create(name="Шардированный источник")
+        self.quote = Quote.objects.create(
+            text="Горячая цитата", source=self.source, likes=10, views=100
+        )
+        rebuild_snapshot()
+
+    def _vote(self, times):
+        url = reverse("quotes:like_quote", args=[self.quote.id])
+        for _ in range(times):
+            response = self.client.post(url)
+        return response
+
+    def test_votes_go_to_shards(self):
+        response = self._vote(20)
+        self.assertEqual(response.json()["likes"], 30)
+        self.quote.refresh_from_db()
+        self.assertEqual(self.quote.likes, 10)
+        self.assertLessEqual(self.quote.counter_shards.count(), 4)
+        self.assertEqual(Quote.objects.with_counters().get(pk=self.quote.pk).likes, 30)
+
+        engagement_buffer.flush()
+        snapshot = get_snapshot()
+        self.assertEqual(snapshot.total_likes, 30)
+        self.assertEqual(snapshot.top_by_likes, [[self.quote.id, 30]])
+        self.assertEqual(rebuild_snapshot().top_by_likes, [[self.quote.id, 30]])
+        self.assertEqual(get_snapshot().total_likes, 30)
+
+    def test_api_top_shows_full_counters(self):
+        other = Quote.objects.create(text="Холодная", source=self.source, likes=5)
+        self._vote(20)
+        url = reverse("quotes:api_top", args=["likes"])
+        with mock.patch("quotes.api.API_PAGE_SIZE", 1):
+            data = self.client.get(url).json()
+            self.assertEqual(data["results"][0]["likes"], 30)
+            data = self.client.get(url, {"cursor": data["next"]}).json()
+        self.assertEqual([q["id"] for q in data["results"]], [other.id])
+        detail = self.client.get(reverse("quotes:api_quote", args=[self.quote.id]))
+        self.assertEqual(detail.json()["likes"], 30)
+
+    def test_missing_quote(self):
+        self.assertIsNone(Quote.objects.filter(pk=9999).increment(likes=1))
+        self.assertFalse(QuoteCounterShard.objects.exists())
+
+    def test_views_flush_and_api_read_shards(self):
+        apply_view_increments({self.quote.id: 5})
+        self.assertEqual(Quote.objects.get(pk=self.quote.pk).views, 100)
+        self.assertEqual(get_snapshot().total_views, 105)
+        response = self.client.get(reverse("quotes:api_quote", args=[self.quote.id]))
+        self.assertEqual(response.json()["views"], 105)
+        etag = response["ETag"]
+        self._vote(1)
+        response = self.client.get(
+            reverse("quotes:api_quote", args=[self.quote.id]), HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_compaction_folds_shards_into_quote(self):
+        self._vote(7)
+        apply_view_increments({self.quote.id: 5})
+        out = StringIO()
+        call_command("compact_counters", stdout=out)
+        self.assertIn("Свернуто шардов", out.getvalue())
+        self.assertFalse(QuoteCounterShard.objects.exists())
+        self.quote.refresh_from_db()
+        self.assertEqual((self.quote.likes, self.quote.views), (17, 105))
+        self.assertEqual(Quote.objects.with_counters().get(pk=self.quote.pk).likes, 17)
+
+    def test_admin_save_does_not_store_shard_totals(self):
+        self._vote(3)
+        User.objects.create_superuser("admin", "admin@test.com", "password")
+        self.client.login(username="admin", password="password")
+        url = reverse("admin:quotes_quote_change", args=[self.quote.id])
+        self.assertContains(self.client.get(url), "13")
+        self.client.post(
+            url, {"text": "Отредактированная", "source": self.source.id, "weight": 5}
+        )
+        self.quote.refresh_from_db()
+        self.assertEqual((self.quote.text, self.quote.likes), ("Отредактированная", 10))
+        compact_counter_shards()
+        self.quote.refresh_from_db()
+        self.assertEqual(self.quote.likes, 13)
+
+    def test_delete_subtracts_shards_from_snapshot(self):
+        self._vote(4)
+        self.quote.delete()
+        snapshot = get_snapshot()
+        self.assertEqual((snapshot.total_likes, snapshot.total_views), (0, 0))
+
+
+@override_settings(
+    QUOTES_VOTE_RATE=0,
+    QUOTES_VOTE_DEDUP_WINDOW=0,
+    QUOTES_ENGAGEMENT_FLUSH_INTERVAL=3600,
+    QUOTES_ENGAGEMENT_FLUSH_SIZE=1000,
+    QUOTES_TRENDING_HALF_LIFE=6,
+)
+class EngagementTest(TestCase):
+    def setUp(self):
+        engagement_buffer.clear()
+        view_counter.clear()
+        self.source = Source.objects.create(name="Источник тренда")
+        self.first = Quote.objects.create(text="Трендовая 1", source=self.source)
+        self.second = Quote.objects.create(text="Трендовая 2", source=self.source)
+        self.now = timezone.now()
+
+    def hourly(self, quote):
+        return QuoteEngagement.objects.get(quote=quote, period=QuoteEngagement.HOUR)
+
+    def test_votes_are_buffered(self):
+        url = reverse("quotes:like_quote", args=[self.first.id])
+        self.client.post(url)
+        self.client.post(url)
+        self.client.post(reverse("quotes:dislike_quote", args=[self.first.id]))
+        self.assertFalse(QuoteEngagement.objects.exists())
+
+        self.assertEqual(engagement_buffer.flush(), 3)
+        row = self.hourly(self.first)
+        self.assertEqual((row.likes, row.dislikes, row.views), (2, 1, 0))
+        self.assertEqual(row.bucket, bucket_start(self.now, QuoteEngagement.HOUR))
+        self.assertEqual([quote_id for quote_id, _ in trending(5)], [self.first.id])
+
+    def test_failed_flush_is_not_applied_twice(self):
+        engagement_buffer.record(self.first.id, "likes")
+        engagement_buffer.record(self.second.id, "likes")
+        with (
+            mock.patch("quotes.engagement.FLUSH_CHUNK_SIZE", 1),
+            mock.patch(
+                "quotes.engagement.record_likes", side_effect=DatabaseError("сбой")
+            ),
+            self.assertRaises(DatabaseError),
+        ):
+            engagement_buffer.flush()
+        self.assertFalse(QuoteEngagement.objects.exists())
+        self.assertEqual(engagement_buffer.flush(), 2)
+        self.assertEqual(self.hourly(self.first).likes, 1)
+        self.assertEqual(self.hourly(self.second).likes, 1)
+
+    def test_views_feed_rollups(self):
+        apply_view_increments({self.first.id: 3})
+        apply_view_increments({self.first.id: 2, self.second.id: 1})
+        self.assertEqual(self.hourly(self.first).views, 5)
+        self.assertEqual(self.hourly(self.second).views, 1)
+
+    def test_deleted_quote_is_skipped(self):
+        missing_id = self.second.id
+        self.second.delete()
+        apply_engagement({"views": {missing_id: 1, self.first.id: 1}})
+        self.assertEqual(QuoteEngagement.objects.count(), 1)
+        self.assertEqual(QuoteTrend.objects.count(), 1)
+
+    def test_trending_scores_decay(self):
+        # 100 просмотров сутки назад - это 4 периода полураспада.
+        apply_engagement(
+            {"views": {self.first.id: 100}}, now=self.now - timedelta(hours=24)
+        )
+        apply_engagement({"views": {self.second.id: 10}}, now=self.now)
+        with self.assertNumQueries(1):
+            top = trending(5, now=self.now)
+        self.assertEqual(
+            [quote_id for quote_id, _ in top], [self.second.id, self.first.id]
+        )
+        self.assertAlmostEqual(top[0][1], 10)
+        self.assertAlmostEqual(top[1][1], 6.25)
+
+        apply_engagement({"likes": {self.first.id: 1}}, now=self.now)
+        self.assertAlmostEqual(dict(trending(5, now=self.now))[self.first.id], 11.25)
+
+    def test_rollup_folds_expires_and_prunes(self):
+        day = bucket_start(self.now - timedelta(days=5), QuoteEngagement.DAY)
+        apply_engagement({"views": {self.first.id: 2}}, now=day + timedelta(hours=1))
+        apply_engagement({"likes": {self.first.id: 1}}, now=day + timedelta(hours=5))
+        apply_engagement({"views": {self.second.id: 1}}, now=self.now)
+        QuoteEngagement.objects.create(
+            quote=self.second,
+            period=QuoteEngagement.DAY,
+            bucket=day - timedelta(days=100),
+            views=7,
+        )
+
+        stats = rollup_engagement(now=self.now)
+        self.assertEqual(stats, Counter(folded=2, expired=1, pruned=1))
+        daily = QuoteEngagement.objects.get(period=QuoteEngagement.DAY)
+        self.assertEqual(
+            (daily.quote_id, daily.bucket, daily.likes, daily.views),
+            (self.first.id, day, 1, 2),
+        )
+        self.assertEqual(self.hourly(self.second).views, 1)
+        self.assertEqual([quote_id for quote_id, _ in trending(5)], [self.second.id])
+
+    def test_rebuild_trending_from_rollups(self):
+        hour = bucket_start(self.now, QuoteEngagement.HOUR)
+        apply_engagement(
+            {"views": {self.first.id: 4}, "likes": {self.second.id: 1}},
+            now=hour + timedelta(minutes=30),
+        )
+        before = dict(QuoteTrend.objects.values_list("quote_id", "log_score"))
+        with self.settings(QUOTES_TRENDING_HALF_LIFE=6):
+            self.assertEqual(rebuild_trending(), 2)
+        after = dict(QuoteTrend.objects.values_list("quote_id", "log_score"))
+        self.assertEqual(before.keys(), after.keys())
+        for quote_id, score in before.items():
+            self.assertAlmostEqual(after[quote_id], score)
+
+    def test_dashboard_shows_trending(self):
+        apply_engagement({"likes": {self.second.id: 1}})
+        response = self.client.get(reverse("quotes:dashboard"))
+        self.assertEqual(
+            [quote.id for quote in response.context["trending"]], [self.second.id]
+        )
+        self.assertContains(response, "🔥 5,0")
+
+
+@override_settings(
+    QUOTES_VOTE_RATE=0,
+    QUOTES_VOTE_DEDUP_WINDOW=0,
+    QUOTES_VOTE_FLUSH_INTERVAL=0,
+    QUOTES_ENGAGEMENT_FLUSH_INTERVAL=3600,
+    QUOTES_ENGAGEMENT_FLUSH_SIZE=1000,
+)
+class VoteJournalTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        engagement_buffer.clear()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.journal = VoteJournal(directory=self.tmp.name)
+        self.source = Source.objects.create(name="Источник журнала")
+        self.first = Quote.objects.create(
+            text="Журнальная 1", source=self.source, likes=10, dislikes=1
+        )
+        self.second = Quote.objects.create(text="Журнальная 2", source=self.source)
+
+    def tearDown(self):
+        self.journal.clear()
+        vote_journal.clear()
+        self.tmp.cleanup()
+
+    def journal_files(self):
+        return sorted(os.listdir(self.tmp.name))
+
+    def test_record_answers_from_overlay(self):
+        with self.assertNumQueries(1):
+            counts = self.journal.record(self.first.id, "likes")
+        self.assertEqual(counts, {"likes": 11, "dislikes": 1})
+        with self.assertNumQueries(0):
+            counts = self.journal.record(self.first.id, "dislikes")
+        self.assertEqual(counts, {"likes": 11, "dislikes": 2})
+        self.assertIsNone(self.journal.record(9999, "likes"))
+
+        self.first.refresh_from_db()
+        self.assertEqual((self.first.likes, self.first.dislikes), (10, 1))
+        (name,) = self.journal_files()
+        entries = read_journal(os.path.join(self.tmp.name, name))
+        self.assertEqual(
+            entries, [(1, self.first.id, "likes"), (2, self.first.id, "dislikes")]
+        )
+
+    def test_drain_applies_votes_in_one_update(self):
+        for _ in range(3):
+            self.journal.record(self.first.id, "likes")
+        self.journal.record(self.second.id, "dislikes")
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.journal.drain(), 4)
+        quote_updates = [
+            q
+            for q in ctx.captured_queries
+            if q["sql"].startswith('UPDATE "quotes_quote"')
+        ]
+        self.assertEqual(len(quote_updates), 1)
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        self.assertEqual(self.first.likes, 13)
+        self.assertEqual(self.second.dislikes, 1)
+        self.assertEqual(QuoteEngagement.objects.get(quote=self.first).likes, 3)
+
+        # Все голоса записаны: журнал начинается заново с продолжением номеров.
+        self.assertEqual(self.journal.pending(), 0)
+        self.assertEqual(self.journal_files(), [])
+        self.assertEqual(self.journal.record(self.first.id, "likes")["likes"], 14)
+        self.assertEqual(self.journal.drain(), 1)
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.likes, 14)
+
+    def test_replay_is_idempotent(self):
+        path = os.path.join(self.tmp.name, "votes-dead.log")
+        with open(path, "w", encoding="utf-8") as journal:
+            journal.write(
+                f"1 {self.first.id} likes\n"
+                f"2 {self.first.id} likes\n"
+                f"3 {self.second.id} dislikes\n"
+                f"4 {self.first.id} lik"
+            )
+        VoteCheckpoint.objects.create(writer="dead", last_seq=1)
+        self.assertEqual(self.journal.drain(), 2)
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        self.assertEqual((self.first.likes, self.second.dislikes), (11, 1))
+        # Брошенный журнал перенесен и удален вместе с позицией.
+        self.assertEqual(self.journal_files(), [])
+        self.assertFalse(VoteCheckpoint.objects.exists())
+
+        entries = [(1, self.first.id, "likes"), (2, self.first.id, "likes")]
+        self.assertEqual(apply_votes("live", entries)["likes"][self.first.id], 2)
+        self.assertEqual(apply_votes("live", entries)["likes"], Counter())
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.likes, 13)
+
+    def test_live_journal_is_kept(self):
+        self.journal.record(self.first.id, "likes")
+        other = VoteJournal(directory=self.tmp.name)
+        self.assertEqual(other.drain(), 1)
+        self.assertEqual(len(self.journal_files()), 1)
+        self.assertEqual(other.drain(), 0)
+
+        # Процесс узнает о записи своих голосов из позиции журнала.
+        self.journal.drain()
+        self.assertEqual(self.journal.pending(), 0)
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.likes, 11)
+
+    @override_settings(QUOTES_COUNTER_MODE="sharded", QUOTES_COUNTER_SHARDS=4)
+    def test_drain_in_sharded_mode(self):
+        self.journal.record(self.first.id, "likes")
+        self.journal.record(self.first.id, "likes")
+        self.journal.drain()
+        self.assertEqual(
+            sum(QuoteCounterShard.objects.values_list("likes", flat=True)), 2
+        )
+        self.assertEqual(Quote.objects.with_counters().get(pk=self.first.pk).likes, 12)
+
+    def test_views_in_journal_mode(self):
+        with override_settings(
+            QUOTES_VOTE_MODE="journal", QUOTES_VOTE_JOURNAL_DIR=self.tmp.name
+        ):
+            response = self.client.post(
+                reverse("quotes:like_quote", args=[self.first.id])
+            )
+            self.assertEqual(response.json(), {"likes": 11, "dislikes": 1})
+            response = self.client.post(reverse("quotes:dislike_quote", args=[9999]))
+            self.assertEqual(response.status_code, 404)
+            self.first.refresh_from_db()
+            self.assertEqual(self.first.likes, 10)
+
+            out = StringIO()
+            call_command("drain_votes", stdout=out)
+            self.assertIn("Записано голосов: 1", out.getvalue())
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.likes, 11)
+        self.assertEqual(get_snapshot().top_by_likes[0], [self.first.id, 11])
+
+    async def test_async_vote_in_journal_mode(self):
+        with override_settings(
+            QUOTES_VOTE_MODE="journal", QUOTES_VOTE_JOURNAL_DIR=self.tmp.name
+        ):
+            request = AsyncRequestFactory().post("/")
+            response = await async_views.like_quote(request, self.second.id)
+        self.assertEqual(json.loads(response.content), {"likes": 1, "dislikes": 0})
+
+
+class LiveHubTest(SimpleTestCase):
+    async def test_subscribers_share_reads(self):
+        hub = LiveHub(max_rate=50, poll_interval=0.2)
+        state = {"loads": 0, "value": 1}
+
+        async def load():
+            state["loads"] += 1
+            return {"likes": state["value"]}
+
+        subscriptions = await asyncio.gather(
+            *(hub.subscribe("topic", load) for _ in range(100))
+        )
+        self.assertEqual(state["loads"], 1)
+        self.assertEqual({payload["likes"] for _, payload in subscriptions}, {1})
+
+        # Поток голосов сливается в чтения не чаще max_rate в секунду,
+        # подписчики видят последнее значение.
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        for value in range(2, 52):
+            state["value"] = value
+            hub.notify("topic")
+            await asyncio.sleep(0.001)
+        await asyncio.sleep(0.1)
+        elapsed = loop.time() - started
+        self.assertLessEqual(state["loads"], 2 + elapsed * hub.max_rate)
+        self.assertLess(state["loads"], 50)
+        for queue, _ in subscriptions:
+            self.assertEqual(queue.get_nowait(), {"likes": 51})
+
+        for queue, _ in subscriptions:
+            hub.unsubscribe("topic", queue)
+        await asyncio.sleep(0.3)
+        self.assertEqual(hub._topics, {})
+
+    async def test_failed_read_is_logged(self):
+        hub = LiveHub(max_rate=50, poll_interval=0.05)
+        state = {"fail": False}
+
+        async def load():
+            if state["fail"]:
+                raise DatabaseError("сбой")
+            return {"likes": 1}
+
+        with self.assertLogs("quotes.live", "ERROR") as logs:
+            queue, payload = await hub.subscribe("topic", load)
+            state["fail"] = True
+            hub.notify("topic")
+            await asyncio.sleep(0.1)
+        hub.unsubscribe("topic", queue)
+        self.assertIn("topic", logs.output[0])
+        # Подписчик остается на прошлом значении.
+        self.assertEqual(payload, {"likes": 1})
+        self.assertTrue(queue.empty())
+        await asyncio.sleep(0.2)
+        self.assertEqual(hub._topics, {})
+
+    async def test_missing_value_closes_stream(self):
+        hub = LiveHub(max_rate=50, poll_interval=0.05)
+        state = {"value": {"likes": 1}}
+
+        async def load():
+            return state["value"]
+
+        response = await hub.stream("topic", load)
+        events = response.streaming_content
+        self.assertIn(b'"likes": 1', await anext(events))
+        state["value"] = None
+        hub.notify("topic")
+        chunks = [chunk async for chunk in events]
+        self.assertTrue(all(chunk == b": ping\n\n" for chunk in chunks))
+        self.assertEqual(hub.subscribers("topic"), 0)
+        await asyncio.sleep(0.2)
+        self.assertEqual(hub._topics, {})
+
+
+@override_settings(
+    QUOTES_LIVE_UPDATES=True,
+    QUOTES_LIVE_MAX_RATE=50,
+    QUOTES_LIVE_POLL_INTERVAL=0.1,
+    QUOTES_LIVE_STREAM_TIMEOUT=1,
+    QUOTES_VOTE_RATE=0,
+    QUOTES_VOTE_DEDUP_WINDOW=0,
+)
+class LiveUpdatesTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.source = Source.objects.create(name="Живой источник")
+        self.quote = Quote.objects.create(
+            text="Живая цитата", source=self.source, likes=3
+        )
+        self.factory = AsyncRequestFactory()
+
+    async def next_event(self, events):
+        async for chunk in events:
+            if b"event: counts" in chunk:
+                return json.loads(chunk.split(b"data: ", 1)[1])
+
+    async def test_quote_stream(self):
+        response = await async_views.live_quote_view(
+            self.factory.get("/"), self.quote.id
+        )
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        events = response.streaming_content
+        self.assertEqual(await self.next_event(events), {"likes": 3, "dislikes": 0})
+
+        await Quote.objects.filter(pk=self.quote.pk).aincrement(dislikes=1)
+        live_hub.notify_quotes([self.quote.id])
+        self.assertEqual(await self.next_event(events), {"likes": 3, "dislikes": 1})
+        # По QUOTES_LIVE_STREAM_TIMEOUT поток закрывается и отписывается.
+        self.assertEqual([chunk async for chunk in events][-1], b": ping\n\n")
+        self.assertEqual(live_hub.subscribers(quote_topic(self.quote.id)), 0)
+        await asyncio.sleep(0.3)
+
+    async def test_stats_stream(self):
+        response = await async_views.live_stats_view(self.factory.get("/"))
+        events = response.streaming_content
+        stats = await self.next_event(events)
+        self.assertEqual(stats["total_quotes"], await Quote.objects.acount())
+        [chunk async for chunk in events]
+        await asyncio.sleep(0.3)
+
+    async def test_unavailable_streams(self):
+        with self.assertRaises(Http404):
+            await async_views.live_quote_view(self.factory.get("/"), 9999)
+        with override_settings(QUOTES_LIVE_UPDATES=False):
+            with self.assertRaises(Http404):
+                await async_views.live_stats_view(self.factory.get("/"))
+        await asyncio.sleep(0.3)
+
+    def test_votes_notify_hub(self):
+        with mock.patch.object(live_hub, "notify_quotes") as notify:
+            self.client.post(reverse("quotes:like_quote", args=[self.quote.id]))
+        notify.assert_called_once_with([self.quote.id])
+
+    def test_pages_link_streams(self):
+        response = self.client.get(reverse("quotes:dashboard"))
+        self.assertContains(response, f'data-live-url="{reverse("quotes:live_stats")}"')
+        response = self.client.get(
+            reverse("quotes:random_source_quote", args=[self.source.id])
+        )
+        url = reverse("quotes:live_quote", args=[self.quote.id])
+        self.assertContains(response, f'data-live-url="{url}"')
+
+
+class PrerenderTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        Quote.objects.all().delete()
+        self.source = Source.objects.create(name="Статичный источник")
+        self.quotes = [
+            Quote.objects.create(text=f"Статичная цитата {i}", source=self.source)
+            for i in range(3)
+        ]
+        rebuild_snapshot()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.output = tmp.name
+
+    def prerender(self, *args):
+        out = StringIO()
+        call_command("prerender", "--output", self.output, *args, stdout=out)
+        return out.getvalue()
+
+    def read(self, relative_path):
+        with open(os.path.join(self.output, relative_path), "rb") as f:
+            html = f.read()
+        with gzip.open(os.path.join(self.output, f"{relative_path}.gz")) as f:
+            self.assertEqual(f.read(), html)
+        return html.decode()
+
+    def test_renders_dashboard_and_quote_pages(self):
+        self.assertIn("Перерисовано страниц: 4, без изменений: 0", self.prerender())
+        self.assertIn("Статичная цитата 0", self.read("dashboard/index.html"))
+        for quote in self.quotes:
+            html = self.read(f"quote/{quote.id}/index.html")
+            self.assertIn(quote.text, html)
+        self.assertIn("Перерисовано страниц: 0, без изменений: 4", self.prerender())
+
+    def test_pagination_links_point_to_static_files(self):
+        Quote.objects.update(likes=1)
+        rebuild_snapshot()
+        with (
+            mock.patch("quotes.views.DASHBOARD_PAGE_SIZE", 1),
+            mock.patch("quotes.prerender.DASHBOARD_PAGE_SIZE", 1),
+        ):
+            self.prerender()
+        index = self.read("dashboard/index.html")
+        self.assertIn('href="page_likes-2.html"', index)
+        self.assertNotIn("?page_likes=", index)
+        second = self.read("dashboard/page_likes-2.html")
+        self.assertIn('href="index.html"', second)
+        self.assertIn('href="page_likes-3.html"', second)
+
+        with (
+            override_settings(QUOTES_DASHBOARD_PAGINATION="keyset"),
+            mock.patch("quotes.views.DASHBOARD_PAGE_SIZE", 1),
+        ):
+            self.prerender("--force")
+        index = self.read("dashboard/index.html")
+        self.assertIn(f'href="{reverse("quotes:dashboard")}?page_likes=a', index)
+
+    def test_rerenders_only_changed_pages(self):
+        self.prerender()
+        changed = self.quotes[1]
+        Quote.objects.filter(pk=changed.pk).update(likes=7)
+        untouched = os.path.join(self.output, f"quote/{self.quotes[0].id}/index.html")
+        mtime = os.stat(untouched).st_mtime_ns
+        # Лайки цитаты видны и на ее странице, и в топе дашборда.
+        self.assertIn("Перерисовано страниц: 2, без изменений: 2", self.prerender())
+        self.assertEqual(os.stat(untouched).st_mtime_ns, mtime)
+
+        removed = self.quotes[2]
+        removed.delete()
+        self.assertIn("удалено: 1", self.prerender())
+        page = os.path.join(self.output, f"quote/{removed.id}/index.html")
+        self.assertFalse(os.path.exists(page))
+        self.assertFalse(os.path.exists(f"{page}.gz"))
+        self.assertIn(
+            "Перерисовано страниц: 3, без изменений: 0", self.prerender("--force")
+        )
@@ -0,0 +1,279 @@
+"""
+Защита голосований от накруток на сервере.
+
+``VoteGuard`` перед голосом проверяет два ограничения:
+
+* token bucket на клиента - не больше QUOTES_VOTE_BURST голосов подряд
+  и QUOTES_VOTE_RATE голосов в секунду в среднем;
+* дедупликацию по паре (клиент, цитата) - один голос за цитату в
+  течение QUOTES_VOTE_DEDUP_WINDOW секунд.
+
+Оба ограничения ведутся на клиента: вошедшего пользователя или IP-адрес
+(за прокси - из доверенного заголовка QUOTES_CLIENT_IP_HEADER). Cookie
+для этого не годятся: их выбирает сам клиент, и бот со свежей cookie на
+каждый голос обходил бы дедупликацию. Поэтому анонимные пользователи за
+одним NAT делят один голос за цитату. Голос отмечается для дедупликации
+только после того, как он принят (``VoteGuard.record``): несуществующая
+цитата или ошибка записи не расходуют голос. Два одновременных голоса
+одного клиента за одну цитату могут пройти оба.
+
+По умолчанию (QUOTES_VOTE_GUARD_BACKEND = "memory") оба ограничения
+живут в памяти воркера в структурах фиксированного размера: LRU корзин и
+пара чередующихся фильтров Блума. С "cache" состояние общее для всех
+процессов и хранится в кэше Django.
+"""
+
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+
+MAX_CLIENTS = 10000
+DEDUP_ERROR_RATE = 0.001
+CACHE_PREFIX = "quotes:vote"
+
+
+def _digest(key):
+    return hashlib.blake2b(key.encode(), digest_size=16).digest()
+
+
+def _user_id(request):
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        return f"user:{user.pk}"
+    return None
+
+
+def client_ip(request):
+    """
+    IP-адрес клиента. За прокси берется последний адрес из
+    QUOTES_CLIENT_IP_HEADER (например, ``HTTP_X_FORWARDED_FOR``) - его
+    дописал сам доверенный прокси; предыдущие клиент мог подставить.
+    """
+    header = settings.QUOTES_CLIENT_IP_HEADER
+    if header:
+        forwarded = request.META.get(header, "").rsplit(",", 1)[-1].strip()
+        if forwarded:
+            return forwarded
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def client_id(request):
+    """
+    Клиент для ограничения частоты и дедупликации - пользователь, если он
+    вошел, иначе IP.
+    """
+    return _user_id(request) or f"ip:{client_ip(request)}"
+
+
+class RotatingBloomFilter:
+    """
+    Множество недавних ключей фиксированного размера: текущий и предыдущий
+    фильтры Блума, которые меняются местами каждые ``window`` секунд.
+
+    Ключ помнится от ``window`` до ``2 * window`` секунд. Пока за окно
+    добавляется не больше ``capacity`` ключей, новый ключ ошибочно
+    считается виденным с вероятностью не выше ``error_rate``.
+    """
+
+    def __init__(self, capacity, window, error_rate=DEDUP_ERROR_RATE, clock=None):
+        self.num_bits = max(
+            8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        )
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.window = window
+        self._clock = clock or time.monotonic
+        self._lock = threading.Lock()
+        self._current = bytearray((self.num_bits + 7) // 8)
+        self._previous = bytearray(len(self._current))
+        self._rotated_at = self._clock()
+
+    def _positions(self, key):
+        digest = _digest(key)
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    @staticmethod
+    def _contains(bits, positions):
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in positions)
+
+    def _rotate(self):
+        now = self._clock()
+        elapsed = now - self._rotated_at
+        if elapsed < self.window:
+            return
+        if elapsed < 2 * self.window:
+            self._previous = self._current
+        else:
+            self._previous = bytearray(len(self._current))
+        self._current = bytearray(len(self._current))
+        self._rotated_at = now
+
+    def __contains__(self, key):
+        positions = self._positions(key)
+        with self._lock:
+            self._rotate()
+            return self._contains(self._current, positions) or self._contains(
+                self._previous, positions
+            )
+
+    def add(self, key):
+        """Запоминает ключ; False, если он уже встречался за окно."""
+        positions = self._positions(key)
+        with self._lock:
+            self._rotate()
+            if self._contains(self._current, positions) or self._contains(
+                self._previous, positions
+            ):
+                return False
+            for p in positions:
+                self._current[p >> 3] |= 1 << (p & 7)
+            return True
+
+
+class TokenBucketLimiter:
+    """
+    Token bucket на клиента в памяти процесса. Корзины хранятся в LRU на
+    ``max_clients`` клиентов; вытесненный клиент начинает с полной корзины.
+    """
+
+    def __init__(self, rate, burst, max_clients=MAX_CLIENTS, clock=None):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._clock = clock or time.monotonic
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+
+    def _take(self, state, now):
+        tokens, updated = state if state else (self.burst, now)
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        if tokens >= 1:
+            return (tokens - 1, now), 0
+        return (tokens, now), (1 - tokens) / self.rate
+
+    def consume(self, client):
+        """Берет токен: 0, если голос разрешен, иначе сколько секунд ждать."""
+        with self._lock:
+            state, wait = self._take(self._buckets.pop(client, None), self._clock())
+            self._buckets[client] = state
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+class CacheDeduplicator:
+    """Дедупликация через ``cache.add``: ключ живет ровно ``window`` секунд."""
+
+    def __init__(self, alias, window):
+        self.alias = alias
+        self.window = window
+
+    @staticmethod
+    def _key(key):
+        return f"{CACHE_PREFIX}:seen:{_digest(key).hex()}"
+
+    def __contains__(self, key):
+        return caches[self.alias].has_key(self._key(key))
+
+    def add(self, key):
+        return caches[self.alias].add(self._key(key), 1, timeout=self.window)
+
+
+class CacheTokenBucketLimiter(TokenBucketLimiter):
+    """
+    Token bucket с корзинами в кэше Django. Чтение и запись корзины не
+    атомарны, поэтому при одновременных голосах одного клиента в разных
+    процессах лимит может быть превышен на число таких процессов.
+    """
+
+    def __init__(self, alias, rate, burst):
+        super().__init__(rate, burst, clock=time.time)
+        self.alias = alias
+
+    def consume(self, client):
+        cache = caches[self.alias]
+        key = f"{CACHE_PREFIX}:bucket:{_digest(client).hex()}"
+        state, wait = self._take(cache.get(key), self._clock())
+        cache.set(key, state, timeout=math.ceil(self.burst / self.rate) + 1)
+        return wait
+
+
+class VoteGuard:
+    def __init__(self, alias="default"):
+        self.alias = alias
+        self._lock = threading.Lock()
+        self._config = None
+        self._limiter = None
+        self._deduplicator = None
+
+    def _backends(self):
+        """Ограничители по текущим настройкам; пересоздаются при их изменении."""
+        config = (
+            settings.QUOTES_VOTE_GUARD_BACKEND,
+            settings.QUOTES_VOTE_RATE,
+            settings.QUOTES_VOTE_BURST,
+            settings.QUOTES_VOTE_DEDUP_WINDOW,
+            settings.QUOTES_VOTE_DEDUP_CAPACITY,
+        )
+        with self._lock:
+            if config != self._config:
+                backend, rate, burst, window, capacity = config
+                shared = backend == "cache"
+                self._limiter = None
+                if rate > 0 and burst > 0:
+                    self._limiter = (
+                        CacheTokenBucketLimiter(self.alias, rate, burst)
+                        if shared
+                        else TokenBucketLimiter(rate, burst)
+                    )
+                self._deduplicator = None
+                if window > 0:
+                    self._deduplicator = (
+                        CacheDeduplicator(self.alias, window)
+                        if shared
+                        else RotatingBloomFilter(capacity, window)
+                    )
+                self._config = config
+            return self._limiter, self._deduplicator
+
+    def check(self, request, quote_id):
+        """
+        None, если голос можно принять, иначе ответ с ошибкой. Принятый
+        голос нужно отметить через ``record``.
+        """
+        client = client_id(request)
+        limiter, deduplicator = self._backends()
+        if limiter is not None:
+            wait = limiter.consume(client)
+            if wait:
+                response = JsonResponse(
+                    {"detail": "Слишком много голосов, попробуйте позже."}, status=429
+                )
+                response["Retry-After"] = str(math.ceil(wait))
+                return response
+        if deduplicator is not None and f"{client}:{quote_id}" in deduplicator:
+            return JsonResponse(
+                {"detail": "Вы уже голосовали за эту цитату."}, status=409
+            )
+        return None
+
+    def record(self, request, quote_id):
+        """Отмечает принятый голос для дедупликации."""
+        _, deduplicator = self._backends()
+        if deduplicator is not None:
+            deduplicator.add(f"{client_id(request)}:{quote_id}")
+
+    def reset(self):
+        """Сбрасывает состояние ограничителей в памяти (для тестов)."""
+        with self._lock:
+            self._config = None
+
+
+vote_guard = VoteGuard()
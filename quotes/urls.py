@@ -1,11 +1,60 @@
+from django.conf import settings
 from django.urls import path
-from .views import random_quote_view, like_quote, dislike_quote, dashboard_view
+from . import api, async_views, views
 
 app_name = "quotes"
 
+# Под ASGI можно включить нативные async-версии view (QUOTES_VIEWS_MODE=async).
+quote_views = async_views if settings.QUOTES_VIEWS_MODE == "async" else views
+
 urlpatterns = [
-    path("", random_quote_view, name="random_quote"),
-    path("dashboard/", dashboard_view, name="dashboard"),
-    path("quote/<int:quote_id>/like/", like_quote, name="like_quote"),
-    path("quote/<int:quote_id>/dislike/", dislike_quote, name="dislike_quote"),
+    path("", quote_views.random_quote_view, name="random_quote"),
+    path(
+        "source/<int:source_id>/random/",
+        quote_views.random_quote_view,
+        name="random_source_quote",
+    ),
+    path(
+        "kind/<slug:kind>/random/",
+        quote_views.random_quote_view,
+        name="random_kind_quote",
+    ),
+    path("dashboard/", quote_views.dashboard_view, name="dashboard"),
+    path("quote/<int:quote_id>/like/", quote_views.like_quote, name="like_quote"),
+    path(
+        "quote/<int:quote_id>/dislike/",
+        quote_views.dislike_quote,
+        name="dislike_quote",
+    ),
+    path("search/", views.search_view, name="search"),
+    # SSE-потоки работают только под ASGI (см. QUOTES_LIVE_UPDATES).
+    path(
+        "live/quote/<int:quote_id>/",
+        async_views.live_quote_view,
+        name="live_quote",
+    ),
+    path("live/stats/", async_views.live_stats_view, name="live_stats"),
+    path("cache/stats/", views.cache_stats_view, name="cache_stats"),
+    path("export/", views.export_quotes_view, name="export_quotes"),
+    path("metrics/", views.metrics_view, name="metrics"),
+    path("api/quotes/random/", api.random_quote_api, name="api_random_quote"),
+    path(
+        "api/sources/<int:source_id>/quotes/random/",
+        api.random_quote_api,
+        name="api_random_source_quote",
+    ),
+    path(
+        "api/kinds/<slug:kind>/quotes/random/",
+        api.random_quote_api,
+        name="api_random_kind_quote",
+    ),
+    path(
+        "api/quotes/random/batch/",
+        api.random_quotes_batch_api,
+        name="api_random_quotes_batch",
+    ),
+    path("api/quotes/<int:quote_id>/", api.quote_detail_api, name="api_quote"),
+    path("api/top/<str:field>/", api.top_quotes_api, name="api_top"),
+    path("api/search/", api.search_api, name="api_search"),
+    path("api/stats/", api.stats_api, name="api_stats"),
 ]
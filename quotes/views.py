@@ -1,43 +1,132 @@
+import hashlib
+
 from django.shortcuts import render
-import random
-from django.db.models import F, Count, Sum
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
 from .models import Quote, Source
-from django.http import JsonResponse, Http404
-from django.views.decorators.http import require_POST
+from .cache import fragment_cache, invalidate_quote_cards, quote_card_key
+from .counters import view_counter
+from .engagement import engagement_buffer, trending
+from .live import live_hub
+from .metrics import request_metrics
+from .exporting import (
+    CONTENT_TYPES,
+    FORMATS,
+    export_rows,
+    iter_export,
+    iter_gzip,
+    parse_since,
+)
+from .pagination import KeysetPaginator
+from .sampling import quote_sampler, request_seed
+from .search import search_quotes, search_term
+from .snapshot import get_snapshot
+from .throttling import vote_guard
+from .votes import vote_journal, votes_journaled
+from django.http import (
+    HttpResponse,
+    HttpResponseBadRequest,
+    JsonResponse,
+    Http404,
+    StreamingHttpResponse,
+)
+from django.utils.cache import patch_cache_control
+from django.utils.http import urlencode
+from django.views.decorators.http import require_POST, require_safe
 from django.views.decorators.csrf import ensure_csrf_cookie
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 
+RANDOM_QUOTE_ATTEMPTS = 3
+SOURCE_KINDS = dict(Source.KIND_CHOICES)
+
+
+def _render_quote_card(quote_id):
+    """Рендерит карточку цитаты для кэша; None, если цитаты уже нет."""
+    quote = (
+        Quote.objects.select_related("source")
+        .with_counters()
+        .filter(pk=quote_id)
+        .first()
+    )
+    if quote is None:
+        return None
+    html = render_to_string("quotes/includes/quote_card.html", {"quote": quote})
+    return {"quote": quote, "html": html}
+
 
 @ensure_csrf_cookie
-def random_quote_view(request):
+def random_quote_view(request, source_id=None, kind=None):
     """
-    View для отображения случайной цитаты с учетом веса.
-    """
-    quotes_with_weights = list(Quote.objects.values_list("id", "weight"))
-
-    if not quotes_with_weights:
-        return render(request, "quotes/random_quote.html", {"quote": None})
+    View для отображения случайной цитаты с учетом веса, в том числе из
+    одного источника (``source_id``) или источников одного типа (``kind``).
 
-    quote_ids, weights = zip(*quotes_with_weights)
-    random_quote_id = random.choices(quote_ids, weights=weights, k=1)[0]
-    Quote.objects.filter(pk=random_quote_id).update(views=F("views") + 1)
-    quote = Quote.objects.get(pk=random_quote_id)
+    Карточка цитаты кэшируется по id, поэтому при попадании в кэш
+    страница не обращается к БД. Страница с зерном (``request_seed``)
+    детерминирована и кэшируется браузером (``private``).
+    """
+    if kind is not None and kind not in SOURCE_KINDS:
+        raise Http404("Unknown source kind")
+    seed, max_age = request_seed(request)
+    card = views = None
+    for _ in range(RANDOM_QUOTE_ATTEMPTS):
+        random_quote_id = quote_sampler.draw(source=source_id, kind=kind, seed=seed)
+        if random_quote_id is None:
+            break
+        card = fragment_cache.get_or_set(
+            quote_card_key(random_quote_id),
+            lambda quote_id=random_quote_id: _render_quote_card(quote_id),
+            settings.QUOTES_CARD_CACHE_TTL,
+        )
+        if card is not None:
+            # Счетчик просмотров не кэшируется вместе с карточкой: к числу
+            # из БД добавляются еще не записанные просмотры и текущий.
+            views = card["quote"].views + view_counter.pending(random_quote_id) + 1
+            view_counter.record(random_quote_id)
+            break
+        # Цитату удалили в другом процессе - перечитываем таблицу весов.
+        quote_sampler.invalidate()
 
     context = {
-        "quote": quote,
+        "quote": card["quote"] if card else None,
+        "quote_card": mark_safe(card["html"]) if card else "",
+        "views": views,
+        "live_updates": settings.QUOTES_LIVE_UPDATES,
+        "filtered": source_id is not None or kind is not None,
     }
-    return render(request, "quotes/random_quote.html", context)
+    response = render(request, "quotes/random_quote.html", context)
+    if seed is not None:
+        # Только кэш браузера: страница ставит CSRF-cookie и несет счетчики.
+        patch_cache_control(response, private=True, max_age=max_age)
+    return response
+
+
+def _journaled_vote(request, quote_id, field):
+    """Голос в режиме write-behind: запись в журнал без обращения к БД."""
+    counts = vote_journal.record(quote_id, field)
+    if counts is None:
+        raise Http404("Quote not found")
+    vote_guard.record(request, quote_id)
+    return JsonResponse(counts)
 
 
 @require_POST
 def like_quote(request, quote_id):
     """Обработка лайка."""
-    updated_quote = Quote.objects.filter(pk=quote_id).update_and_get(
-        likes=F("likes") + 1
-    )
+    rejected = vote_guard.check(request, quote_id)
+    if rejected is not None:
+        return rejected
+    if votes_journaled():
+        return _journaled_vote(request, quote_id, "likes")
+    updated_quote = Quote.objects.filter(pk=quote_id).increment(likes=1)
 
     if updated_quote is None:
         raise Http404("Quote not found")
+    engagement_buffer.record(updated_quote.id, "likes")
+    vote_guard.record(request, quote_id)
+    invalidate_quote_cards([updated_quote.id])
+    live_hub.notify_quotes([updated_quote.id])
 
     return JsonResponse(
         {"likes": updated_quote.likes, "dislikes": updated_quote.dislikes}
@@ -47,65 +136,226 @@ def like_quote(request, quote_id):
 @require_POST
 def dislike_quote(request, quote_id):
     """Обработка дизлайка."""
-    updated_quote = Quote.objects.filter(pk=quote_id).update_and_get(
-        dislikes=F("dislikes") + 1
-    )
+    rejected = vote_guard.check(request, quote_id)
+    if rejected is not None:
+        return rejected
+    if votes_journaled():
+        return _journaled_vote(request, quote_id, "dislikes")
+    updated_quote = Quote.objects.filter(pk=quote_id).increment(dislikes=1)
 
     if updated_quote is None:
         raise Http404("Quote not found")
+    engagement_buffer.record(updated_quote.id, "dislikes")
+    vote_guard.record(request, quote_id)
+    invalidate_quote_cards([updated_quote.id])
+    live_hub.notify_quotes([updated_quote.id])
 
     return JsonResponse(
         {"likes": updated_quote.likes, "dislikes": updated_quote.dislikes}
     )
 
 
-def dashboard_view(request):
+DASHBOARD_PAGE_SIZE = 10
+TRENDING_SIZE = 5
+
+
+def _paginate(entries, page_number):
+    """Пагинация по списку [id, значение] из снимка дашборда."""
+    paginator = Paginator([quote_id for quote_id, _ in entries], DASHBOARD_PAGE_SIZE)
+    try:
+        return paginator.page(page_number)
+    except PageNotAnInteger:
+        return paginator.page(1)
+    except EmptyPage:
+        return paginator.page(paginator.num_pages)
+
+
+def _keyset_paginators():
+    # Курсор строится по колонкам Quote, поэтому шарды здесь не учитываются:
+    # в режиме sharded топы отстают до compact_counters.
+    queryset = Quote.objects.select_related("source")
+    return (
+        KeysetPaginator(queryset.filter(likes__gt=0), "likes", DASHBOARD_PAGE_SIZE),
+        KeysetPaginator(queryset.filter(views__gt=0), "views", DASHBOARD_PAGE_SIZE),
+    )
+
+
+def _snapshot_pages(snapshot, page_likes_num, page_views_num):
     """
-    Отображение дашборда со статистикой и топами цитат с пагинацией.
+    Страницы топов по спискам снимка. Пока в ``object_list`` лежат id,
+    вторым значением возвращаются все id цитат, которые нужно загрузить.
     """
-    kpi_stats = Quote.objects.aggregate(
-        total_quotes=Count("id"), total_likes=Sum("likes"), total_views=Sum("views")
+    pages = (
+        _paginate(snapshot.top_by_likes, page_likes_num),
+        _paginate(snapshot.top_by_views, page_views_num),
     )
-    total_sources = Source.objects.count()
+    quote_ids = {
+        *pages[0].object_list,
+        *pages[1].object_list,
+        *snapshot.most_recent,
+    }
+    return pages, quote_ids
+
+
+def _resolve_pages(pages, quotes):
+    for page in pages:
+        page.object_list = [quotes[i] for i in page.object_list if i in quotes]
+
 
-    top_by_likes_list = (
-        Quote.objects.select_related("source").filter(likes__gt=0).order_by("-likes")
+def _build_dashboard_context(
+    snapshot, top_by_likes_page, top_by_views_page, quotes, trending_scores
+):
+    most_recent = [quotes[i] for i in snapshot.most_recent if i in quotes]
+    trending_quotes = []
+    for quote_id, score in trending_scores:
+        if quote_id in quotes:
+            quotes[quote_id].trend_score = score
+            trending_quotes.append(quotes[quote_id])
+    return {
+        "total_quotes": snapshot.total_quotes,
+        "total_likes": snapshot.total_likes,
+        "total_views": snapshot.total_views,
+        "total_sources": snapshot.total_sources,
+        "top_by_likes_page": top_by_likes_page,
+        "top_by_views_page": top_by_views_page,
+        "most_recent": most_recent,
+        "trending": trending_quotes,
+        "live_updates": settings.QUOTES_LIVE_UPDATES,
+    }
+
+
+def _dashboard_context(page_likes_num, page_views_num):
+    """
+    Контекст дашборда.
+
+    Все данные берутся из предрассчитанного снимка и индекса очков тренда,
+    поэтому страница стоит три запроса независимо от числа цитат: снимок,
+    топ тренда и цитаты текущих страниц.
+    В режиме QUOTES_DASHBOARD_PAGINATION = "keyset" топы читаются из БД
+    постранично по курсору, без ограничения размером снимка.
+    """
+    snapshot = get_snapshot()
+    trending_scores = trending(TRENDING_SIZE)
+    trending_ids = [quote_id for quote_id, _ in trending_scores]
+
+    if settings.QUOTES_DASHBOARD_PAGINATION == "keyset":
+        likes_paginator, views_paginator = _keyset_paginators()
+        pages = (
+            likes_paginator.page(page_likes_num),
+            views_paginator.page(page_views_num),
+        )
+        quotes = (
+            Quote.objects.select_related("source")
+            .with_counters()
+            .in_bulk([*snapshot.most_recent, *trending_ids])
+        )
+    else:
+        pages, quote_ids = _snapshot_pages(snapshot, page_likes_num, page_views_num)
+        quotes = (
+            Quote.objects.select_related("source")
+            .with_counters()
+            .in_bulk([*quote_ids, *trending_ids])
+        )
+        _resolve_pages(pages, quotes)
+
+    return _build_dashboard_context(snapshot, *pages, quotes, trending_scores)
+
+
+def dashboard_cache_key(request):
+    """Ключ кэша страницы дашборда для пары номеров страниц топов."""
+    pages_digest = hashlib.md5(
+        "{}|{}".format(
+            request.GET.get("page_likes"), request.GET.get("page_views")
+        ).encode(),
+        usedforsecurity=False,
+    ).hexdigest()
+    return fragment_cache.make_key(
+        "dashboard", settings.QUOTES_DASHBOARD_PAGINATION, pages_digest
     )
 
-    top_by_views_list = (
-        Quote.objects.select_related("source").filter(views__gt=0).order_by("-views")
+
+def dashboard_view(request):
+    """
+    Отображение дашборда со статистикой и топами цитат с пагинацией.
+
+    Готовая страница кэшируется для каждой пары номеров страниц топов
+    на QUOTES_DASHBOARD_CACHE_TTL секунд.
+    """
+    content = fragment_cache.get_or_set(
+        dashboard_cache_key(request),
+        lambda: render_to_string(
+            "quotes/dashboard.html",
+            _dashboard_context(
+                request.GET.get("page_likes"), request.GET.get("page_views")
+            ),
+            request=request,
+        ),
+        settings.QUOTES_DASHBOARD_CACHE_TTL,
     )
+    return HttpResponse(content)
 
-    most_recent = Quote.objects.select_related("source").order_by("-created_at")[:5]
 
-    paginator_likes = Paginator(top_by_likes_list, 10)
-    paginator_views = Paginator(top_by_views_list, 10)
+SEARCH_PAGE_SIZE = 20
 
-    page_likes_num = request.GET.get("page_likes")
-    page_views_num = request.GET.get("page_views")
 
-    try:
-        top_by_likes_page = paginator_likes.page(page_likes_num)
-    except PageNotAnInteger:
-        top_by_likes_page = paginator_likes.page(1)
-    except EmptyPage:
-        top_by_likes_page = paginator_likes.page(paginator_likes.num_pages)
+@require_safe
+def search_view(request):
+    """Поиск цитат по тексту и источнику с ранжированием и пагинацией."""
+    query = search_term(request)
+    page = None
+    if query:
+        paginator = Paginator(search_quotes(query), SEARCH_PAGE_SIZE)
+        page = paginator.get_page(request.GET.get("page"))
+    context = {"query": query, "page": page, "extra_query": urlencode({"q": query})}
+    return render(request, "quotes/search.html", context)
+
+
+@staff_member_required
+def cache_stats_view(request):
+    """Счетчики попаданий и промахов кэша для подбора его размера."""
+    return JsonResponse(fragment_cache.stats())
 
+
+@staff_member_required
+@require_safe
+def export_quotes_view(request):
+    """
+    Потоковая выгрузка цитат со счетчиками (?format=csv&gzip=1).
+    Параметры since и since_id выгружают только цитаты после курсора.
+    """
+    fmt = request.GET.get("format", "jsonl")
+    if fmt not in FORMATS:
+        return HttpResponseBadRequest("Неизвестный формат.")
+    since = since_id = None
     try:
-        top_by_views_page = paginator_views.page(page_views_num)
-    except PageNotAnInteger:
-        top_by_views_page = paginator_views.page(1)
-    except EmptyPage:
-        top_by_views_page = paginator_views.page(paginator_views.num_pages)
+        if request.GET.get("since"):
+            since = parse_since(request.GET["since"])
+        if request.GET.get("since_id"):
+            since_id = int(request.GET["since_id"])
+    except ValueError:
+        return HttpResponseBadRequest("Неверный курсор выгрузки.")
+    if since_id is not None and since is None:
+        return HttpResponseBadRequest("since_id задается вместе с since.")
 
-    context = {
-        "total_quotes": kpi_stats.get("total_quotes", 0),
-        "total_likes": kpi_stats.get("total_likes", 0) or 0,
-        "total_views": kpi_stats.get("total_views", 0) or 0,
-        "total_sources": total_sources,
-        "top_by_likes_page": top_by_likes_page,
-        "top_by_views_page": top_by_views_page,
-        "most_recent": most_recent,
-    }
+    chunks = iter_export(fmt, export_rows(since, since_id))
+    filename = f"quotes.{fmt}"
+    if request.GET.get("gzip") in ("1", "true", "yes"):
+        response = StreamingHttpResponse(
+            iter_gzip(chunks), content_type="application/gzip"
+        )
+        filename += ".gz"
+    else:
+        response = StreamingHttpResponse(
+            chunks, content_type=f"{CONTENT_TYPES[fmt]}; charset=utf-8"
+        )
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
 
-    return render(request, "quotes/dashboard.html", context)
+
+@staff_member_required
+def metrics_view(request):
+    """Метрики запросов по view в текстовом формате Prometheus."""
+    return HttpResponse(
+        request_metrics.render_prometheus(),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
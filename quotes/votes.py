@@ -0,0 +1,342 @@
+"""
+Отложенная запись голосов (write-behind), QUOTES_VOTE_MODE = "journal".
+
+Голос не пишется в БД в запросе: он дописывается строкой
+"<номер> <id цитаты> <поле>" в журнал процесса, и ответ сразу содержит
+ожидаемые счетчики - значения из БД плюс еще не записанные голоса этого
+процесса. Фоновый поток (раз в QUOTES_VOTE_FLUSH_INTERVAL секунд) или
+команда ``drain_votes`` переносят журналы в БД пачками: голоса пачки
+складываются одним UPDATE ... CASE, и в той же транзакции сохраняется
+номер последнего записанного голоса (``VoteCheckpoint``). Поэтому
+повторная обработка журнала - после падения процесса или одновременно из
+другого процесса - не учитывает голос дважды.
+
+Пока процесс жив, его журнал заблокирован flock (``quotes.filelocks``).
+Журналы, которые никто не держит, остались от завершившихся процессов:
+после переноса в БД они удаляются.
+"""
+
+import atexit
+import glob
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import Counter, deque
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models.functions import Now
+
+from .cache import invalidate_quote_cards
+from .counters import _add_counters_sql
+from .engagement import apply_engagement
+from .filelocks import lock_abandoned, open_locked
+from .live import live_hub
+from .models import (
+    COUNTER_FIELDS,
+    Quote,
+    QuoteCounterShard,
+    VoteCheckpoint,
+    counter_expression,
+    counters_sharded,
+)
+from .snapshot import record_likes
+
+logger = logging.getLogger(__name__)
+
+VOTE_FIELDS = ("likes", "dislikes")
+JOURNAL_PREFIX = "votes-"
+JOURNAL_SUFFIX = ".log"
+DRAIN_BATCH_SIZE = 500
+
+
+def votes_journaled():
+    return settings.QUOTES_VOTE_MODE == "journal"
+
+
+def read_journal(path):
+    """
+    Голоса журнала ``[(номер, id цитаты, поле)]``. Строка, оборванная
+    падением процесса посреди записи, пропускается.
+    """
+    entries = []
+    with open(path, encoding="utf-8") as journal:
+        for line in journal:
+            parts = line.split()
+            if (
+                line.endswith("\n")
+                and len(parts) == 3
+                and parts[0].isdigit()
+                and parts[1].isdigit()
+                and parts[2] in VOTE_FIELDS
+            ):
+                entries.append((int(parts[0]), int(parts[1]), parts[2]))
+    return entries
+
+
+def apply_votes(writer, entries):
+    """
+    Записывает в БД голоса журнала ``writer`` с номерами больше
+    сохраненного и сдвигает его позицию в той же транзакции. Возвращает
+    записанные приросты ``{поле: {id цитаты: прирост}}``.
+    """
+    increments = {field: Counter() for field in VOTE_FIELDS}
+    VoteCheckpoint.objects.bulk_create(
+        [VoteCheckpoint(writer=writer)], ignore_conflicts=True
+    )
+    with transaction.atomic():
+        checkpoint = VoteCheckpoint.objects.select_for_update().get(writer=writer)
+        fresh = [entry for entry in entries if entry[0] > checkpoint.last_seq]
+        if not fresh:
+            return increments
+        for _, quote_id, field in fresh:
+            increments[field][quote_id] += 1
+        if counters_sharded():
+            for field, counts in increments.items():
+                if counts:
+                    QuoteCounterShard.objects.add_many(field, counts)
+        else:
+            rows = {}
+            for field, counts in increments.items():
+                for quote_id, count in counts.items():
+                    deltas = rows.setdefault(quote_id, dict.fromkeys(COUNTER_FIELDS, 0))
+                    deltas[field] += count
+            Quote.objects.filter(pk__in=list(rows)).update(
+                updated_at=Now(), **_add_counters_sql(rows)
+            )
+        checkpoint.last_seq = max(seq for seq, _, _ in fresh)
+        checkpoint.save(update_fields=["last_seq"])
+    return increments
+
+
+def _load_counts(quote_ids):
+    """Текущие лайки и дизлайки цитат из БД: ``{id: {поле: значение}}``."""
+    rows = (
+        Quote.objects.filter(pk__in=quote_ids)
+        .annotate(
+            **{f"{field}_total": counter_expression(field) for field in VOTE_FIELDS}
+        )
+        .order_by()
+        .values_list("id", *(f"{field}_total" for field in VOTE_FIELDS))
+    )
+    return {quote_id: dict(zip(VOTE_FIELDS, values)) for quote_id, *values in rows}
+
+
+class VoteJournal:
+    """
+    Журнал голосов процесса и перенос журналов каталога в БД.
+
+    В памяти хранятся еще не записанные голоса этого процесса и счетчики
+    из БД для проголосованных цитат: из них складывается ответ на голос.
+    Счетчики из БД перечитываются после каждого сброса.
+    """
+
+    def __init__(self, directory=None, flush_interval=None):
+        self._directory = directory
+        self._flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._drain_lock = threading.Lock()
+        self._pid = None
+        self._writer = None
+        self._fd = None
+        self._seq = 0
+        self._unapplied = deque()
+        self._pending = Counter()
+        self._base = {}
+        self._worker = None
+
+    @property
+    def directory(self):
+        if self._directory is not None:
+            return self._directory
+        return str(settings.QUOTES_VOTE_JOURNAL_DIR)
+
+    @property
+    def flush_interval(self):
+        if self._flush_interval is not None:
+            return self._flush_interval
+        return settings.QUOTES_VOTE_FLUSH_INTERVAL
+
+    def _path(self, writer):
+        return os.path.join(self.directory, f"{JOURNAL_PREFIX}{writer}{JOURNAL_SUFFIX}")
+
+    def _own_writer(self):
+        return self._writer if self._pid == os.getpid() else None
+
+    def _open(self):
+        """Открывает журнал процесса; после fork у потомка свой журнал."""
+        if self._pid != os.getpid():
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+            self._pid = os.getpid()
+            self._writer = uuid.uuid4().hex
+            self._seq = 0
+            self._unapplied.clear()
+            self._pending.clear()
+            self._base.clear()
+            self._worker = None
+        if self._fd is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        # Пустой журнал могли принять за брошенный и удалить: open_locked
+        # тогда создаст его заново.
+        self._fd = open_locked(
+            self._path(self._writer), os.O_WRONLY | os.O_CREAT | os.O_APPEND
+        )
+
+    def record(self, quote_id, field):
+        """
+        Дописывает голос в журнал и возвращает ожидаемые счетчики цитаты
+        ``{"likes": ..., "dislikes": ...}`` или None, если цитаты нет.
+        """
+        base = self._base.get(quote_id)
+        if base is None:
+            base = _load_counts([quote_id]).get(quote_id)
+            if base is None:
+                return None
+        with self._lock:
+            self._open()
+            self._base.setdefault(quote_id, base)
+            self._seq += 1
+            os.write(self._fd, f"{self._seq} {quote_id} {field}\n".encode())
+            if settings.QUOTES_VOTE_JOURNAL_FSYNC:
+                os.fsync(self._fd)
+            self._unapplied.append((self._seq, quote_id, field))
+            self._pending[quote_id, field] += 1
+            counts = {
+                name: base[name] + self._pending[quote_id, name] for name in VOTE_FIELDS
+            }
+            reconcile = not self.flush_interval and self._seq % DRAIN_BATCH_SIZE == 0
+        if reconcile:
+            # Без фонового потока журнал переносит drain_votes, а процесс
+            # сверяется с БД сам, чтобы голоса не копились в памяти.
+            self._reconcile()
+        else:
+            self._ensure_worker()
+        return counts
+
+    def pending(self):
+        """Число голосов процесса, еще не записанных в БД."""
+        return len(self._unapplied)
+
+    def drain(self):
+        """
+        Переносит в БД голоса из всех журналов каталога, включая журналы
+        завершившихся процессов. Возвращает число записанных голосов.
+        """
+        with self._drain_lock:
+            applied = {field: Counter() for field in VOTE_FIELDS}
+            pattern = f"{JOURNAL_PREFIX}*{JOURNAL_SUFFIX}"
+            paths = glob.glob(os.path.join(glob.escape(self.directory), pattern))
+            for path in sorted(paths):
+                writer = os.path.basename(path)[
+                    len(JOURNAL_PREFIX) : -len(JOURNAL_SUFFIX)
+                ]
+                # Журнал живого процесса переносится, но остается на месте.
+                fd = None if writer == self._own_writer() else lock_abandoned(path)
+                try:
+                    if self._drain_file(path, writer, applied) and fd is not None:
+                        os.remove(path)
+                        VoteCheckpoint.objects.filter(writer=writer).delete()
+                finally:
+                    if fd is not None:
+                        os.close(fd)
+            record_likes(applied["likes"])
+            apply_engagement(applied)
+            quote_ids = list({*applied["likes"], *applied["dislikes"]})
+            invalidate_quote_cards(quote_ids)
+            if quote_ids:
+                live_hub.notify_quotes(quote_ids)
+            self._reconcile()
+            return sum(sum(counts.values()) for counts in applied.values())
+
+    @staticmethod
+    def _drain_file(path, writer, applied):
+        try:
+            entries = read_journal(path)
+        except FileNotFoundError:
+            return False
+        for start in range(0, len(entries), DRAIN_BATCH_SIZE):
+            increments = apply_votes(writer, entries[start : start + DRAIN_BATCH_SIZE])
+            for field, counts in increments.items():
+                applied[field].update(counts)
+        return True
+
+    def _reconcile(self):
+        """
+        Забывает голоса процесса, уже записанные в БД (кем бы то ни было),
+        и перечитывает счетчики цитат с оставшимися голосами.
+        """
+        writer = self._own_writer()
+        if writer is None:
+            return
+        last_seq = (
+            VoteCheckpoint.objects.filter(writer=writer)
+            .values_list("last_seq", flat=True)
+            .first()
+        )
+        with self._lock:
+            while self._unapplied and self._unapplied[0][0] <= (last_seq or 0):
+                _, quote_id, field = self._unapplied.popleft()
+                self._pending[quote_id, field] -= 1
+            self._pending = +self._pending
+            if not self._unapplied and self._fd is not None:
+                # Все голоса записаны: журнал начинается заново, номера
+                # продолжаются, поэтому позиция в БД остается верной.
+                os.remove(self._path(writer))
+                os.close(self._fd)
+                self._fd = None
+            pending_ids = {quote_id for quote_id, _ in self._pending}
+        self._base = _load_counts(list(pending_ids)) if pending_ids else {}
+
+    def clear(self):
+        """
+        Забывает голоса процесса в памяти и закрывает журнал; файл остается
+        на диске и будет перенесен в БД как брошенный.
+        """
+        with self._lock:
+            if self._fd is not None and self._pid == os.getpid():
+                os.close(self._fd)
+            self._fd = None
+            self._pid = None
+            self._unapplied.clear()
+            self._pending.clear()
+            self._base = {}
+
+    def _ensure_worker(self):
+        if not self.flush_interval:
+            return
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(
+                target=self._run_worker, name="vote-journal", daemon=True
+            )
+            self._worker.start()
+
+    def _run_worker(self):
+        while self._worker is threading.current_thread():
+            time.sleep(self.flush_interval)
+            try:
+                self.drain()
+            except Exception:
+                logger.exception("Не удалось перенести журнал голосов в БД")
+            finally:
+                connections.close_all()
+
+
+vote_journal = VoteJournal()
+
+
+@atexit.register
+def _drain_on_exit():
+    if vote_journal._own_writer() and vote_journal.pending():
+        try:
+            vote_journal.drain()
+        except Exception:
+            logger.exception(
+                "Не удалось перенести журнал голосов в БД при завершении процесса"
+            )
@@ -4,6 +4,22 @@ document.addEventListener('DOMContentLoaded', () => {
     const likesCountSpan = document.getElementById('likes-count');
     const dislikesCountSpan = document.getElementById('dislikes-count');
 
+    // Живые счетчики: сервер присылает событие counts при каждом изменении,
+    // значение поля total_likes попадает в элемент #total-likes-count.
+    const liveTarget = document.querySelector('[data-live-url]');
+    if (liveTarget && window.EventSource) {
+        const source = new EventSource(liveTarget.dataset.liveUrl);
+        source.addEventListener('counts', (event) => {
+            const counts = JSON.parse(event.data);
+            for (const [field, value] of Object.entries(counts)) {
+                const element = document.getElementById(`${field.replaceAll('_', '-')}-count`);
+                if (element) {
+                    element.textContent = value;
+                }
+            }
+        });
+    }
+
     if (!likeBtn) return;
 
     let isRequestInProgress = false;